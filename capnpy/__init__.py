@@ -1,7 +1,40 @@
+import os
 import sys
-from capnpy.compiler.compiler import DynamicCompiler
-from capnpy.compiler.distutils import capnpify
 from capnpy.message import load, loads, load_all, dumps, dump
+from capnpy.message_builder import MessageBuilder
 
-_compiler = DynamicCompiler(sys.path)
-load_schema = _compiler.load_schema
+# the compiler is imported only when it is needed: this way, programs which
+# use only pre-generated modules import just the runtime
+_compiler = None
+
+def _get_compiler():
+    global _compiler
+    if _compiler is None:
+        from capnpy.compiler.compiler import DynamicCompiler
+        profile = None
+        if os.environ.get('CAPNPY_PROFILE_LOAD', '0') != '0':
+            import atexit
+            from capnpy.compiler.loadprofile import LoadProfile
+            profile = LoadProfile()
+            atexit.register(profile.dump)
+        _compiler = DynamicCompiler(
+            sys.path,
+            cache_dir=os.environ.get('CAPNPY_CACHE_DIR'),
+            parser=os.environ.get('CAPNPY_PARSER', 'capnp'),
+            lazy=os.environ.get('CAPNPY_LAZY', '0') != '0',
+            profile=profile)
+    return _compiler
+
+def load_schema(*args, **kwargs):
+    """
+    Load a schema using the global DynamicCompiler: see
+    DynamicCompiler.load_schema.
+    """
+    return _get_compiler().load_schema(*args, **kwargs)
+
+def capnpify(*args, **kwargs):
+    """
+    See capnpy.compiler.distutils.capnpify.
+    """
+    from capnpy.compiler.distutils import capnpify
+    return capnpify(*args, **kwargs)
@@ -1,19 +1,22 @@
 """
 Usage: capnpy compile FILE [options]
        capnpy decode FILE SCHEMA CLASS [options]
+       capnpy bundle FILE [options]
 
 Options:
   --no-convert-case    Don't convert camelCase to camel_case
   --no-pyx             Always produce a .py file, even if Cython is available
+  --json               Decode messages as JSON instead of using shortrepr()
+  --parser=PARSER      How to parse the schema: "capnp", "builtin" or "auto"
+                       [default: capnp]
 """
 
 import sys
-import py
 import time
 import docopt
 from capnpy import load_schema
 from capnpy.message import load
-from capnpy.compiler.compiler import StandaloneCompiler
+from capnpy import json
 
 
 def decode(args):
@@ -33,7 +36,10 @@ def decode(args):
                 obj = load(f, cls)
             except ValueError:
                 break
-            print obj.shortrepr()
+            if args['--json']:
+                print json.dumps(obj)
+            else:
+                print obj.shortrepr()
             i += 1
             if i % 10000 == 0:
                 print >> sys.stderr, i
@@ -41,12 +47,17 @@ def decode(args):
     print >> sys.stderr, 'stream decoded in %.2f secs' % (c-b)
 
 def compile(args):
-    srcfile = args['FILE']
-    comp = StandaloneCompiler(sys.path)
+    from capnpy.compiler.compiler import StandaloneCompiler
+    comp = StandaloneCompiler(sys.path, parser=args['--parser'])
     comp.compile(args['FILE'],
                  convert_case=args['--convert-case'],
                  pyx=args['--pyx'])
 
+def bundle(args):
+    from capnpy.compiler.compiler import StandaloneCompiler
+    comp = StandaloneCompiler(sys.path, parser=args['--parser'])
+    comp.write_bundle(args['FILE'])
+
 def main(argv=None):
     args = docopt.docopt(__doc__, argv=argv)
     args['--convert-case'] = not args['--no-convert-case']
@@ -57,6 +68,8 @@ def main(argv=None):
         compile(args)
     elif args['decode']:
         decode(args)
+    elif args['bundle']:
+        bundle(args)
 
 if __name__ == '__main__':
     main()
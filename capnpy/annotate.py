@@ -1,6 +1,6 @@
 # THIS FILE HAS BEEN GENERATED AUTOMATICALLY BY capnpy
 # do not edit by hand
-# generated on 2017-03-29 12:05
+# generated on 2026-10-18 21:42
 
 from capnpy import ptr as _ptr
 from capnpy.struct_ import Struct as _Struct
@@ -24,13 +24,13 @@ from capnpy.util import extend_module_maybe as _extend_module_maybe
 
 #### FORWARD DECLARATIONS ####
 
-class nullable(object):
-    __id__ = 11296117080722892765
+class key(object):
+    __id__ = 14658097673689429382
     targets_file = False
     targets_const = False
     targets_enum = False
     targets_enumerant = False
-    targets_struct = False
+    targets_struct = True
     targets_field = False
     targets_union = False
     targets_group = True
@@ -38,13 +38,27 @@ class nullable(object):
     targets_method = False
     targets_param = False
     targets_annotation = False
-class key(object):
-    __id__ = 14658097673689429382
+class cache(object):
+    __id__ = 14257459881353217263
     targets_file = False
     targets_const = False
     targets_enum = False
     targets_enumerant = False
     targets_struct = True
+    targets_field = True
+    targets_union = False
+    targets_group = True
+    targets_interface = False
+    targets_method = False
+    targets_param = False
+    targets_annotation = False
+class nullable(object):
+    __id__ = 11296117080722892765
+    targets_file = False
+    targets_const = False
+    targets_enum = False
+    targets_enumerant = False
+    targets_struct = False
     targets_field = False
     targets_union = False
     targets_group = True
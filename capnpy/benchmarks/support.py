@@ -1,6 +1,8 @@
 import py
+import sys
 from collections import namedtuple
 import capnpy
+from capnpy.compiler.compiler import DynamicCompiler
 
 # ============================================================
 # Instance storage
@@ -101,6 +103,12 @@ class NamedTuple(object):
 
 Capnpy = capnpy.load_schema('capnpy.benchmarks.benchmarks')
 
+# the same schema in py mode: on CPython, this measures the generated python
+# code instead of the Cython one (on PyPy, it is the same as Capnpy). We need
+# a separate compiler, because load_schema caches the modules by filename
+CapnpyPy = DynamicCompiler(sys.path).load_schema('capnpy.benchmarks.benchmarks',
+                                                 pyx=False)
+
 
 # ============================================================
 # pycapnp storage
@@ -4,7 +4,7 @@ import pypytools
 from pypytools.codegen import Code
 from capnpy.benchmarks import support
 
-@pytest.fixture(params=('Instance', 'NamedTuple', 'Capnpy', 'PyCapnp'))
+@pytest.fixture(params=('Instance', 'NamedTuple', 'Capnpy', 'CapnpyPy', 'PyCapnp'))
 def schema(request):
     p = request.param
     res = getattr(support, p)
@@ -4,12 +4,12 @@
 #   - length: they are always expressed in BYTES
 
 import sys
-from pypytools import IS_PYPY
 import capnpy
 from capnpy.util import extend
-from capnpy.printer import BufferPrinter
 from capnpy.segment.segment import Segment
 
+IS_PYPY = hasattr(sys, 'pypy_translation_info')
+
 try:
     import cython
 except ImportError:
@@ -38,7 +38,7 @@ class Blob(object):
 
     def _init_blob(self, seg):
         assert seg is not None
-        if isinstance(seg, str):
+        if isinstance(seg, (str, bytearray)):
             seg = Segment(seg)
         self._seg = seg
 
@@ -49,6 +49,7 @@ class Blob(object):
             end = self._get_body_end()
         elif end is None:
             end = len(self._seg.buf)
+        from capnpy.printer import BufferPrinter
         p = BufferPrinter(self._seg.buf)
         p.printbuf(start=start, end=end, **kwds)
 
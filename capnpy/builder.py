@@ -1,48 +1,87 @@
 from capnpy import ptr
 from capnpy.type import Types
 from capnpy.packing import unpack_primitive, pack_into, pack_int64_into, pack_int64
-from capnpy.printer import BufferPrinter
+from capnpy.segment.segment import WritableSegment
 
 class AbstractBuilder(object):
+    """
+    All the objects are written into a single bytearray: the body of the
+    outermost object comes first, and the other objects are allocated at the
+    end of it.
+
+    The offsets passed to set(), setbool() and alloc_*() are relative to
+    _base, i.e. to the start of the body of the struct which is being
+    written: normally it is 0, but it changes while writing nested structs
+    and list items given as dicts (see alloc_struct and
+    StructItemType.pack_item).
+    """
 
     def _init_builder(self, length):
         self._length = length
-        self._extra = []
-        self._total_length = self._length # the total length, including the chunks in _extra
+        self._buf = bytearray(length)
+        self._base = 0
+        self._total_length = self._length # the total length, including the allocated objects
 
     def _alloc(self, s):
-        self._extra.append(s)
+        self._buf += s
         self._total_length += len(s)
         self._force_alignment()
 
     def _record_allocation(self, offset, p):
-        pass
+        # write the pointer on the wire
+        pack_int64_into(self._buf, self._base+offset, p)
 
     def _force_alignment(self):
         padding = 8 - (self._total_length % 8)
         if padding != 8:
-            self._extra.append('\x00'*padding)
+            self._buf += b'\x00'*padding
             self._total_length += padding
 
     def _calc_relative_offset(self, offset):
-        return (self._total_length - (offset+8)) / 8
+        return (self._total_length - (self._base+offset+8)) / 8
+
+    def set(self, ifmt, offset, value):
+        pack_into(ifmt, self._buf, self._base+offset, value)
+
+    def setbool(self, byteoffset, bitoffset, value):
+        ifmt = Types.uint8.ifmt
+        byteoffset += self._base
+        current = unpack_primitive(ifmt, self._buf, byteoffset)
+        current |= (value << bitoffset)
+        pack_into(ifmt, self._buf, byteoffset, current)
 
     def alloc_struct(self, offset, struct_type, value):
         if value is None:
             return 0 # NULL
-        if not isinstance(value, struct_type):
+        if isinstance(value, dict):
+            # write the fields directly into the newly allocated body: we
+            # don't need to build a separate buffer, nor to instantiate the
+            # struct
+            data_size = struct_type.__static_data_size__
+            ptrs_size = struct_type.__static_ptrs_size__
+            ptr_offset = self._calc_relative_offset(offset) # in words
+            p = ptr.new_struct(ptr_offset, data_size, ptrs_size)
+            self._record_allocation(offset, p)
+            base = self._base
+            self._base = self._total_length
+            self._alloc(bytearray((data_size+ptrs_size)*8))
+            struct_type._write_dict(self, value)
+            self._base = base
+            return p
+        elif isinstance(value, struct_type):
+            # we need to take the compact repr of the struct, else we might get
+            # garbage and wrong offsets. See
+            # test_alloc_list_of_structs_with_pointers
+            buf = value._get_compact_buf()
+            data_size = value._data_size                # in words
+            ptrs_size = value._ptrs_size                # in words
+        else:
             raise TypeError("Expected %s instance, got %s" %
                             (struct_type.__class__.__name__, value))
         #
-        data_size = value._data_size                    # in words
-        ptrs_size = value._ptrs_size                    # in words
         ptr_offset = self._calc_relative_offset(offset) # in words
-        #
-        # we need to take the compact repr of the struct, else we might get
-        # garbage and wrong offsets. See
-        # test_alloc_list_of_structs_with_pointers
         p = ptr.new_struct(ptr_offset, data_size, ptrs_size)
-        self._alloc(value.compact()._seg.buf)
+        self._alloc(buf)
         self._record_allocation(offset, p)
         return p
 
@@ -83,20 +122,19 @@ class AbstractBuilder(object):
         # build the list, using a separate listbuilder
         item_count = len(lst)
         listbuilder = ListBuilder.__new__(ListBuilder)
-        listbuilder._init(item_type, item_count)
-        i = 0
-        while i < item_count:
-            s = item_type.pack_item(listbuilder, i, lst[i])
-            listbuilder.append(s)
-            i += 1
+        listbuilder._init_list(item_type, item_count)
+        item_type.pack_list(listbuilder, lst)
         #
         # create the ptrlist, and allocate the list body itself
         ptr_offset = self._calc_relative_offset(offset)
         ptr = self._new_ptrlist(listbuilder.size_tag, ptr_offset, item_type, item_count)
-        self._alloc(listbuilder.build())
+        self._alloc(listbuilder._buf)
         self._record_allocation(offset, ptr)
         return ptr
 
+    def build(self):
+        return bytes(self._buf)
+
 
 class Builder(AbstractBuilder):
 
@@ -109,48 +147,61 @@ class Builder(AbstractBuilder):
     def _init(self, data_size, ptrs_size):
         length = (data_size + ptrs_size) * 8
         self._init_builder(length)
-        self._buf = bytearray(length)
-
-    def _record_allocation(self, offset, p):
-        # write the pointer on the wire
-        pack_int64_into(self._buf, offset, p)
 
-    def set(self, ifmt, offset, value):
-        pack_into(ifmt, self._buf, offset, value)
-
-    def setbool(self, byteoffset, bitoffset, value):
-        ifmt = Types.uint8.ifmt
-        current = unpack_primitive(ifmt, self._buf, byteoffset)
-        current |= (value << bitoffset)
-        self.set(ifmt, byteoffset, current)
-
-    def build(self):
-        return str(self._buf) + ''.join(self._extra)
 
-
-class ListBuilder(AbstractBuilder):
+class ListBuilder(Builder):
+    """
+    Build the body of a list: the items are written in place by
+    ItemType.pack_item, and the objects they point to are allocated after
+    the last item.
+    """
 
     def __init__(self, item_type, item_count):
-        self._init(item_type, item_count)
+        self._init_list(item_type, item_count)
 
-    def _init(self, item_type, item_count):
+    def _init_list(self, item_type, item_count):
         self.item_type = item_type
         self.item_length, self.size_tag = item_type.get_item_length()
         self.item_count = item_count
-        self._items = []
         length = self.item_length * self.item_count
         self._init_builder(length)
         self._force_alignment()
 
-    def append(self, item):
-        self._items.append(item)
-
-    def build(self):
-        assert len(self._items) == self.item_count
-        listbody = ''.join(self._items)
-        assert len(listbody) == self._length
-        return listbody + ''.join(self._extra)
+    def write_item(self, i, s):
+        """
+        Write the already packed item i
+        """
+        start = i * self.item_length
+        self._buf[start:start+len(s)] = s
+
+    def write_body(self, s):
+        """
+        Write all the items together, packed as a single string: this is
+        used by primitive lists
+        """
+        if len(s) != self._length:
+            raise ValueError("Wrong size for the body of the list: expected "
+                             "%d bytes, got %d" % (self._length, len(s)))
+        self._buf[:self._length] = s
 
     def _print_buf(self, **kwds):
+        from capnpy.printer import BufferPrinter
         p = BufferPrinter(self.build())
         p.printbuf(**kwds)
+
+
+class Arena(object):
+    """
+    A buffer which can be reused to build many messages one after the other,
+    by passing it to MessageBuilder: this way, we don't need to allocate and
+    free a new buffer for each message.
+
+    Creating a MessageBuilder on the arena resets it: the objects of the
+    previous message must not be used anymore after that.
+    """
+
+    def __init__(self, length=4096):
+        self.segment = WritableSegment(bytearray(length))
+
+    def reset(self):
+        self.segment.reset()
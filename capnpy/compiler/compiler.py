@@ -2,16 +2,23 @@ from __future__ import absolute_import
 import py
 import sys
 import os
+import re
 import types
+import hashlib
+import tempfile
+import threading
 import subprocess
 from distutils.version import LooseVersion
 import capnpy
 from capnpy import schema
 from capnpy.message import loads
 from capnpy.blob import PYX
+from capnpy.util import find_extension_module, extend_module_maybe
 from capnpy.compiler.module import ModuleGenerator
+from capnpy.compiler.loadprofile import NO_PHASE
 
 PKGDIR = py.path.local(capnpy.__file__).dirpath()
+IMPORT_RE = re.compile(r'\b(?:import|embed)\s+"([^"]+)"')
 
 class CompilerError(Exception):
     pass
@@ -21,10 +28,14 @@ class BaseCompiler(object):
     standalone = None
     annotate = False
     include_dirs = [str(PKGDIR)] # include "ptr.h"
+    profile = None # a LoadProfile, to record the time spent in each phase
 
-    def __init__(self, path):
+    def __init__(self, path, parser='capnp'):
+        assert parser in ('auto', 'capnp', 'builtin')
         self.path = [py.path.local(dirname) for dirname in path]
+        self.parser = parser
         self.modules = {}
+        self.requests = {} # schema hash -> CodeGeneratorRequest bytes
         self._tmpdir = None
 
     @property
@@ -42,32 +53,181 @@ class BaseCompiler(object):
                              'please run setup.py install')
         return pyx
 
-    def generate_py_source(self, filename, convert_case, pyx):
+    def _phase(self, filename, name):
+        if self.profile is None:
+            return NO_PHASE
+        return self.profile.phase(filename, name)
+
+    def generate_py_source(self, filename, convert_case, pyx, lazy=False):
         pyx = self.getpyx(pyx)
-        data = self._capnp_compile(filename)
-        request = loads(data, schema.CodeGeneratorRequest)
-        m = ModuleGenerator(request, convert_case, pyx, self.standalone)
-        src = m.generate()
+        data = self._parse_schema(filename)
+        with self._phase(filename, 'loads'):
+            request = loads(data, schema.CodeGeneratorRequest)
+        with self._phase(filename, 'generate'):
+            m = ModuleGenerator(request, convert_case, pyx, self.standalone,
+                                lazy)
+            src = m.generate()
         return m, py.code.Source(src)
 
     def _pyx_to_dll(self, filename, m, src):
+        from distutils.extension import Extension
         from pyximport.pyxbuild import pyx_to_dll
+        from Cython.Compiler.Main import (compile as cython_compile,
+                                          CompilationOptions, default_options)
         pyxname = filename.new(ext='pyx')
         pyxfile = self.tmpdir.join(pyxname).ensure(file=True)
         pyxfile.write(src)
         if self.annotate:
             import Cython.Compiler.Options
             Cython.Compiler.Options.annotate = True
-        dll = pyx_to_dll(str(pyxfile),
-                         pyxbuild_dir=str(self.tmpdir),
-                         setup_args=dict(
-                             include_dirs=self.include_dirs,
-                         ))
+        #
+        # we run Cython and the C compiler separately, to time them
+        cfile = pyxfile.new(ext='c')
+        with self._phase(filename, 'cython'):
+            options = CompilationOptions(default_options,
+                                         output_file=str(cfile))
+            result = cython_compile(str(pyxfile), options,
+                                    full_module_name=pyxfile.purebasename)
+            if result.num_errors > 0:
+                raise CompilerError('%d errors while compiling %s with Cython'
+                                    % (result.num_errors, pyxfile))
+        with self._phase(filename, 'cc'):
+            ext = Extension(name=pyxfile.purebasename, sources=[str(cfile)])
+            dll = pyx_to_dll(str(cfile), ext,
+                             pyxbuild_dir=str(self.tmpdir),
+                             setup_args=dict(
+                                 include_dirs=self.include_dirs,
+                             ))
         if self.annotate and pyxfile.basename != 'annotate.pyx':
             htmlfile = pyxfile.new(ext='html')
             os.system('xdg-open %s' % htmlfile)
         return dll
 
+    def _parse_schema(self, filename):
+        """
+        Return the CodeGeneratorRequest for filename, serialized as bytes,
+        taking it from a request bundle if there is one up to date.
+        """
+        self._load_bundle(filename)
+        if self.requests:
+            key = self._schema_hash(filename)
+            if key in self.requests:
+                return self.requests[key]
+        return self._run_parser(filename)
+
+    def _run_parser(self, filename):
+        """
+        Return the CodeGeneratorRequest for filename, serialized as bytes.
+
+        parser='capnp' spawns the capnp executable; parser='builtin' uses
+        capnpy.compiler.parser, which does not need any subprocess but supports
+        only a subset of the schema language; parser='auto' uses the builtin
+        parser, falling back to capnp (if available) in case of errors.
+        """
+        if self.parser == 'capnp':
+            with self._phase(filename, 'capnp'):
+                return self._capnp_compile(filename)
+        from capnpy.compiler.parser import parse_schema
+        try:
+            with self._phase(filename, 'parser'):
+                return parse_schema(filename, self.path)
+        except CompilerError:
+            if (self.parser == 'builtin' or
+                py.path.local.sysfind('capnp') is None):
+                raise
+        with self._phase(filename, 'capnp'):
+            return self._capnp_compile(filename)
+
+    # request bundles
+    # ----------------
+    #
+    # A bundle contains the serialized CodeGeneratorRequests of a schema and
+    # of all the schemas it imports, so that they can be loaded without
+    # parsing them again, e.g. on machines where capnp is not installed. It
+    # is stored next to the schema, in foo.capnp.bundle. Each request is
+    # keyed by the hash of its schema and of the files it imports, so that
+    # outdated requests are simply ignored.
+
+    BUNDLE_MAGIC = 'capnpy-bundle 1\n'
+
+    def write_bundle(self, filename):
+        """
+        Write the bundle for the given schema, and return its filename
+        """
+        filename = py.path.local(filename)
+        parts = [self.BUNDLE_MAGIC]
+        for f in self._find_dependencies(filename):
+            data = self._run_parser(f)
+            parts.append('%s %d\n' % (self._schema_hash(f), len(data)))
+            parts.append(data)
+        bundle = self._bundle_filename(filename)
+        bundle.write(''.join(parts), 'wb')
+        return bundle
+
+    def _bundle_filename(self, filename):
+        return filename.new(basename=filename.basename + '.bundle')
+
+    def _load_bundle(self, filename):
+        bundle = self._bundle_filename(filename)
+        if not bundle.check(file=True):
+            return
+        data = bundle.read('rb')
+        if not data.startswith(self.BUNDLE_MAGIC):
+            raise CompilerError('Invalid request bundle: %s' % bundle)
+        i = len(self.BUNDLE_MAGIC)
+        while i < len(data):
+            j = data.index('\n', i)
+            key, length = data[i:j].split()
+            end = j + 1 + int(length)
+            self.requests[key] = data[j+1:end]
+            i = end
+
+    def _schema_hash(self, filename):
+        """
+        Return a hash of the content of the schema and of all the files it
+        imports
+        """
+        h = hashlib.sha1()
+        h.update(filename.basename)
+        for f in self._find_dependencies(filename):
+            h.update(f.read('rb'))
+        return h.hexdigest()
+
+    def _find_dependencies(self, filename):
+        """
+        Return the list of the files which are imported by filename, directly
+        or indirectly, including filename itself. Imports which cannot be
+        resolved are ignored: if they are real, capnp will complain anyway.
+        """
+        result = []
+        seen = set()
+        pending = [filename]
+        while pending:
+            f = pending.pop()
+            if f in seen:
+                continue
+            seen.add(f)
+            result.append(f)
+            for name in IMPORT_RE.findall(f.read()):
+                if name.startswith('/'):
+                    try:
+                        dep = self._find_file(name)
+                    except ValueError:
+                        continue
+                else:
+                    dep = f.dirpath().join(name)
+                    if not dep.check(file=True):
+                        continue
+                pending.append(dep)
+        return result
+
+    def _find_file(self, importname):
+        for dirpath in self.path:
+            f = dirpath.join(importname)
+            if f.check(file=True):
+                return f
+        raise ValueError("Cannot find %s in the given path" % importname)
+
     def _capnp_compile(self, filename):
         # this is a hack: we use cat as a plugin of capnp compile to get the
         # CodeGeneratorRequest bytes. There MUST be a more proper way to do that
@@ -110,6 +270,15 @@ class DynamicCompiler(BaseCompiler):
 
     standalone = False
 
+    def __init__(self, path, cache_dir=None, parser='capnp', lazy=False,
+                 profile=None):
+        BaseCompiler.__init__(self, path, parser)
+        if cache_dir is not None:
+            cache_dir = py.path.local(cache_dir)
+        self.cache_dir = cache_dir
+        self.lazy = lazy
+        self.profile = profile
+
     def load_schema(self, modname=None, importname=None, filename=None,
                     convert_case=True, pyx='auto'):
         """
@@ -148,28 +317,122 @@ class DynamicCompiler(BaseCompiler):
             return mod
 
     def _compile_file(self, filename, convert_case, pyx):
+        # lazy mode makes sense only for py mode, because in pyx mode all the
+        # classes are compiled together into a single extension module. Lazy
+        # modules are not cached, because the structs are generated on demand
+        lazy = self.lazy and not pyx
+        key = None
+        if self.cache_dir is not None and not lazy:
+            key = self._cache_key(filename, convert_case, pyx)
+            mod = self._load_cached(filename, key, pyx)
+            if mod is not None:
+                return mod
+        #
         m, src = self.generate_py_source(filename, convert_case=convert_case,
-                                         pyx=pyx)
+                                         pyx=pyx, lazy=lazy)
         if pyx:
-            return self._compile_pyx(filename, m, src)
+            dll = py.path.local(self._pyx_to_dll(filename, m, src))
+            mod = self._compile_pyx(filename, m.modname, dll)
+            if key is not None:
+                self._store_cached(key, self._cached_basename(filename, pyx),
+                                   dll.read('rb'))
+        elif lazy:
+            mod = self._compile_lazy(filename, m, src)
         else:
-            return self._compile_py(filename, m, src)
+            mod = self._compile_py(filename, m.modname, src)
+            if key is not None:
+                self._store_cached(key, self._cached_basename(filename, pyx),
+                                   str(src))
+        return mod
 
-    def _compile_py(self, filename, m, src):
+    # on-disk cache
+    # --------------
+    #
+    # Each compiled schema is stored in its own directory, whose name is a
+    # hash of all the inputs which can affect the result: the content of
+    # the schema and of all the files it imports, the parser, the
+    # compilation options, the version of capnpy and of Python. The
+    # directory contains a single file, which is either the generated .py or
+    # the .so, named after the module: if it is missing, e.g. because the
+    # directory has been modified by someone else, it is a cache miss.
+
+    def _cache_key(self, filename, convert_case, pyx):
+        h = hashlib.sha1()
+        h.update(repr((_capnpy_fingerprint(), sys.version, sys.platform,
+                       sys.maxsize, self.parser, convert_case, pyx)))
+        h.update(self._schema_hash(filename))
+        return h.hexdigest()
+
+    def _cached_basename(self, filename, pyx):
+        if pyx:
+            return '%s.so' % filename.purebasename
+        return '%s.py' % filename.purebasename
+
+    def _load_cached(self, filename, key, pyx):
+        f = self.cache_dir.join(key, self._cached_basename(filename, pyx))
+        if not f.check(file=True):
+            return None
+        if pyx:
+            # CPython does not initialize the same extension file twice: we
+            # load a private copy, in case another compiler loads it as well
+            dll = self.tmpdir.join(key).ensure(dir=True).join(f.basename)
+            f.copy(dll, mode=True)
+            return self._compile_pyx(filename, f.purebasename, dll)
+        else:
+            return self._compile_py(filename, f.purebasename,
+                                    py.code.Source(f.read()))
+
+    def _store_cached(self, key, basename, content):
+        # many processes might be compiling the same schema at the same time:
+        # we write the file in a temporary directory, and atomically rename
+        # it. Failing to store the file is not fatal.
+        try:
+            self.cache_dir.ensure(dir=True)
+            tmp = py.path.local(tempfile.mkdtemp(dir=str(self.cache_dir)))
+            tmp.join(basename).write(content, 'wb')
+            try:
+                tmp.rename(self.cache_dir.join(key))
+            except (py.error.Error, OSError):
+                tmp.remove() # someone else stored it in the meantime
+        except (py.error.Error, IOError, OSError):
+            pass
+
+    def _compile_py(self, filename, modname, src, modtype=types.ModuleType):
         """
         Compile and load the schema as pure python
         """
-        mod = types.ModuleType(m.modname)
+        mod = modtype(modname)
         mod.__file__ = str(filename)
         mod.__schema__ = str(filename)
         mod.__source__ = str(src)
         mod.__dict__['__compiler'] = self
-        exec src.compile() in mod.__dict__
+        code = src.compile()
+        with self._phase(filename, 'exec'):
+            exec code in mod.__dict__
         return mod
 
-    def _compile_pyx(self, filename, m, src):
+    def _compile_lazy(self, filename, m, src):
+        """
+        Compile and load the schema as a LazyModule
+        """
+        mod = self._compile_py(filename, m.modname, src, modtype=LazyModule)
+        mod.__dict__['__lazy__'] = m
+        if find_extension_module(filename=filename) is not None:
+            # the extension module can reference any class
+            mod._emit_all()
+            self._extend_module_maybe(mod.__dict__, filename)
+        return mod
+
+    def _extend_module_maybe(self, globals, filename):
+        """
+        Called by the generated modules, to apply their extension module
+        """
+        with self._phase(filename, 'extend'):
+            extend_module_maybe(globals, filename=filename)
+
+    def _compile_pyx(self, filename, modname, dll):
         """
-        Use Cython to compile the schema
+        Load the schema compiled by Cython
         """
         import capnpy.ext # the package which we will load the .so in
         import imp
@@ -186,13 +449,13 @@ class DynamicCompiler(BaseCompiler):
         # contains __compiler. Then, in foo.pyx, we import it:
         #     from foo_tmp import __compiler
         #
-        dll = self._pyx_to_dll(filename, m, src)
-        tmpmod = types.ModuleType(m.tmpname)
+        tmpname = '%s_tmp' % modname
+        tmpmod = types.ModuleType(tmpname)
         tmpmod.__dict__['__compiler'] = self
         tmpmod.__dict__['__schema__'] = str(filename)
-        sys.modules[m.tmpname] = tmpmod
-        modname = 'capnpy.ext.%s' % m.modname
-        mod = imp.load_dynamic(modname, str(dll))
+        sys.modules[tmpname] = tmpmod
+        with self._phase(filename, 'dlopen'):
+            mod = imp.load_dynamic('capnpy.ext.%s' % modname, str(dll))
         #
         # clean-up the cluttered sys.modules
         del sys.modules[mod.__name__]
@@ -214,12 +477,67 @@ class DynamicCompiler(BaseCompiler):
         else:
             return py.path.local(filename)
 
-    def _find_file(self, importname):
-        for dirpath in self.path:
-            f = dirpath.join(importname)
-            if f.check(file=True):
-                return f
-        raise ValueError("Cannot find %s in the given path" % importname)
+
+class LazyModule(types.ModuleType):
+    """
+    A module whose top-level structs are generated and compiled only when
+    they are first accessed. The ModuleGenerator which emits them is stored
+    in __lazy__, until all of them have been emitted.
+    """
+
+    _lock = threading.RLock()
+
+    def __getattr__(self, name):
+        # this is called only if name is not in the __dict__ yet
+        m = self.__dict__.get('__lazy__')
+        if m is None or name not in m.lazy_names:
+            raise AttributeError("'module' object has no attribute '%s'" % name)
+        with self._lock:
+            if name in m.lazy_names: # maybe another thread has emitted it
+                self._emit(m.generate_lazy(name))
+        return self.__dict__[name]
+
+    def __dir__(self):
+        names = set(self.__dict__)
+        m = self.__dict__.get('__lazy__')
+        if m is not None:
+            names.update(m.lazy_names)
+        return sorted(names)
+
+    def _emit_all(self):
+        m = self.__dict__.get('__lazy__')
+        with self._lock:
+            while m is not None and m.lazy_names:
+                self._emit(m.generate_lazy(next(iter(m.lazy_names))))
+
+    def _emit(self, src):
+        src = py.code.Source(src)
+        exec src.compile() in self.__dict__
+        m = self.__dict__['__lazy__']
+        if not m.lazy_names:
+            # everything has been emitted, we no longer need the generator
+            del self.__dict__['__lazy__']
+        self.__source__ += '\n' + str(src)
+
+
+_fingerprint = None
+
+def _capnpy_fingerprint():
+    """
+    Return a string which changes whenever capnpy is modified. The generated
+    code depends on both the compiler and the runtime modules, but the
+    version number is not enough, because it does not change during
+    development: we use the size and mtime of all the files of the package.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        h = hashlib.sha1()
+        for d in (PKGDIR, PKGDIR.join('compiler'), PKGDIR.join('segment')):
+            for f in sorted(d.listdir(fil=lambda f: f.ext in ('.py', '.pxd', '.so'))):
+                st = f.stat()
+                h.update('%s %s %s\n' % (f.relto(PKGDIR), st.size, st.mtime))
+        _fingerprint = h.hexdigest()
+    return _fingerprint
 
 
 class StandaloneCompiler(BaseCompiler):
@@ -265,7 +583,7 @@ class DistutilsCompiler(BaseCompiler):
         else:
             outfile = infile.new(ext='py')
         #
-        if outfile.exists() and outfile.mtime() > infile.mtime():
+        if outfile.exists() and outfile.mtime() > self._last_modified(infile):
             # already compiled
             return outfile
         cwd = py.path.local('.')
@@ -274,3 +592,8 @@ class DistutilsCompiler(BaseCompiler):
                                          pyx=pyx)
         outfile.write(src)
         return outfile
+
+    def _last_modified(self, infile):
+        # the generated file must be updated also when one of the imported
+        # schemas changes
+        return max(f.mtime() for f in self._find_dependencies(infile))
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 import sys
 import glob
 import warnings
+import multiprocessing
 from distutils.core import Extension
 from capnpy.compiler.compiler import DistutilsCompiler
 try:
@@ -11,7 +12,7 @@ except ImportError:
 
 # setuptools entry-points
 def capnpy_options(dist, attr, value):
-    my_options = set(['pyx', 'convert_case'])
+    my_options = set(['pyx', 'convert_case', 'nthreads'])
     for opt in value:
         if opt not in my_options:
             warnings.warn('Unknown capnpy option: %s' % opt)
@@ -21,17 +22,34 @@ def capnpy_schemas(dist, attr, schemas):
     options = dist.capnpy_options or {}
     pyx = options.get('pyx', 'auto')
     convert_case = options.get('convert_case', True)
+    nthreads = options.get('nthreads', 0)
     if dist.ext_modules is None:
         dist.ext_modules = []
-    dist.ext_modules += capnpify(schemas, pyx=pyx, convert_case=convert_case)
+    dist.ext_modules += capnpify(schemas, pyx=pyx, convert_case=convert_case,
+                                 nthreads=nthreads)
 
-def capnpify(files, pyx='auto', convert_case=True):
+def capnpify(files, pyx='auto', convert_case=True, nthreads=0):
+    """
+    Generate the .py/.pyx files for the given schemas, and return the list
+    of extensions to build. If nthreads is non-zero, the schemas are compiled
+    by a pool of nthreads processes, and nthreads is passed to cythonize as
+    well.
+    """
     if isinstance(files, str):
         files = glob.glob(files)
         if files == []:
             raise ValueError("'%s' did not match any files" % files)
     compiler = DistutilsCompiler(sys.path)
-    outfiles = [compiler.compile(f, convert_case, pyx) for f in files]
+    args = [(f, convert_case, pyx) for f in files]
+    if nthreads and len(files) > 1:
+        pool = multiprocessing.Pool(nthreads)
+        try:
+            outfiles = pool.map(_compile_schema, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        outfiles = map(_compile_schema, args)
     #
     if compiler.getpyx(pyx):
         exts = []
@@ -39,7 +57,13 @@ def capnpify(files, pyx='auto', convert_case=True):
             ext = Extension('*', [str(f)],
                             include_dirs=compiler.include_dirs)
             exts.append(ext)
-        exts = cythonize(exts)
+        exts = cythonize(exts, nthreads=nthreads)
         return exts
     else:
         return []
+
+def _compile_schema(args):
+    # this runs inside the worker processes, so it must be a global function
+    filename, convert_case, pyx = args
+    compiler = DistutilsCompiler(sys.path)
+    return compiler.compile(filename, convert_case, pyx)
@@ -10,10 +10,66 @@ class Field:
         ns = m.code.new_scope()
         if self.is_part_of_union():
             ns.ensure_union = 'self._ensure_union(%s)' % self.discriminantValue
+            ns.set_union = 'self._set_union_tag(%s)' % self.discriminantValue
         else:
             ns.ensure_union = '# no union check'
+            ns.set_union = '# no union tag'
+        ns.cached = self.is_cached(m, node)
         self._emit(m, ns, name)
 
+    def layout_expr(self, m):
+        """
+        Return an expression which builds the FieldLayout of this field, see
+        capnpy/layout.py
+        """
+        kind = offset = bitmask = ptr_index = discriminant = structcls = None
+        default = 'None'
+        if self.is_group():
+            kind = 'group'
+            structcls = m.allnodes[self.group.typeId].compile_name(m)
+        else:
+            t = self.slot.type
+            kind = '%s' % t.which()
+            if t.is_bool():
+                offset, bit = divmod(self.slot.offset, 8)
+                bitmask = 1 << bit
+            elif t.is_primitive() or t.is_enum():
+                offset = self.slot.offset * self.slot.get_size()
+            elif t.is_pointer():
+                ptr_index = self.slot.offset
+            if t.is_struct():
+                structcls = t.compile_name(m)
+            if t.is_bool() or t.is_primitive() or t.is_enum():
+                default = self.slot.defaultValue.as_literal()
+        if self.is_part_of_union():
+            discriminant = self.discriminantValue
+        args = map(repr, (m._field_name(self), kind, offset, bitmask, ptr_index))
+        args += [default, repr(discriminant)]
+        if structcls is None:
+            args.append('None')
+        else:
+            # the class might be defined later in the module
+            args.append('lambda: %s' % structcls)
+        return '_FieldLayout(%s)' % ', '.join(args)
+
+    def _def_property(self, m, ns, name, src, cached_expr):
+        # if the field is cached, the object is computed by cached_expr the
+        # first time and then stored in a per-instance slot, which is declared
+        # by Node__Struct._emit_cache_slots. None is never cached, but it is
+        # cheap to recompute anyway
+        if not ns.cached:
+            m.def_property(ns, name, src)
+            return
+        ns.cache_slot = '_cache_' + name
+        ns.cached_expr = cached_expr
+        m.def_property(ns, name, """
+            {ensure_union}
+            obj = self.{cache_slot}
+            if obj is None:
+                obj = self.{cache_slot} = {cached_expr}
+            return obj
+        """)
+
 
 @schema.Field__Slot.__extend__
 class Field__Slot:
@@ -57,62 +113,114 @@ class Field__Slot:
 
     def _emit_primitive(self, m, ns, name):
         ns.typename = '_Types.%s' % self.slot.type.which()
-        ns.default_ = self.slot.defaultValue.as_pyobj()
+        ns.default_ = self.slot.defaultValue.as_literal()
         ns.ifmt = "ord(%r)" % self.slot.get_fmt()
+        if m.segment_reads:
+            ns.read = m.segment_read(self.slot.type.as_type().reader, ns.offset)
+        else:
+            ns.read = ns.format('self._read_data({offset}, {ifmt})')
         m.def_property(ns, name, """
             {ensure_union}
-            value = self._read_data({offset}, {ifmt})
+            value = {read}
             if {default_} != 0:
                 value = value ^ {default_}
             return value
         """)
+        ns.name = name
+        ns.ww("""
+            {cpdef} set_{name}(self, value):
+                {set_union}
+                if {default_} != 0:
+                    value = value ^ {default_}
+                self._write_data({offset}, {ifmt}, value)
+        """)
+        ns.w()
 
     def _emit_bool(self, m, ns, name):
         byteoffset, bitoffset = divmod(self.slot.offset, 8)
         ns.offset = byteoffset
         ns.bitmask = 1 << bitoffset
-        ns.default_ = self.slot.defaultValue.as_pyobj()
+        ns.default_ = self.slot.defaultValue.as_literal()
+        if m.segment_reads:
+            ns.read = 'bool((%s) & %s)' % (m.segment_read('read_uint8', ns.offset),
+                                           ns.bitmask)
+        else:
+            ns.read = ns.format('self._read_bit({offset}, {bitmask})')
         m.def_property(ns, name, """
             {ensure_union}
-            value = self._read_bit({offset}, {bitmask})
+            value = {read}
             if {default_} != 0:
                 value = value ^ {default_}
             return value
         """)
+        ns.name = name
+        ns.ww("""
+            {cpdef} set_{name}(self, value):
+                {set_union}
+                if {default_} != 0:
+                    value = not value
+                self._write_bit({offset}, {bitmask}, value)
+        """)
+        ns.w()
 
     def _emit_enum(self, m, ns, name):
         ns.enumcls = self.slot.type.runtime_name(m)
-        ns.default_ = self.slot.defaultValue.as_pyobj()
+        ns.default_ = self.slot.defaultValue.as_literal()
+        if m.segment_reads:
+            ns.read = '%s(%s)' % (ns.enumcls,
+                                  m.segment_read('read_int16', ns.offset))
+        else:
+            ns.read = ns.format('self._read_enum({offset}, {enumcls})')
         m.def_property(ns, name, """
             {ensure_union}
-            value = self._read_enum({offset}, {enumcls})
+            value = {read}
             if {default_} != 0:
                 value = {enumcls}(value ^ {default_})
             return value
         """)
+        ns.name = name
+        ns.ww("""
+            {cpdef} set_{name}(self, value):
+                {set_union}
+                value = int(value)
+                if {default_} != 0:
+                    value = value ^ {default_}
+                self._write_data({offset}, ord('h'), value)
+        """)
+        ns.w()
 
     def _emit_text(self, m, ns, name):
         ns.name = name
-        m.def_property(ns, name, """
+        cached_expr = 'self._read_str_text(%s)' % ns.offset
+        self._def_property(m, ns, name, """
             {ensure_union}
             return self._read_str_text({offset})
-        """)
+        """, cached_expr)
         ns.ww("""
             {cpdef} get_{name}(self):
                 return self._read_str_text({offset}, default_="")
+
+            {cpdef} set_{name}(self, value):
+                {set_union}
+                self._set_str({offset}, value, -1)
         """)
         ns.w()
         self._emit_has_method(ns)
 
     def _emit_data(self, m, ns, name):
         ns.name = name
-        m.def_property(ns, name, """
+        cached_expr = 'self._read_str_data(%s)' % ns.offset
+        self._def_property(m, ns, name, """
             {ensure_union}
             return self._read_str_data({offset})
-        """)
+        """, cached_expr)
         ns.ww("""
             {cpdef} get_{name}(self):
                 return self._read_str_data({offset}, default_="")
+
+            {cpdef} set_{name}(self, value):
+                {set_union}
+                self._set_str({offset}, value, 0)
         """)
         ns.w()
         self._emit_has_method(ns)
@@ -131,7 +239,8 @@ class Field__Slot:
             ns.cdef_offset = 'offset'
             ns.cdef_p = 'p'
             ns.cdef_obj = 'obj'
-        m.def_property(ns, name, """
+        cached_expr = 'self._read_struct(%s, %s)' % (ns.offset, ns.structcls)
+        self._def_property(m, ns, name, """
             {ensure_union}
             {cdef_offset} = {offset}
             {cdef_p} = self._read_fast_ptr(offset)
@@ -144,13 +253,21 @@ class Field__Slot:
             {cdef_obj} = {structcls}.__new__({structcls})
             obj._init_from_pointer(self._seg, offset, p)
             return obj
-        """)
+        """, cached_expr)
         ns.ww("""
             {cpdef} get_{name}(self):
                 res = self.{name}
                 if res is None:
                     return {structcls}.from_buffer('', 0, data_size=0, ptrs_size=0)
                 return res
+
+            {cpdef} set_{name}(self, value):
+                {set_union}
+                self._set_struct({offset}, {structcls}, value)
+
+            {cpdef} init_{name}(self):
+                {set_union}
+                return self._init_struct({offset}, {structcls})
         """)
         ns.w()
         self._emit_has_method(ns)
@@ -159,16 +276,21 @@ class Field__Slot:
         ns.name = name
         t = self.slot.type.list.elementType
         ns.list_item_type = t.list_item_type(m)
-        m.def_property(ns, name, """
+        cached_expr = 'self._read_list(%s, %s)' % (ns.offset, ns.list_item_type)
+        self._def_property(m, ns, name, """
             {ensure_union}
             return self._read_list({offset}, {list_item_type})
-        """)
+        """, cached_expr)
         ns.ww("""
             {cpdef} get_{name}(self):
                 res = self.{name}
                 if res is None:
                     return _List.from_buffer('', 0, 0, 0, {list_item_type})
                 return res
+
+            {cpdef} init_{name}(self, item_count):
+                {set_union}
+                return self._init_list({offset}, {list_item_type}, item_count)
         """)
         ns.w()
         self._emit_has_method(ns)
@@ -191,6 +313,78 @@ class Field__Slot:
         """)
         ns.w()
 
+    def _pyobj_expr(self, m, obj, as_dict):
+        """
+        Return an expression which reads the field from ``obj`` as a plain
+        Python object, bypassing the property: this is used by to_dict() and
+        to_tuple()
+        """
+        t = self.slot.type
+        offset = self.slot.offset * self.slot.get_size()
+        if t.is_void():
+            return 'None'
+        elif t.is_primitive():
+            expr = '%s._read_data(%s, ord(%r))' % (obj, offset, self.slot.get_fmt())
+        elif t.is_bool():
+            byteoffset, bitoffset = divmod(self.slot.offset, 8)
+            expr = '%s._read_bit(%s, %s)' % (obj, byteoffset, 1 << bitoffset)
+        elif t.is_enum():
+            expr = '%s._read_data_int16(%s)' % (obj, offset)
+            default_ = self.slot.defaultValue.as_pyobj()
+            if default_ != 0:
+                expr = '%s ^ %s' % (expr, default_)
+            return '%s(%s)' % (t.runtime_name(m), expr)
+        elif t.is_text():
+            return '%s._read_str_text(%s)' % (obj, offset)
+        elif t.is_data():
+            return '%s._read_str_data(%s)' % (obj, offset)
+        elif t.is_struct():
+            return '%s._convert_struct(%s, %s, %s)' % (obj, offset,
+                                                       t.runtime_name(m), as_dict)
+        elif t.is_list():
+            item_type = t.list.elementType.list_item_type(m)
+            return '%s._convert_list(%s, %s, %s)' % (obj, offset, item_type, as_dict)
+        else:
+            raise NotImplementedError('Unknown type: %s' % t.runtime_name(m))
+        #
+        if self.slot.defaultValue.as_pyobj() != 0:
+            expr = '(%s ^ %s)' % (expr, self.slot.defaultValue.as_literal())
+        return expr
+
+    def _emit_json(self, m, ns, obj):
+        """
+        Emit the code which appends the JSON representation of the field of
+        ``obj`` to ``parts``: this is used by _dump_json()
+        """
+        t = self.slot.type
+        offset = self.slot.offset * self.slot.get_size()
+        if t.is_void():
+            ns.w("parts.append('null')")
+        elif t.is_struct():
+            ns.w('_json.dump_struct(%s._read_struct(%s, %s), parts)' % (
+                obj, offset, t.runtime_name(m)))
+        elif t.is_list():
+            item_type = t.list.elementType.list_item_type(m)
+            ns.w('_json.dump_list(%s._read_list(%s, %s), parts)' % (
+                obj, offset, item_type))
+        else:
+            expr = self._pyobj_expr(m, obj, as_dict=True)
+            if t.is_float32():
+                expr = '_json.dump_float(%s, _float32_repr)' % expr
+            elif t.is_float64():
+                expr = '_json.dump_float(%s, _float64_repr)' % expr
+            elif t.is_primitive():
+                expr = 'str(%s)' % expr
+            elif t.is_bool():
+                expr = "'true' if %s else 'false'" % expr
+            elif t.is_enum():
+                expr = '_json.dump_enum(%s)' % expr
+            elif t.is_text():
+                expr = '_json.dump_text(%s)' % expr
+            elif t.is_data():
+                expr = '_json.dump_data(%s)' % expr
+            ns.w('parts.append(%s)' % expr)
+
 
 @schema.Field__Group.__extend__
 class Field__Group:
@@ -214,19 +408,29 @@ class Field__Group:
             name = ns.privname
             ns.w()
         #
-        m.def_property(ns, name, """
+        cached_expr = 'self._read_group(%s)' % ns.groupcls
+        self._def_property(m, ns, name, """
             {ensure_union}
             obj = {groupcls}.__new__({groupcls})
             _Struct._init_from_buffer(obj, self._seg, self._data_offset,
                                       self._data_size, self._ptrs_size)
             return obj
-        """)
+        """, cached_expr)
         #
         if not nullable:
             # these are emitted only for non-nullable groups
             self._emit_ctor_like(m, ns, name)
 
 
+    def _pyobj_expr(self, m, obj, as_dict):
+        groupcls = m.allnodes[self.group.typeId].compile_name(m)
+        meth = 'to_dict' if as_dict else 'to_tuple'
+        return '%s._read_group(%s).%s()' % (obj, groupcls, meth)
+
+    def _emit_json(self, m, ns, obj):
+        groupcls = m.allnodes[self.group.typeId].compile_name(m)
+        ns.w('%s._read_group(%s)._dump_json(parts)' % (obj, groupcls))
+
     def _emit_ctor_like(self, m, ns, name):
         ## emit something like this:
         ## @staticmethod
@@ -111,8 +111,7 @@ class Node(AbstractNode):
         if self.f.is_part_of_union() and not self.force_default:
             self.default = '_undefined'
         elif self.f.is_slot():
-            default_val = self.f.slot.defaultValue.as_pyobj()
-            self.default = str(default_val)
+            self.default = self.f.slot.defaultValue.as_literal()
         else:
             assert self.f.is_group()
             items = [child.default for child in self.children]
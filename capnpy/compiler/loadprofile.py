@@ -0,0 +1,114 @@
+"""
+Per-phase timings of schema loading.
+
+Pass a LoadProfile to DynamicCompiler, or set CAPNPY_PROFILE_LOAD=1 to
+enable it for capnpy.load_schema: in the latter case, the report is printed
+on stderr when the process exits.
+
+The phases are timed separately for each schema file. When a phase triggers
+the loading of another schema (e.g., executing foo.py imports bar.capnp),
+the time spent on the nested schema is counted only for the latter.
+
+The phases are:
+
+  - ``capnp``: running the capnp executable
+  - ``parser``: running the builtin parser
+  - ``loads``: loading the CodeGeneratorRequest
+  - ``generate``: ModuleGenerator.generate
+  - ``cython``: translating the generated pyx into C
+  - ``cc``: compiling the C extension
+  - ``exec``: executing the generated module, in py mode
+  - ``dlopen``: loading the C extension, in pyx mode
+  - ``extend``: executing the ``*_extended.py`` module
+"""
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+PHASES = ['capnp', 'parser', 'loads', 'generate', 'cython', 'cc', 'exec',
+          'dlopen', 'extend']
+
+
+class LoadProfile(object):
+
+    def __init__(self):
+        # filename -> {phase: seconds}
+        self.timings = OrderedDict()
+        self._local = threading.local()
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def phase(self, filename, name):
+        return _Phase(self, str(filename), name)
+
+    def record(self, filename, name, t):
+        d = self.timings.setdefault(filename, {})
+        d[name] = d.get(name, 0.0) + t
+
+    def total(self, filename):
+        return sum(self.timings[filename].values())
+
+    def report(self):
+        """
+        Return the timings as a table, with the slowest schemas first
+        """
+        names = [name for name in PHASES
+                 if any(name in d for d in self.timings.values())]
+        filenames = sorted(self.timings, key=self.total, reverse=True)
+        width = max([len(f) for f in filenames] + [len('schema')])
+        fmt = '%-*s' + ' %9s' * (len(names)+1)
+        lines = [fmt % ((width, 'schema') + tuple(names) + ('total',))]
+        for filename in filenames:
+            d = self.timings[filename]
+            values = ['%.3f' % d[name] if name in d else '-' for name in names]
+            values.append('%.3f' % self.total(filename))
+            lines.append(fmt % ((width, filename) + tuple(values)))
+        return '\n'.join(lines)
+
+    def dump(self, f=None):
+        if f is None:
+            f = sys.stderr
+        if not self.timings:
+            return
+        print >> f, 'capnpy: schema loading times, in seconds'
+        print >> f, self.report()
+
+
+class _Phase(object):
+
+    def __init__(self, profile, filename, name):
+        self.profile = profile
+        self.filename = filename
+        self.name = name
+        self.start = None
+        self.nested = 0.0
+
+    def __enter__(self):
+        self.profile._stack().append(self)
+        self.start = time.time()
+
+    def __exit__(self, etype, evalue, tb):
+        t = time.time() - self.start
+        stack = self.profile._stack()
+        stack.pop()
+        if stack:
+            stack[-1].nested += t
+        self.profile.record(self.filename, self.name, t - self.nested)
+
+
+class _NoPhase(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, etype, evalue, tb):
+        pass
+
+NO_PHASE = _NoPhase()
@@ -1,3 +1,4 @@
+import math
 from capnpy.schema import Value, Type
 
 @Type.__extend__
@@ -67,3 +68,15 @@ class Value:
         val_type = str(self.which())
         return getattr(self, val_type)
 
+    def as_literal(self):
+        """
+        Return the python source of the value, to be embedded in the
+        generated code: unlike str(), it is a valid expression also for nan and
+        inf, and it does not lose precision for floats
+        """
+        val = self.as_pyobj()
+        if isinstance(val, float):
+            if math.isnan(val) or math.isinf(val):
+                return "float('%r')" % val
+            return repr(val)
+        return str(val)
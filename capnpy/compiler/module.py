@@ -3,6 +3,7 @@ import keyword
 from collections import defaultdict
 from pypytools.codegen import Code
 from capnpy.convert_case import from_camel_case
+from capnpy.blob import PYX
 
 # the following imports have side-effects, and augment the schema.* classes
 # with emit() methods
@@ -14,12 +15,23 @@ import capnpy.compiler.misc
 
 class ModuleGenerator(object):
 
-    def __init__(self, request, convert_case, pyx, standalone):
+    def __init__(self, request, convert_case, pyx, standalone, lazy=False):
         self.code = Code(pyx=pyx)
         self.request = request
         self.convert_case = convert_case
         self.pyx = pyx
         self.standalone = standalone
+        self.lazy = lazy
+        # whether the getters can call the typed readers of the segment
+        # directly, see segment_read(). This is possible in pyx mode and on
+        # top of the pure-python runtime (e.g. on PyPy), but not in py mode on
+        # top of the compiled runtime, whose readers are not visible to
+        # python. Standalone py modules can be imported later by another
+        # interpreter, whose runtime might be the compiled one: they always
+        # use the generic readers
+        self.segment_reads = pyx or (not standalone and not PYX)
+        self.lazy_nodes = {} # id -> top-level struct not emitted yet
+        self.lazy_names = {} # global name -> id of the struct defining it
         self.allnodes = {} # id -> node
         self.children = defaultdict(list) # nodeId -> nested nodes
         self.importnames = {} # filename -> import name
@@ -42,6 +54,19 @@ class ModuleGenerator(object):
                 return res
         return None
 
+    def segment_read(self, reader, offset):
+        """
+        Return an expression which reads a primitive at the given constant
+        offset of the data section of self, by calling directly the typed
+        reader of the segment. This way, in pyx mode the read is a C call
+        with no dispatch on ifmt, and on PyPy the JIT sees no intermediate
+        calls. Fields which are beyond the data section (because the message
+        was written using an older schema) read as 0.
+        """
+        return ('self._seg.{reader}(self._data_offset+{offset}) '
+                'if self._data_size > {word} else 0').format(
+                    reader=reader, offset=offset, word=offset // 8)
+
     def w(self, *args, **kwargs):
         self.code.w(*args, **kwargs)
 
@@ -62,6 +87,101 @@ class ModuleGenerator(object):
         self.request.emit(self)
         return self.code.build()
 
+    # lazy mode
+    # ----------
+    #
+    # In lazy mode, generate() emits everything but the top-level structs
+    # (and all their nested nodes), which are emitted one by one by
+    # generate_lazy() when they are first accessed. A struct is always
+    # emitted together with all the structs which its fields reference, so
+    # that the generated code never sees a class which is only forward
+    # declared.
+
+    def register_lazy(self, node):
+        """
+        Register a top-level node to be emitted lazily, and return True. Only
+        structs can be emitted lazily: for any other node, return False.
+        """
+        if not node.is_struct():
+            return False
+        self.lazy_nodes[node.id] = node
+        for child in self._walk(node):
+            name = child.compile_name(self)
+            if child.is_struct():
+                names = [name, '_%s_list_item_type' % name,
+                         '_%s_field_names' % name]
+            elif child.is_enum():
+                names = [name, '_%s_list_item_type' % name]
+            elif child.is_annotation():
+                names = [child.shortname(self)]
+            else:
+                names = []
+            for name in names:
+                self.lazy_names[name] = node.id
+        return True
+
+    def generate_lazy(self, name):
+        """
+        Emit the top-level struct which defines the global ``name``, together
+        with all the lazy structs which it depends on, and return the source
+        """
+        todo = [self.lazy_names[name]]
+        ids = set()
+        while todo:
+            node_id = todo.pop()
+            if node_id not in ids:
+                ids.add(node_id)
+                todo.extend(self._lazy_dependencies(self.lazy_nodes[node_id]))
+        # emit the structs in the same order as generate() would do
+        filenode = self.current_scope
+        nodes = [node for node in self.children[filenode.id] if node.id in ids]
+        self.code = Code(pyx=self.pyx)
+        self.request.requestedFiles[0].setup_global_scope(self)
+        for node in nodes:
+            node.emit_declaration(self)
+        for node in nodes:
+            node.emit_definition(self)
+        #
+        for name, node_id in self.lazy_names.items():
+            if node_id in ids:
+                del self.lazy_names[name]
+        for node_id in ids:
+            del self.lazy_nodes[node_id]
+        return self.code.build()
+
+    def _lazy_dependencies(self, node):
+        # return the ids of the lazy structs referenced by the fields of node
+        # and of its nested structs
+        result = []
+        for child in self._walk(node):
+            if not child.is_struct():
+                continue
+            for field in child.struct.fields or []:
+                if not field.is_slot():
+                    continue
+                t = field.slot.type
+                while t.is_list():
+                    t = t.list.elementType
+                if t.is_struct():
+                    target = self.allnodes[t.struct.typeId]
+                elif t.is_enum():
+                    target = self.allnodes[t.enum.typeId]
+                else:
+                    continue
+                if target.is_imported(self):
+                    continue
+                while target.scopeId != self.current_scope.id:
+                    target = target.get_parent(self)
+                if target.id in self.lazy_nodes:
+                    result.append(target.id)
+        return result
+
+    def _walk(self, node):
+        yield node
+        for child in self.children[node.id]:
+            for item in self._walk(child):
+                yield item
+
     def _dump_node(self, node):
         def visit(node, deep=0):
             print '%s%s: %s' % (' ' * deep, node.which(), node.displayName)
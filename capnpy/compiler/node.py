@@ -150,5 +150,5 @@ class Node__Const:
     def emit_reference_as_child(self, m):
         # XXX: this works only for numerical consts so far
         name = self.shortname(m)
-        val = self.const.value.as_pyobj()
+        val = self.const.value.as_literal()
         m.w("%s = %s" % (name, val))
@@ -0,0 +1,1308 @@
+"""
+A parser for capnproto schemas, written in pure Python.
+
+It produces the same CodeGeneratorRequest as ``capnp compile -o /bin/cat``,
+including the node ids and the layout of the fields, so that schemas can be
+loaded without the capnp executable and without spawning any subprocess.
+
+Only the most common subset of the language is supported: structs, enums,
+unions, groups, lists, constants, annotations and imports. Interfaces,
+generics, struct and list default values, data literals (``0x"..."``) and
+inline imports are not: in that case, a CompilerError is raised and the capnp
+executable must be used.
+"""
+
+from __future__ import absolute_import
+import os
+import re
+import struct
+import hashlib
+import py
+from capnpy import schema
+from capnpy.struct_ import undefined
+from capnpy.message import dumps
+from capnpy.compiler.compiler import CompilerError
+
+# the directories which capnp searches for absolute imports, after the ones
+# specified on the command line
+STANDARD_IMPORT_DIRS = ['/usr/local/include', '/usr/include']
+
+NO_DISCRIMINANT = 0xffff
+
+# name -> (kind, lgSize). lgSize is the log2 of the size in bits, or None for
+# pointers
+BUILTIN_TYPES = {
+    'Void': ('void', None),
+    'Bool': ('bool', 0),
+    'Int8': ('int8', 3),
+    'Int16': ('int16', 4),
+    'Int32': ('int32', 5),
+    'Int64': ('int64', 6),
+    'UInt8': ('uint8', 3),
+    'UInt16': ('uint16', 4),
+    'UInt32': ('uint32', 5),
+    'UInt64': ('uint64', 6),
+    'Float32': ('float32', 5),
+    'Float64': ('float64', 6),
+    'Text': ('text', None),
+    'Data': ('data', None),
+    'AnyPointer': ('anyPointer', None),
+}
+
+INT_RANGES = {
+    'int8': (-2**7, 2**7-1),
+    'int16': (-2**15, 2**15-1),
+    'int32': (-2**31, 2**31-1),
+    'int64': (-2**63, 2**63-1),
+    'uint8': (0, 2**8-1),
+    'uint16': (0, 2**16-1),
+    'uint32': (0, 2**32-1),
+    'uint64': (0, 2**64-1),
+}
+
+LG_SIZES = dict(BUILTIN_TYPES.values())
+
+ANNOTATION_TARGETS = ['file', 'const', 'enum', 'enumerant', 'struct', 'field',
+                      'union', 'group', 'interface', 'method', 'param',
+                      'annotation']
+
+
+def parse_schema(filename, path):
+    """
+    Parse the given schema file, and return the serialized
+    CodeGeneratorRequest, i.e. the same bytes which are returned by ``capnp
+    compile -o /bin/cat``. Absolute imports are searched in ``path``.
+    """
+    loader = SchemaLoader(path)
+    request = loader.load(filename)
+    return dumps(request)
+
+
+def child_id(parent_id, name):
+    # same algorithm as generateChildId() in capnp/compiler/node-translator.c++
+    h = hashlib.md5(struct.pack('<Q', parent_id) + name).digest()
+    return struct.unpack('>Q', h[:8])[0] | (1 << 63)
+
+def group_id(parent_id, index):
+    # same algorithm as generateGroupId() in capnp/compiler/node-translator.c++
+    h = hashlib.md5(struct.pack('<QH', parent_id, index)).digest()
+    return struct.unpack('>Q', h[:8])[0] | (1 << 63)
+
+
+# ======================================================================
+# Tokenizer and parser
+# ======================================================================
+
+TOKEN_RE = re.compile(r'''
+    (?P<skip>\s+|\#[^\n]*)
+  | (?P<float>\d+\.\d+(?:[eE][-+]?\d+)?|\d+[eE][-+]?\d+)
+  | (?P<data>0[xX]"[^"]*")
+  | (?P<int>0[xX][0-9a-fA-F]+|\d+)
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>[@:;=(){}\[\],.$*<>-])
+''', re.VERBOSE)
+
+
+class Token(object):
+
+    def __init__(self, kind, value, lineno):
+        self.kind = kind
+        self.value = value
+        self.lineno = lineno
+
+    def __repr__(self):
+        return '<Token %s %r>' % (self.kind, self.value)
+
+
+def tokenize(filename, src):
+    tokens = []
+    lineno = 1
+    pos = 0
+    while pos < len(src):
+        match = TOKEN_RE.match(src, pos)
+        if match is None:
+            raise CompilerError('%s:%d: invalid character %r' %
+                                (filename, lineno, src[pos]))
+        kind = match.lastgroup
+        text = match.group()
+        if kind == 'int':
+            if text[:2] in ('0x', '0X'):
+                value = int(text, 16)
+            elif len(text) > 1 and text[0] == '0':
+                value = int(text, 8)
+            else:
+                value = int(text)
+            tokens.append(Token('int', value, lineno))
+        elif kind == 'float':
+            tokens.append(Token('float', float(text), lineno))
+        elif kind == 'string':
+            tokens.append(Token('string', text[1:-1].decode('string_escape'),
+                                lineno))
+        elif kind != 'skip':
+            tokens.append(Token(kind, text, lineno))
+        lineno += text.count('\n')
+        pos = match.end()
+    tokens.append(Token('eof', None, lineno))
+    return tokens
+
+
+class Decl(object):
+    """
+    A declaration in the schema. ``kind`` is one of: file, using, struct,
+    field, group, union, enum, enumerant, const, annotation.
+    """
+
+    def __init__(self, kind, name, lineno, **kwds):
+        self.kind = kind
+        self.name = name
+        self.lineno = lineno
+        self.id = None
+        self.parent = None
+        self.annotations = []
+        self.members = []
+        self.__dict__.update(kwds)
+
+    def __repr__(self):
+        return '<Decl %s %s>' % (self.kind, self.name)
+
+    def add(self, member):
+        member.parent = self
+        self.members.append(member)
+
+    def get_file(self):
+        decl = self
+        while decl.kind != 'file':
+            decl = decl.parent
+        return decl
+
+
+class Parser(object):
+
+    def __init__(self, filename, src):
+        self.filename = filename
+        self.tokens = tokenize(filename, src)
+        self.i = 0
+
+    def error(self, msg, tok=None):
+        if tok is None:
+            tok = self.peek()
+        raise CompilerError('%s:%d: %s' % (self.filename, tok.lineno, msg))
+
+    def peek(self, offset=0):
+        i = min(self.i + offset, len(self.tokens) - 1)
+        return self.tokens[i]
+
+    def next(self):
+        tok = self.tokens[self.i]
+        if tok.kind != 'eof':
+            self.i += 1
+        return tok
+
+    def check(self, value, offset=0):
+        tok = self.peek(offset)
+        return tok.kind in ('op', 'name') and tok.value == value
+
+    def accept(self, value):
+        if self.check(value):
+            self.next()
+            return True
+        return False
+
+    def expect(self, value):
+        if not self.accept(value):
+            self.error('expected %r, got %r' % (value, self.peek().value))
+
+    def expect_kind(self, kind):
+        tok = self.peek()
+        if tok.kind != kind:
+            self.error('expected %s, got %r' % (kind, tok.value))
+        return self.next().value
+
+    def parse_file(self):
+        f = Decl('file', None, 1)
+        while self.peek().kind != 'eof':
+            if self.accept('@'):
+                f.id = self.expect_kind('int')
+                self.expect(';')
+            elif self.check('$'):
+                f.annotations.append(self.parse_annotation_application())
+                self.expect(';')
+            else:
+                self.parse_member(f, allow_fields=False)
+        return f
+
+    def parse_block(self, decl, allow_fields):
+        self.expect('{')
+        while not self.accept('}'):
+            if self.peek().kind == 'eof':
+                self.error('unexpected end of file')
+            self.parse_member(decl, allow_fields)
+
+    def _is_keyword(self, value):
+        # field names can be keywords, e.g. "struct @0 :Int32;"
+        return self.check(value) and not (self.check('@', 1) or
+                                          self.check(':', 1))
+
+    def parse_member(self, parent, allow_fields):
+        tok = self.peek()
+        if self._is_keyword('using'):
+            parent.add(self.parse_using())
+        elif self._is_keyword('struct'):
+            parent.add(self.parse_struct())
+        elif self._is_keyword('enum'):
+            parent.add(self.parse_enum())
+        elif self._is_keyword('const'):
+            parent.add(self.parse_const())
+        elif self._is_keyword('annotation'):
+            parent.add(self.parse_annotation_decl())
+        elif self._is_keyword('interface'):
+            self.error('interfaces are not supported')
+        elif not allow_fields:
+            self.error('unexpected %r' % tok.value)
+        elif self._is_keyword('union'):
+            self.next()
+            union = Decl('union', None, tok.lineno)
+            union.annotations = self.parse_annotation_applications()
+            parent.add(union)
+            self.parse_block(union, allow_fields=True)
+        elif tok.kind == 'name':
+            parent.add(self.parse_field())
+        else:
+            self.error('unexpected %r' % tok.value)
+
+    def parse_optional_id(self):
+        if self.accept('@'):
+            return self.expect_kind('int')
+        return None
+
+    def parse_using(self):
+        lineno = self.next().lineno
+        name = None
+        if not self.check('import'):
+            name = self.expect_kind('name')
+            self.expect('=')
+        import_ = None
+        target = ()
+        if self.accept('import'):
+            import_ = self.expect_kind('string')
+            if self.accept('.'):
+                target = self.parse_dotted_name()
+        else:
+            target = self.parse_dotted_name()
+        if name is None:
+            # using import "foo.capnp".Bar;
+            if not target:
+                self.error('expected a name')
+            name = target[-1]
+        self.expect(';')
+        return Decl('using', name, lineno, import_=import_, target=target)
+
+    def parse_struct(self):
+        lineno = self.next().lineno
+        decl = Decl('struct', self.expect_kind('name'), lineno)
+        if self.check('('):
+            self.error('generic structs are not supported')
+        decl.id = self.parse_optional_id()
+        decl.annotations = self.parse_annotation_applications()
+        self.parse_block(decl, allow_fields=True)
+        return decl
+
+    def parse_field(self):
+        tok = self.next()
+        name = tok.value
+        ordinal = None
+        if self.accept('@'):
+            ordinal = self.expect_kind('int')
+        self.expect(':')
+        if self.check('group') or self.check('union'):
+            if self.check('{', 1) or self.check('$', 1):
+                if ordinal is not None:
+                    self.error('unions and groups with an ordinal are not '
+                               'supported')
+                kind = self.next().value
+                decl = Decl(kind, name, tok.lineno)
+                decl.annotations = self.parse_annotation_applications()
+                self.parse_block(decl, allow_fields=True)
+                return decl
+        if ordinal is None:
+            self.error('missing ordinal for field %s' % name)
+        decl = Decl('field', name, tok.lineno, ordinal=ordinal,
+                    type=self.parse_type(), default=None)
+        if self.accept('='):
+            decl.default = self.parse_value()
+        decl.annotations = self.parse_annotation_applications()
+        self.expect(';')
+        return decl
+
+    def parse_enum(self):
+        lineno = self.next().lineno
+        decl = Decl('enum', self.expect_kind('name'), lineno)
+        decl.id = self.parse_optional_id()
+        decl.annotations = self.parse_annotation_applications()
+        self.expect('{')
+        while not self.accept('}'):
+            tok = self.peek()
+            name = self.expect_kind('name')
+            self.expect('@')
+            enumerant = Decl('enumerant', name, tok.lineno,
+                             ordinal=self.expect_kind('int'))
+            enumerant.annotations = self.parse_annotation_applications()
+            self.expect(';')
+            decl.add(enumerant)
+        return decl
+
+    def parse_const(self):
+        lineno = self.next().lineno
+        decl = Decl('const', self.expect_kind('name'), lineno)
+        decl.id = self.parse_optional_id()
+        self.expect(':')
+        decl.type = self.parse_type()
+        self.expect('=')
+        decl.value = self.parse_value()
+        decl.annotations = self.parse_annotation_applications()
+        self.expect(';')
+        return decl
+
+    def parse_annotation_decl(self):
+        lineno = self.next().lineno
+        decl = Decl('annotation', self.expect_kind('name'), lineno)
+        decl.id = self.parse_optional_id()
+        decl.targets = set()
+        self.expect('(')
+        while True:
+            if self.accept('*'):
+                decl.targets.update(ANNOTATION_TARGETS)
+            else:
+                target = self.expect_kind('name')
+                if target not in ANNOTATION_TARGETS:
+                    self.error('unknown annotation target: %s' % target)
+                decl.targets.add(target)
+            if not self.accept(','):
+                break
+        self.expect(')')
+        self.expect(':')
+        decl.type = self.parse_type()
+        decl.annotations = self.parse_annotation_applications()
+        self.expect(';')
+        return decl
+
+    def parse_annotation_applications(self):
+        result = []
+        while self.check('$'):
+            result.append(self.parse_annotation_application())
+        return result
+
+    def parse_annotation_application(self):
+        tok = self.peek()
+        self.expect('$')
+        name = self.parse_dotted_name()
+        value = None
+        if self.accept('('):
+            value = self.parse_value()
+            self.expect(')')
+        return name, value, tok.lineno
+
+    def parse_dotted_name(self):
+        # a leading dot means that the name is relative to the file scope: in
+        # that case the first item of the result is ''
+        names = []
+        if self.accept('.'):
+            names.append('')
+        names.append(self.expect_kind('name'))
+        while self.accept('.'):
+            names.append(self.expect_kind('name'))
+        return tuple(names)
+
+    def parse_type(self):
+        """
+        Return either ('list', itemtype) or ('name', dotted_name)
+        """
+        if self.check('List') and self.check('(', 1):
+            self.next()
+            self.next()
+            itemtype = self.parse_type()
+            self.expect(')')
+            return ('list', itemtype)
+        name = self.parse_dotted_name()
+        if self.check('('):
+            self.error('generic types are not supported')
+        return ('name', name)
+
+    def parse_value(self):
+        """
+        Return a pair (kind, value), where kind is one of: int, float,
+        string, name
+        """
+        tok = self.peek()
+        if self.accept('-'):
+            kind, value = self.parse_value()
+            if kind == 'name' and value == ('inf',):
+                return 'float', float('-inf')
+            if kind not in ('int', 'float'):
+                self.error('invalid value', tok)
+            return kind, -value
+        elif tok.kind in ('int', 'float', 'string'):
+            self.next()
+            if tok.kind == 'string':
+                # adjacent strings are concatenated
+                parts = [tok.value]
+                while self.peek().kind == 'string':
+                    parts.append(self.next().value)
+                return 'string', ''.join(parts)
+            return tok.kind, tok.value
+        elif tok.kind == 'name' or self.check('.'):
+            return 'name', self.parse_dotted_name()
+        elif tok.kind == 'data':
+            self.error('data literals are not supported', tok)
+        else:
+            self.error('only numbers, strings and names are supported as '
+                       'values, got %r' % tok.value)
+
+
+# ======================================================================
+# Struct layout
+# ======================================================================
+#
+# This is a port of the StructLayout class of
+# capnp/compiler/node-translator.c++: the fields must be placed exactly where
+# capnp would place them, else the messages would not be compatible. Offsets
+# of data fields are expressed in multiples of their size; sizes are
+# expressed as log2 of the number of bits (lg_size).
+
+class HoleSet(object):
+
+    def __init__(self):
+        # holes[lg_size] is the offset of a hole of that size, or 0 if there
+        # is none (a hole can never be at offset 0)
+        self.holes = [0] * 6
+
+    def try_allocate(self, lg_size):
+        if lg_size >= len(self.holes):
+            return None
+        if self.holes[lg_size] != 0:
+            result = self.holes[lg_size]
+            self.holes[lg_size] = 0
+            return result
+        bigger = self.try_allocate(lg_size + 1)
+        if bigger is None:
+            return None
+        result = bigger * 2
+        self.holes[lg_size] = result + 1
+        return result
+
+    def add_holes_at_end(self, lg_size, offset, limit_lg_size=6):
+        while lg_size < limit_lg_size:
+            self.holes[lg_size] = offset
+            lg_size += 1
+            offset = (offset + 1) // 2
+
+    def try_expand(self, old_lg_size, old_offset, expansion_factor):
+        if expansion_factor == 0:
+            return True
+        if old_lg_size >= len(self.holes):
+            return False
+        if self.holes[old_lg_size] != old_offset + 1:
+            return False
+        if self.try_expand(old_lg_size + 1, old_offset >> 1,
+                           expansion_factor - 1):
+            self.holes[old_lg_size] = 0
+            return True
+        return False
+
+    def smallest_at_least(self, lg_size):
+        for i in range(lg_size, len(self.holes)):
+            if self.holes[i] != 0:
+                return i
+        return None
+
+
+class Top(object):
+
+    def __init__(self):
+        self.data_word_count = 0
+        self.pointer_count = 0
+        self.holes = HoleSet()
+
+    def add_data(self, lg_size):
+        hole = self.holes.try_allocate(lg_size)
+        if hole is not None:
+            return hole
+        offset = self.data_word_count << (6 - lg_size)
+        self.data_word_count += 1
+        self.holes.add_holes_at_end(lg_size, offset + 1)
+        return offset
+
+    def try_expand_data(self, old_lg_size, old_offset, expansion_factor):
+        return self.holes.try_expand(old_lg_size, old_offset, expansion_factor)
+
+    def add_pointer(self):
+        result = self.pointer_count
+        self.pointer_count += 1
+        return result
+
+    def add_void(self):
+        pass
+
+
+class DataLocation(object):
+
+    def __init__(self, lg_size, offset):
+        self.lg_size = lg_size
+        self.offset = offset
+
+    def try_expand_to(self, union, new_lg_size):
+        if new_lg_size <= self.lg_size:
+            return True
+        if union.parent.try_expand_data(self.lg_size, self.offset,
+                                        new_lg_size - self.lg_size):
+            self.offset >>= new_lg_size - self.lg_size
+            self.lg_size = new_lg_size
+            return True
+        return False
+
+
+class Union(object):
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.group_count = 0
+        self.discriminant_offset = None
+        self.data_locations = []
+        self.pointer_locations = []
+
+    def add_new_data_location(self, lg_size):
+        offset = self.parent.add_data(lg_size)
+        self.data_locations.append(DataLocation(lg_size, offset))
+        return offset
+
+    def add_new_pointer_location(self):
+        offset = self.parent.add_pointer()
+        self.pointer_locations.append(offset)
+        return offset
+
+    def new_group_adding_first_member(self):
+        self.group_count += 1
+        if self.group_count == 2:
+            self.add_discriminant()
+
+    def add_discriminant(self):
+        if self.discriminant_offset is None:
+            self.discriminant_offset = self.parent.add_data(4)
+            return True
+        return False
+
+
+class DataLocationUsage(object):
+
+    def __init__(self, lg_size=None):
+        self.is_used = lg_size is not None
+        self.lg_size_used = lg_size
+        self.holes = HoleSet()
+
+    def smallest_hole_at_least(self, location, lg_size):
+        if not self.is_used:
+            if lg_size <= location.lg_size:
+                return location.lg_size
+            return None
+        elif lg_size >= self.lg_size_used:
+            if lg_size < location.lg_size:
+                return lg_size
+            return None
+        hole = self.holes.smallest_at_least(lg_size)
+        if hole is not None:
+            return hole
+        if self.lg_size_used < location.lg_size:
+            return self.lg_size_used
+        return None
+
+    def allocate_from_hole(self, location, lg_size):
+        base = location.offset << (location.lg_size - lg_size)
+        if not self.is_used:
+            self.is_used = True
+            self.lg_size_used = lg_size
+            return base
+        elif lg_size >= self.lg_size_used:
+            self.holes.add_holes_at_end(self.lg_size_used, 1, lg_size)
+            self.lg_size_used = lg_size + 1
+            return base + 1
+        hole = self.holes.try_allocate(lg_size)
+        if hole is not None:
+            return base + hole
+        result = 1 << (self.lg_size_used - lg_size)
+        self.holes.add_holes_at_end(lg_size, result + 1, self.lg_size_used)
+        self.lg_size_used += 1
+        return base + result
+
+    def try_allocate_by_expanding(self, group, location, lg_size):
+        # used when allocate_from_hole is not possible: ask the parent to
+        # expand the location, so that the new field fits into it
+        if not self.is_used:
+            if location.try_expand_to(group.parent, lg_size):
+                self.is_used = True
+                self.lg_size_used = lg_size
+                return location.offset << (location.lg_size - lg_size)
+            return None
+        # the location must fit both the current usage and the new field
+        new_lg_size = max(self.lg_size_used, lg_size) + 1
+        if not self.try_expand_usage(group, location, new_lg_size, True):
+            return None
+        result = self.holes.try_allocate(lg_size)
+        return (location.offset << (location.lg_size - lg_size)) + result
+
+    def try_expand_usage(self, group, location, new_lg_size, new_holes):
+        if (new_lg_size > location.lg_size and
+            not location.try_expand_to(group.parent, new_lg_size)):
+            return False
+        if new_holes:
+            self.holes.add_holes_at_end(self.lg_size_used, 1, new_lg_size)
+        self.lg_size_used = new_lg_size
+        return True
+
+    def try_expand(self, group, location, old_lg_size, local_old_offset,
+                   expansion_factor):
+        if local_old_offset == 0 and old_lg_size == self.lg_size_used:
+            return self.try_expand_usage(group, location,
+                                         old_lg_size + expansion_factor, False)
+        return self.holes.try_expand(old_lg_size, local_old_offset,
+                                     expansion_factor)
+
+
+class Group(object):
+
+    def __init__(self, parent):
+        self.parent = parent # a Union
+        self.has_members = False
+        self.parent_data_location_usage = []
+        self.parent_pointer_location_usage = 0
+
+    def add_member(self):
+        if not self.has_members:
+            self.has_members = True
+            self.parent.new_group_adding_first_member()
+
+    def add_data(self, lg_size):
+        self.add_member()
+        locations = self.parent.data_locations
+        best_size = None
+        best_location = None
+        for i, location in enumerate(locations):
+            if len(self.parent_data_location_usage) == i:
+                self.parent_data_location_usage.append(DataLocationUsage())
+            usage = self.parent_data_location_usage[i]
+            hole = usage.smallest_hole_at_least(location, lg_size)
+            if hole is not None and (best_size is None or hole < best_size):
+                best_size = hole
+                best_location = i
+        if best_location is not None:
+            usage = self.parent_data_location_usage[best_location]
+            return usage.allocate_from_hole(locations[best_location], lg_size)
+        #
+        # there are no holes big enough: before asking the parent for a new
+        # location, try to expand one of the existing ones
+        for i, usage in enumerate(self.parent_data_location_usage):
+            result = usage.try_allocate_by_expanding(self, locations[i],
+                                                     lg_size)
+            if result is not None:
+                return result
+        self.parent_data_location_usage.append(DataLocationUsage(lg_size))
+        return self.parent.add_new_data_location(lg_size)
+
+    def try_expand_data(self, old_lg_size, old_offset, expansion_factor):
+        if (old_lg_size + expansion_factor > 6 or
+            (old_offset & ((1 << expansion_factor) - 1)) != 0):
+            return False
+        for i, usage in enumerate(self.parent_data_location_usage):
+            location = self.parent.data_locations[i]
+            if (location.lg_size >= old_lg_size and
+                old_offset >> (location.lg_size - old_lg_size) == location.offset):
+                local_old_offset = old_offset - (location.offset <<
+                                                 (location.lg_size - old_lg_size))
+                return usage.try_expand(self, location, old_lg_size,
+                                        local_old_offset, expansion_factor)
+        assert False, 'Tried to expand field that was never allocated'
+
+    def add_pointer(self):
+        self.add_member()
+        locations = self.parent.pointer_locations
+        if self.parent_pointer_location_usage < len(locations):
+            result = locations[self.parent_pointer_location_usage]
+            self.parent_pointer_location_usage += 1
+            return result
+        self.parent_pointer_location_usage += 1
+        return self.parent.add_new_pointer_location()
+
+    def add_void(self):
+        self.add_member()
+        self.parent.parent.add_void()
+
+
+# ======================================================================
+# Translation to CodeGeneratorRequest
+# ======================================================================
+
+class Scope(object):
+    """
+    The information needed to build the node of a struct or a group
+    """
+
+    def __init__(self, decl, id, displayname, layout, is_group):
+        self.decl = decl
+        self.id = id
+        self.displayname = displayname
+        self.layout = layout   # the layout where the data fields are allocated
+        self.is_group = is_group
+        self.fields = []       # list of FieldInfo
+        self.next_code_order = 0
+        self.union = None      # Union layout, if it has an unnamed union
+        self.union_fields = [] # the FieldInfos of the members of the union
+        self.groups = []       # child Scopes
+
+    def get_code_order(self):
+        result = self.next_code_order
+        self.next_code_order += 1
+        return result
+
+
+class FieldInfo(object):
+
+    def __init__(self, decl, code_order, discriminant, layout, group=None):
+        self.decl = decl
+        self.code_order = code_order
+        self.discriminant = discriminant
+        self.layout = layout
+        self.group = group     # the Scope, for groups and named unions
+        self.offset = 0
+
+    def get_ordinal(self):
+        if self.group is None:
+            return self.decl.ordinal
+        return min(f.get_ordinal() for f in self.group.fields)
+
+
+class SchemaLoader(object):
+
+    def __init__(self, path):
+        self.path = [py.path.local(dirname) for dirname in path]
+        self.files = {} # filename -> file Decl
+
+    def load(self, filename):
+        # like capnp, we use the filename as given for the main file
+        mainfile = self.load_file(py.path.local(filename), str(filename))
+        self.used_files = set()
+        self.pending_files = [mainfile]
+        while self.pending_files:
+            f = self.pending_files.pop()
+            if f in self.used_files:
+                continue
+            self.used_files.add(f)
+            self.translate_file(f)
+        #
+        # the nodes of the imported files come first, like in capnp
+        nodes = []
+        for f in self.files_in_order(mainfile, [], set()):
+            if f in self.used_files:
+                nodes += f.nodes
+        imports = []
+        for name, imported in self.get_imports(mainfile):
+            imports.append(schema.CodeGeneratorRequest_RequestedFile_Import(
+                id=imported.id, name=name))
+        requested = schema.CodeGeneratorRequest_RequestedFile(
+            id=mainfile.id, filename=mainfile.displayname, imports=imports)
+        return schema.CodeGeneratorRequest(nodes=nodes,
+                                           requestedFiles=[requested])
+
+    def files_in_order(self, f, result, seen):
+        # each file comes after the files it imports
+        seen.add(f)
+        for name, imported in self.get_imports(f):
+            if imported not in seen:
+                self.files_in_order(imported, result, seen)
+        result.append(f)
+        return result
+
+    def get_imports(self, f):
+        result = []
+        for decl in self.iter_decls(f):
+            if decl.kind == 'using' and decl.import_ is not None:
+                if decl.import_ not in [name for name, _ in result]:
+                    imported = self.resolve_import(f, decl.import_, decl)
+                    result.append((decl.import_, imported))
+        return result
+
+    def error(self, decl, msg):
+        f = decl.get_file()
+        raise CompilerError('%s:%d: %s' % (f.filename, decl.lineno, msg))
+
+    # loading files and imports
+    # --------------------------
+
+    def load_file(self, filename, displayname):
+        try:
+            return self.files[filename]
+        except KeyError:
+            pass
+        src = filename.read()
+        f = Parser(str(filename), src).parse_file()
+        if f.id is None:
+            raise CompilerError('%s: file does not declare an ID' % filename)
+        f.filename = filename
+        f.displayname = displayname
+        self.files[filename] = f
+        self.assign_ids(f, f.id)
+        return f
+
+    def resolve_import(self, f, name, decl):
+        if name.startswith('/'):
+            displayname = name[1:]
+            dirs = self.path + [py.path.local(d) for d in STANDARD_IMPORT_DIRS]
+            for dirpath in dirs:
+                filename = dirpath.join(displayname)
+                if filename.check(file=True):
+                    break
+            else:
+                self.error(decl, 'import failed: %s' % name)
+        else:
+            displayname = os.path.normpath(
+                os.path.join(os.path.dirname(f.displayname), name))
+            filename = f.filename.dirpath().join(name)
+            if not filename.check(file=True):
+                self.error(decl, 'import failed: %s' % name)
+        return self.load_file(filename, displayname)
+
+    def iter_decls(self, decl):
+        for member in decl.members:
+            yield member
+            for sub in self.iter_decls(member):
+                yield sub
+
+    def assign_ids(self, decl, parent_id):
+        for member in decl.members:
+            if member.kind in ('struct', 'enum', 'const', 'annotation'):
+                if member.id is None:
+                    member.id = child_id(parent_id, member.name)
+                self.assign_ids(member, member.id)
+
+    # name resolution
+    # ----------------
+
+    def lookup(self, scope, dotted, where=None):
+        """
+        Resolve a dotted name used inside the declaration ``scope``, and
+        return the corresponding Decl, or a ('builtin', name) tuple. Errors
+        are reported at the line of ``where``, or of ``scope``.
+        """
+        where = where or scope
+        first = dotted[0]
+        decl = scope
+        if first == '':
+            decl = scope.get_file()
+            dotted = dotted[1:]
+            first = dotted[0]
+        result = None
+        while decl is not None:
+            result = self._find_member(decl, first)
+            if result is not None:
+                break
+            decl = decl.parent
+        if result is None:
+            if len(dotted) == 1 and first in BUILTIN_TYPES:
+                return ('builtin', first)
+            self.error(where, 'unknown name: %s' % '.'.join(dotted))
+        for name in dotted[1:]:
+            member = self._find_member(result, name)
+            if member is None:
+                self.error(where, 'unknown name: %s' % '.'.join(dotted))
+            result = member
+        return result
+
+    def _find_member(self, decl, name):
+        if decl.kind == 'enum':
+            return None
+        for member in decl.members:
+            if member.name != name:
+                continue
+            if member.kind == 'using':
+                return self._resolve_using(member)
+            if member.kind in ('struct', 'enum', 'const', 'annotation'):
+                return member
+        return None
+
+    def _resolve_using(self, decl):
+        if decl.import_ is not None:
+            target = self.resolve_import(decl.get_file(), decl.import_, decl)
+            for name in decl.target:
+                target = self._find_member(target, name)
+                if target is None:
+                    self.error(decl, 'unknown name: %s' % '.'.join(decl.target))
+            return target
+        target = self.lookup(decl.parent, decl.target)
+        if isinstance(target, tuple):
+            self.error(decl, 'aliases of builtin types are not supported')
+        return target
+
+    def use(self, decl):
+        """
+        Record that decl is referenced: the file which contains it must be
+        included in the request
+        """
+        f = decl.get_file()
+        if f not in self.used_files:
+            self.pending_files.append(f)
+
+    # types and values
+    # -----------------
+
+    def resolve_type(self, scope, t, where=None):
+        """
+        Return a pair (kind, target), where target is the Decl of the
+        struct or enum, or the item type for lists
+        """
+        if t[0] == 'list':
+            return 'list', self.resolve_type(scope, t[1], where)
+        target = self.lookup(scope, t[1], where)
+        if isinstance(target, tuple):
+            kind, lg_size = BUILTIN_TYPES[target[1]]
+            return kind, None
+        if target.kind not in ('struct', 'enum'):
+            self.error(where, '%s is not a type' % '.'.join(t[1]))
+        self.use(target)
+        return target.kind, target
+
+    def lg_size(self, rtype):
+        # log2 of the size in bits, or None for pointers
+        kind, target = rtype
+        if kind == 'enum':
+            return 4
+        return LG_SIZES.get(kind)
+
+    def make_type(self, rtype):
+        kind, target = rtype
+        if kind == 'list':
+            return schema.Type.new_list(list=(self.make_type(target),))
+        elif kind == 'struct':
+            return schema.Type.new_struct(struct=(target.id, None))
+        elif kind == 'enum':
+            return schema.Type.new_enum(enum=(target.id, None))
+        elif kind == 'anyPointer':
+            return schema.Type.new_anyPointer(
+                anyPointer=(None, undefined, undefined))
+        return getattr(schema.Type, 'new_' + kind)()
+
+    def make_value(self, scope, rtype, value, where=None):
+        """
+        Return the schema.Value of the given type. If value is None, return
+        the default value for the type.
+        """
+        where = where or scope
+        kind, target = rtype
+        if value is not None and value[0] == 'name' and kind != 'enum':
+            name = value[1]
+            if name == ('true',) or name == ('false',):
+                pass
+            elif name in [('inf',), ('nan',)] and kind in ('float32',
+                                                             'float64'):
+                value = ('float', float(name[0]))
+            elif name != ('void',):
+                # a reference to a constant
+                const = self.lookup(scope, name, where)
+                if isinstance(const, tuple) or const.kind != 'const':
+                    self.error(where, '%s is not a constant' % '.'.join(name))
+                self.use(const)
+                return self.make_value(const.parent, rtype, const.value, const)
+        #
+        if kind == 'void':
+            self._check_value(where, value, 'name', ('void',))
+            return schema.Value.new_void()
+        elif kind == 'bool':
+            if value is None:
+                return schema.Value.new_bool(False)
+            if value not in [('name', ('true',)), ('name', ('false',))]:
+                self.error(where, 'expected a boolean value')
+            return schema.Value.new_bool(value[1] == ('true',))
+        elif kind in INT_RANGES:
+            if value is None:
+                return getattr(schema.Value, 'new_' + kind)(0)
+            self._check_value(where, value, 'int')
+            lo, hi = INT_RANGES[kind]
+            if not lo <= value[1] <= hi:
+                self.error(where, 'integer value out of range: %s' % value[1])
+            return getattr(schema.Value, 'new_' + kind)(value[1])
+        elif kind in ('float32', 'float64'):
+            if value is None:
+                return getattr(schema.Value, 'new_' + kind)(0.0)
+            if value[0] not in ('int', 'float'):
+                self.error(where, 'expected a number')
+            return getattr(schema.Value, 'new_' + kind)(float(value[1]))
+        elif kind in ('text', 'data'):
+            if value is None:
+                return getattr(schema.Value, 'new_' + kind)(None)
+            self._check_value(where, value, 'string')
+            return getattr(schema.Value, 'new_' + kind)(value[1])
+        elif kind == 'enum':
+            if value is None:
+                return schema.Value.new_enum(0)
+            if value[0] != 'name' or len(value[1]) != 1:
+                self.error(where, 'expected an enumerant of %s' % target.name)
+            for enumerant in target.members:
+                if enumerant.name == value[1][0]:
+                    return schema.Value.new_enum(enumerant.ordinal)
+            self.error(where, '%s has no enumerant %s' % (target.name,
+                                                          value[1][0]))
+        else:
+            if value is not None:
+                self.error(where, 'default values for %s are not supported'
+                           % kind)
+            # the generated Value.new_struct & co. cannot build pointers, but
+            # we only need a null one
+            tag = getattr(schema.Value.__tag__, kind)
+            buf = struct.pack('<H', tag) + '\x00' * 22
+            return schema.Value.from_buffer(buf, 0, 2, 1)
+
+    def _check_value(self, where, value, kind, expected=None):
+        if value is None:
+            return
+        if value[0] != kind or (expected is not None and value[1] != expected):
+            self.error(where, 'invalid value: %s' % (value[1],))
+
+    def make_annotations(self, scope, applications):
+        result = []
+        for name, value, lineno in applications:
+            ann = self.lookup(scope, name)
+            if isinstance(ann, tuple) or ann.kind != 'annotation':
+                self.error(scope, '%s is not an annotation' % '.'.join(name))
+            self.use(ann)
+            rtype = self.resolve_type(ann.parent, ann.type)
+            if value is None and rtype[0] == 'void':
+                value = ('name', ('void',))
+            result.append(schema.Annotation(
+                id=ann.id,
+                value=self.make_value(scope, rtype, value),
+                brand=None))
+        return result or None
+
+    # nodes
+    # ------
+
+    def translate_file(self, f):
+        f.nodes = []
+        node = schema.Node.new_file(
+            id=f.id,
+            displayName=f.displayname,
+            displayNamePrefixLength=self._prefix_length(f.displayname),
+            scopeId=0,
+            nestedNodes=self.make_nested_nodes(f),
+            annotations=self.make_annotations(f, f.annotations))
+        f.nodes.append(node)
+        for member in f.members:
+            self.translate_decl(f, member, f.displayname + ':')
+
+    def _prefix_length(self, displayname):
+        return max(displayname.rfind('.'), displayname.rfind(':')) + 1
+
+    def make_nested_nodes(self, decl):
+        return [schema.Node_NestedNode(name=member.name, id=member.id)
+                for member in decl.members
+                if member.kind in ('struct', 'enum', 'const', 'annotation')]
+
+    def translate_decl(self, f, decl, prefix):
+        displayname = prefix + decl.name if decl.name is not None else None
+        kwds = dict(id=decl.id,
+                    displayName=displayname,
+                    displayNamePrefixLength=len(prefix),
+                    scopeId=decl.parent.id,
+                    nestedNodes=self.make_nested_nodes(decl))
+        if decl.kind == 'struct':
+            self.translate_struct(f, decl, kwds)
+        elif decl.kind == 'enum':
+            kwds['annotations'] = self.make_annotations(decl, decl.annotations)
+            enumerants = []
+            for i, enumerant in enumerate(decl.members):
+                enumerants.append((enumerant.ordinal, schema.Enumerant(
+                    name=enumerant.name,
+                    codeOrder=i,
+                    annotations=self.make_annotations(decl,
+                                                      enumerant.annotations))))
+            self._check_ordinals(decl, [o for o, _ in enumerants])
+            enumerants.sort(key=lambda x: x[0])
+            f.nodes.append(schema.Node.new_enum(
+                enum=([e for _, e in enumerants],), **kwds))
+        elif decl.kind == 'const':
+            kwds['annotations'] = self.make_annotations(decl, decl.annotations)
+            rtype = self.resolve_type(decl.parent, decl.type, decl)
+            f.nodes.append(schema.Node.new_const(
+                const=(self.make_type(rtype),
+                       self.make_value(decl.parent, rtype, decl.value, decl)),
+                **kwds))
+        elif decl.kind == 'annotation':
+            kwds['annotations'] = self.make_annotations(decl, decl.annotations)
+            rtype = self.resolve_type(decl.parent, decl.type, decl)
+            targets = tuple(target in decl.targets
+                            for target in ANNOTATION_TARGETS)
+            f.nodes.append(schema.Node.new_annotation(
+                annotation=(self.make_type(rtype),) + targets, **kwds))
+
+    def _check_ordinals(self, decl, ordinals):
+        ordinals = sorted(ordinals)
+        for i, ordinal in enumerate(ordinals):
+            if ordinal != i:
+                if i > 0 and ordinal == ordinals[i-1]:
+                    self.error(decl, 'duplicate ordinal: @%d' % ordinal)
+                self.error(decl, 'skipped ordinal: @%d' % i)
+
+    def translate_struct(self, f, decl, kwds):
+        top = Top()
+        scope = Scope(decl, decl.id, kwds['displayName'], top, is_group=False)
+        all_fields = []
+        self.collect_fields(scope, decl, scope.layout, None, all_fields)
+        #
+        # allocate the fields in ordinal order, as capnp does
+        self._check_ordinals(decl, [info.decl.ordinal for info in all_fields])
+        all_fields.sort(key=lambda info: info.decl.ordinal)
+        for info in all_fields:
+            rtype = info.rtype
+            lg_size = self.lg_size(rtype)
+            if rtype[0] == 'void':
+                info.layout.add_void()
+            elif lg_size is None:
+                info.offset = info.layout.add_pointer()
+            else:
+                info.offset = info.layout.add_data(lg_size)
+        #
+        self.assign_group_ids(scope)
+        self.assign_discriminants(scope)
+        nodes = [self.make_struct_node(scope, top, kwds)]
+        self.make_group_nodes(scope, top, nodes)
+        f.nodes.append(nodes[0])
+        # nested declarations come before the groups
+        for member in decl.members:
+            self.translate_decl(f, member, kwds['displayName'] + '.')
+        f.nodes.extend(nodes[1:])
+
+    def collect_fields(self, scope, decl, layout, union, all_fields):
+        """
+        Collect the fields of decl (a struct, group or union) into
+        scope, in code order
+        """
+        for member in decl.members:
+            if member.kind == 'field':
+                field_layout = layout
+                if union is not None:
+                    # each member of a union is implicitly a group
+                    field_layout = Group(union)
+                info = FieldInfo(member, scope.get_code_order(), NO_DISCRIMINANT,
+                                 field_layout)
+                info.rtype = self.resolve_type(member.parent, member.type, member)
+                scope.fields.append(info)
+                if union is not None:
+                    scope.union_fields.append(info)
+                all_fields.append(info)
+            elif member.kind == 'union' and member.name is None:
+                if union is not None or scope.union is not None:
+                    self.error(member, 'a struct or group can contain only '
+                               'one unnamed union')
+                scope.union = Union(layout)
+                self.collect_fields(scope, member, None, scope.union,
+                                    all_fields)
+            elif member.kind in ('group', 'union'):
+                code_order = scope.get_code_order()
+                group_layout = layout
+                if union is not None:
+                    group_layout = Group(union)
+                group = Scope(member, None,
+                              '%s.%s' % (scope.displayname, member.name),
+                              group_layout, is_group=True)
+                scope.groups.append(group)
+                info = FieldInfo(member, code_order, NO_DISCRIMINANT,
+                                 group_layout, group)
+                scope.fields.append(info)
+                if union is not None:
+                    scope.union_fields.append(info)
+                if member.kind == 'group':
+                    self.collect_fields(group, member, group_layout, None,
+                                        all_fields)
+                else:
+                    group.union = Union(group_layout)
+                    self.collect_fields(group, member, None, group.union,
+                                        all_fields)
+                if not group.fields:
+                    self.error(member, 'groups and unions cannot be empty')
+
+    def assign_group_ids(self, scope):
+        # the id of a group depends on its index in the list of fields of the
+        # parent, which is sorted by ordinal
+        fields = sorted(scope.fields, key=FieldInfo.get_ordinal)
+        for index, info in enumerate(fields):
+            if info.group is not None:
+                info.group.id = group_id(scope.id, index)
+                self.assign_group_ids(info.group)
+
+    def assign_discriminants(self, scope):
+        # like capnp, the discriminants are assigned in ordinal order: a
+        # group gets the smallest ordinal of its members
+        fields = sorted(scope.union_fields, key=FieldInfo.get_ordinal)
+        for discriminant, info in enumerate(fields):
+            info.discriminant = discriminant
+        for group in scope.groups:
+            self.assign_discriminants(group)
+
+    def make_struct_node(self, scope, top, kwds):
+        discriminant_count = 0
+        discriminant_offset = 0
+        if scope.union is not None:
+            discriminant_count = len(scope.union_fields)
+            if discriminant_count < 2:
+                self.error(scope.decl, 'unions must have at least two members')
+            discriminant_offset = scope.union.discriminant_offset
+        fields = []
+        for info in sorted(scope.fields, key=FieldInfo.get_ordinal):
+            decl = info.decl
+            common = dict(name=decl.name,
+                          codeOrder=info.code_order,
+                          annotations=self.make_annotations(decl.parent,
+                                                            decl.annotations),
+                          discriminantValue=info.discriminant)
+            if info.group is not None:
+                fields.append(schema.Field.new_group(
+                    group=(info.group.id,),
+                    ordinal=(None, undefined),
+                    **common))
+            else:
+                rtype = info.rtype
+                fields.append(schema.Field.new_slot(
+                    slot=(info.offset,
+                          self.make_type(rtype),
+                          self.make_value(decl.parent, rtype, decl.default,
+                                          decl),
+                          decl.default is not None),
+                    ordinal=(undefined, decl.ordinal),
+                    **common))
+        kwds = dict(kwds)
+        if scope.is_group:
+            # the annotations of groups are attached to the field
+            kwds['annotations'] = None
+        else:
+            kwds['annotations'] = self.make_annotations(scope.decl.parent,
+                                                        scope.decl.annotations)
+        return schema.Node.new_struct(
+            struct=(top.data_word_count,
+                    top.pointer_count,
+                    schema.ElementSize.inlineComposite,
+                    scope.is_group,
+                    discriminant_count,
+                    discriminant_offset,
+                    fields or None),
+            **kwds)
+
+    def make_group_nodes(self, scope, top, nodes):
+        # like capnp, the groups are emitted in ordinal order
+        fields = sorted(scope.fields, key=FieldInfo.get_ordinal)
+        for group in [info.group for info in fields if info.group is not None]:
+            displayname = group.displayname
+            kwds = dict(id=group.id,
+                        displayName=displayname,
+                        displayNamePrefixLength=self._prefix_length(displayname),
+                        scopeId=scope.id,
+                        nestedNodes=None)
+            nodes.append(self.make_struct_node(group, top, kwds))
+            self.make_group_nodes(group, top, nodes)
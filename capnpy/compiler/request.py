@@ -22,19 +22,7 @@ class RequestedFile:
     def emit(self, m):
         m.modname = py.path.local(self.filename).purebasename
         m.tmpname = '%s_tmp' % m.modname
-        m.code.global_scope.extname = '%s_extended' % m.modname
-        #
-        # some lines need to be different when in pyx mode: here we define
-        # some global kwarg which are "turned off" when in pure python mode
-        if m.pyx:
-            # pyx mode
-            m.code.global_scope.cimport = 'cimport'
-            m.code.global_scope.cpdef = 'cpdef'
-            m.code.global_scope.__dict__['cdef class'] = 'cdef class'
-        else:
-            m.code.global_scope.cimport = 'import'
-            m.code.global_scope.cpdef = 'def'
-            m.code.global_scope.__dict__['cdef class'] = 'class'
+        self.setup_global_scope(m)
         #
         filenode = m.allnodes[self.id]
         assert filenode.is_file()
@@ -62,6 +50,9 @@ class RequestedFile:
         m.w("from capnpy.util import float32_repr as _float32_repr")
         m.w("from capnpy.util import float64_repr as _float64_repr")
         m.w("from capnpy.util import extend_module_maybe as _extend_module_maybe")
+        m.w("from capnpy import json as _json")
+        m.w("from capnpy.layout import FieldLayout as _FieldLayout")
+        m.w("from capnpy.layout import make_layout as _make_layout")
         #
         if m.pyx:
             m.w("from capnpy cimport _hash")
@@ -79,6 +70,11 @@ class RequestedFile:
         # visit the children in two passes: first the declaration, then the
         # definition
         children = m.children[filenode.id]
+        if m.lazy:
+            # top-level structs are emitted only when they are first accessed,
+            # see ModuleGenerator.generate_lazy
+            children = [child for child in children
+                        if not m.register_lazy(child)]
         m.w("#### FORWARD DECLARATIONS ####")
         m.w()
         for child in children:
@@ -93,10 +89,29 @@ class RequestedFile:
             child.emit_reference_as_child(m)
         #
         m.w()
+        if m.lazy:
+            # the extension module can reference any class: LazyModule applies
+            # it only after all of them have been emitted
+            return
         if m.standalone:
             m.w('_extend_module_maybe(globals(), modname=__name__)')
         else:
-            m.w('_extend_module_maybe(globals(), filename=__schema__)')
+            m.w('__compiler._extend_module_maybe(globals(), __schema__)')
+
+    def setup_global_scope(self, m):
+        m.code.global_scope.extname = '%s_extended' % m.modname
+        #
+        # some lines need to be different when in pyx mode: here we define
+        # some global kwarg which are "turned off" when in pure python mode
+        if m.pyx:
+            # pyx mode
+            m.code.global_scope.cimport = 'cimport'
+            m.code.global_scope.cpdef = 'cpdef'
+            m.code.global_scope.__dict__['cdef class'] = 'cdef class'
+        else:
+            m.code.global_scope.cimport = 'import'
+            m.code.global_scope.cpdef = 'def'
+            m.code.global_scope.__dict__['cdef class'] = 'class'
 
     def _declare_imports(self, m):
         for imp in self.imports:
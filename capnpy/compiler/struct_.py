@@ -13,6 +13,15 @@ except ImportError:
 class Node__Struct:
 
     def emit_declaration(self, m):
+        # propagate $Py.cache to all the groups. We need to do it before
+        # emitting the children, to reach also the groups nested inside groups
+        ann = m.has_annotation(self, annotate.cache)
+        if ann:
+            for field in self.struct.fields or []:
+                if field.is_group():
+                    groupnode = m.allnodes[field.group.typeId]
+                    m.register_extra_annotation(groupnode, ann)
+        #
         children = m.children[self.id]
         for child in children:
             child.emit_declaration(m)
@@ -47,6 +56,8 @@ class Node__Struct:
         ns.dotname = self.runtime_name(m)
         ns.data_size = self.struct.dataWordCount
         ns.ptrs_size = self.struct.pointerCount
+        ns.field_names = 'frozenset(%r)' % [m._field_name(f)
+                                            for f in self.struct.fields or []]
         #
         if not m.pyx:
             # use the @extend decorator only in Pure Python mode: in pyx mode
@@ -60,29 +71,70 @@ class Node__Struct:
                 __static_ptrs_size__ = {ptrs_size}
 
             """)
+            self._emit_layout(m)
             for child in m.children[self.id]:
                 child.emit_reference_as_child(m)
             m.w()
             if self.struct.discriminantCount:
                 self._emit_union_tag(m)
             if self.struct.fields is not None:
+                self._emit_cache_slots(m)
                 for field in self.struct.fields:
                     field.emit(m, self)
                 self._emit_ctors(m)
             self._emit_repr(m)
+            self._emit_to_pyobj(m, as_dict=True)
+            self._emit_to_pyobj(m, as_dict=False)
+            self._emit_dump_json(m)
             self._emit_key_maybe(m)
         ns.w()
         if m.pyx:
             ns.w("cdef _StructItemType _{name}_list_item_type = _StructItemType({name})")
+            ns.w("cdef frozenset _{name}_field_names = {field_names}")
         else:
             ns.w("_{name}_list_item_type = _StructItemType({name})")
+            ns.w("_{name}_field_names = {field_names}")
         ns.w()
 
+    def _emit_layout(self, m):
+        # see capnpy/layout.py
+        fields = self.struct.fields or []
+        with m.block('_layout = _make_layout(', autopass=False):
+            for field in fields:
+                m.w(field.layout_expr(m) + ',')
+        m.w(')')
+        m.w()
+
     def emit_reference_as_child(self, m):
         if self.is_nested(m) and not self.struct.isGroup:
             m.w('{shortname} = {name}', shortname=self.shortname(m),
                 name=self.compile_name(m))
 
+    def _emit_cache_slots(self, m):
+        # declare the per-instance slots used by the fields marked as
+        # $Py.cache, and a _reset_cache() method to clear them when a
+        # StructCursor moves the object to another item
+        cached = [f for f in self.struct.fields if f.is_cached(m, self)]
+        if not cached:
+            return
+        ns = m.code.new_scope()
+        slots = []
+        for field in cached:
+            name = m._field_name(field)
+            if field.is_group() and field.is_nullable(m):
+                name = '_' + name
+            ns.slot = '_cache_' + name
+            if m.pyx:
+                ns.w('cdef object {slot}')
+            else:
+                ns.w('{slot} = None')
+            slots.append(ns.slot)
+        ns.w()
+        with ns.block('{cpdef} _reset_cache(self):'):
+            for slot in slots:
+                ns.w('self.{slot} = None', slot=slot)
+        ns.w()
+
     def _emit_union_tag(self, m):
         # union tags are 16 bits, so *2
         ns = m.code.new_scope()
@@ -95,13 +147,17 @@ class Node__Struct:
         ns.w("__tag_offset__ = {tag_offset}")
         m.declare_enum('__tag__', enum_name, enum_items)
         ns.w()
+        if m.segment_reads:
+            ns.read_tag = m.segment_read('read_int16', ns.tag_offset)
+        else:
+            ns.read_tag = ns.format('self._read_data_int16({tag_offset})')
         if m.pyx:
             # generate a specialized version of __which__, which does not need to
             # do a lookup for __tag_offset__. Not needed on PyPy because the
             # default __which__() implemented in struct_.py is already fast
             ns.ww("""
                 cpdef long __which__(self) except -1:
-                    return self._read_data_int16({tag_offset})
+                    return {read_tag}
             """)
             ns.w()
         #
@@ -110,7 +166,7 @@ class Node__Struct:
             ns.i = i
             ns.ww("""
                 def is_{item}(self):
-                    return self._read_data_int16({tag_offset}) == {i}
+                    return ({read_tag}) == {i}
             """)
         ns.w()
 
@@ -122,6 +178,7 @@ class Node__Struct:
         ns.ptrs_size = self.struct.pointerCount
         self._emit_init(m, ns)
         self._emit_ctors_union(m, ns)
+        self._emit_from_dict(m, ns)
 
     def _emit_init(self, m, ns):
         ctor = Structor(m, self.struct, self.struct.fields)
@@ -169,6 +226,89 @@ class Node__Struct:
             ns.w('return cls.from_buffer(buf, 0, {data_size}, {ptrs_size})')
         ns.w()
 
+    def _emit_from_dict(self, m, ns):
+        # @staticmethod
+        # def _write_dict(builder, d):
+        #     if not _Point_field_names.issuperset(d):
+        #         raise TypeError(...)
+        #     x = d.get('x', 0)
+        #     y = d.get('y', 0)
+        #     builder.set(ord('q'), 0, x)
+        #     builder.set(ord('q'), 8, y)
+        #
+        # @staticmethod
+        # def _buf_from_dict(d):
+        #     builder = _Builder.__new__(_Builder)
+        #     builder._init(2, 0)
+        #     Point._write_dict(builder, d)
+        #     return builder.build()
+        #
+        # @classmethod
+        # def from_dict(cls, d):
+        #     buf = Point._buf_from_dict(d)
+        #     return cls.from_buffer(buf, 0, 2, 0)
+        #
+        # _write_dict is also called by the builder to write struct fields
+        # and list items given as dicts directly into its buffer, so that
+        # nested structs do not need to be built separately
+        tree = FieldTree(m, self.struct)
+        ns.clsname = self.compile_name(m)
+        ns.builder = '_Builder builder' if m.pyx else 'builder'
+        ns.w('@staticmethod')
+        with ns.block('def _write_dict({builder}, d):') as ns2:
+            self._emit_check_field_names(m, ns2, self, 'd')
+            for node in tree.children:
+                self._emit_node_from_dict(m, ns2, node, 'd')
+            ctor = Structor(m, self.struct, self.struct.fields)
+            ctor.emit_fields()
+        ns.w()
+        ns.w('@staticmethod')
+        with ns.block('def _buf_from_dict(d):') as ns2:
+            ns2.cdef_var('_Builder', 'builder')
+            ns2.w('builder = _Builder.__new__(_Builder)')
+            ns2.w('builder._init({data_size}, {ptrs_size})')
+            ns2.w('{clsname}._write_dict(builder, d)')
+            ns2.w('return builder.build()')
+        ns.w()
+        ns.w('@classmethod')
+        with ns.block('def from_dict(cls, d):') as ns2:
+            ns2.w('buf = {clsname}._buf_from_dict(d)')
+            ns2.w('return cls.from_buffer(buf, 0, {data_size}, {ptrs_size})')
+        ns.w()
+
+    def _emit_check_field_names(self, m, ns, node, d):
+        ns.field_names = '_%s_field_names' % node.compile_name(m)
+        ns.d = d
+        ns.ww("""
+            if not {field_names}.issuperset({d}):
+                raise TypeError("Unknown field(s) for {dotname}: %s" %
+                                ", ".join(sorted(set({d}) - {field_names})))
+        """, dotname=node.runtime_name(m))
+
+    def _emit_node_from_dict(self, m, ns, node, d):
+        ns = ns.new_scope()
+        ns.d = d
+        ns.var = node.varname
+        ns.key = m._field_name(node.f)
+        if node.f.is_group() and not node.f.is_nullable(m):
+            # groups are passed to __new as tuples
+            ns.g = '_g_' + node.varname
+            ns.default_ = node.default
+            ns.w('{g} = {d}.get({key!r})')
+            with ns.block('if {g} is None:'):
+                ns.w('{var} = {default_}')
+            with ns.block('else:') as ns2:
+                groupnode = m.allnodes[node.f.group.typeId]
+                self._emit_check_field_names(m, ns2, groupnode, ns.g)
+                for child in node.children:
+                    self._emit_node_from_dict(m, ns2, child, ns.g)
+                ns.items = ''.join(child.varname + ', ' for child in node.children)
+                ns.w('{var} = ({items})')
+        else:
+            # nullable groups are passed as value or None
+            ns.default_ = 'None' if node.f.is_group() else node.default
+            ns.w('{var} = {d}.get({key!r}, {default_})')
+
     def _emit_repr(self, m):
         # def shortrepr(self):
         #     parts = []
@@ -205,6 +345,114 @@ class Node__Struct:
                     ns.w("{append}")
             ns.w('return "(%s)" % ", ".join(parts)')
 
+    def _emit_to_pyobj(self, m, as_dict):
+        # def to_dict(self):
+        #     tag = self.__which__()
+        #     d = {}
+        #     d['x'] = self._read_data(0, ord('q'))
+        #     if tag == 1: d['circle'] = self._read_data(8, ord('q'))
+        #     return d
+        #
+        # to_tuple() is the same, but it returns all the fields (None for the
+        # fields of the union which are not set)
+        fields = [f for f in self.struct.fields or []
+                  if not (f.is_slot() and f.slot.type.is_anyPointer())]
+        name = 'to_dict' if as_dict else 'to_tuple'
+        with m.block('{cpdef} %s(self):' % name) as ns:
+            if self.struct.discriminantCount:
+                if m.pyx:
+                    ns.w('cdef long tag = self.__which__()')
+                else:
+                    ns.w('tag = self.__which__()')
+            items = []
+            for f in fields:
+                ns.fname = m._field_name(f)
+                if f.is_group() and f.is_nullable(m):
+                    _, f_is_null, f_value = f.is_nullable(m).check(m)
+                    ns.g = 'g_' + ns.fname
+                    ns.groupcls = m.allnodes[f.group.typeId].compile_name(m)
+                    ns.w('{g} = self._read_group({groupcls})')
+                    value = f_value._pyobj_expr(m, ns.g, as_dict)
+                    expr = '(None if %s.%s else %s)' % (ns.g,
+                                                        m._field_name(f_is_null),
+                                                        value)
+                else:
+                    expr = f._pyobj_expr(m, 'self', as_dict)
+                items.append((f, ns.fname, expr))
+            #
+            if as_dict:
+                ns.w('d = {{}}')
+                for f, fname, expr in items:
+                    line = ns.format('d[{key!r}] = {expr}', key=fname, expr=expr)
+                    if f.is_part_of_union():
+                        line = 'if tag == %s: %s' % (f.discriminantValue, line)
+                    ns.w(line)
+                ns.w('return d')
+            else:
+                exprs = []
+                for f, fname, expr in items:
+                    if f.is_part_of_union():
+                        expr = '(%s if tag == %s else None)' % (expr,
+                                                                f.discriminantValue)
+                    exprs.append(expr)
+                ns.w('return (')
+                for expr in exprs:
+                    ns.w('    %s,' % expr)
+                ns.w(')')
+        m.w()
+
+    def _emit_dump_json(self, m):
+        # def _dump_json(self, parts):
+        #     tag = self.__which__()
+        #     parts.append('{')
+        #     start = len(parts)
+        #     parts.append(',"x":')
+        #     parts.append(str(self._read_data(0, ord('q'))))
+        #     if tag == 1:
+        #         parts.append(',"circle":')
+        #         parts.append(str(self._read_data(8, ord('q'))))
+        #     if len(parts) > start:
+        #         parts[start] = parts[start][1:] # remove the first comma
+        #     parts.append('}')
+        fields = [f for f in self.struct.fields or []
+                  if not (f.is_slot() and f.slot.type.is_anyPointer())]
+        with m.block('{cpdef} _dump_json(self, parts):') as ns:
+            if self.struct.discriminantCount:
+                if m.pyx:
+                    ns.w('cdef long tag = self.__which__()')
+                else:
+                    ns.w('tag = self.__which__()')
+            ns.w("parts.append('{{')")
+            ns.w('start = len(parts)')
+            for f in fields:
+                ns.fname = m._field_name(f)
+                if f.is_part_of_union():
+                    with ns.block('if tag == {tag}:',
+                                  tag=f.discriminantValue) as ns2:
+                        self._emit_json_for_field(m, ns2, f)
+                else:
+                    self._emit_json_for_field(m, ns, f)
+            ns.ww("""
+                if len(parts) > start:
+                    parts[start] = parts[start][1:]
+                parts.append('}}')
+            """)
+        m.w()
+
+    def _emit_json_for_field(self, m, ns, f):
+        ns.w("""parts.append(',"{fname}":')""")
+        if f.is_group() and f.is_nullable(m):
+            _, f_is_null, f_value = f.is_nullable(m).check(m)
+            ns.g = 'g_' + ns.fname
+            ns.groupcls = m.allnodes[f.group.typeId].compile_name(m)
+            ns.w('{g} = self._read_group({groupcls})')
+            with ns.block('if {g}.%s:' % m._field_name(f_is_null)):
+                ns.w("parts.append('null')")
+            with ns.block('else:'):
+                f_value._emit_json(m, ns, ns.g)
+        else:
+            f._emit_json(m, ns, 'self')
+
     def _shortrepr_for_field(self, ns, f):
         if f.is_float32():
             return ns.format('_float32_repr(self.{fname})')
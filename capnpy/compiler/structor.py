@@ -53,12 +53,20 @@ class Structor(object):
             ns.cdef_var('_Builder', 'builder')
             ns.w('builder = _Builder.__new__(_Builder)')
             ns.w('builder._init({data_size}, {ptrs_size})')
-            for union in self.fieldtree.all_unions():
-                ns.w('{union}__curtag = None', union=union.varname)
-            for node in self.fieldtree.children:
-                self.handle_node(node)
+            self.emit_fields()
             ns.w('return builder.build()')
 
+    def emit_fields(self):
+        """
+        Emit the code which writes all the fields into ``builder``, reading
+        their values from the variables called as the argnames
+        """
+        code = self.m.code
+        for union in self.fieldtree.all_unions():
+            code.w('{union}__curtag = None', union=union.varname)
+        for node in self.fieldtree.children:
+            self.handle_node(node)
+
     def handle_node(self, node):
         if node.f.is_part_of_union():
             ns = self.m.code.new_scope()
@@ -168,7 +176,7 @@ class Structor(object):
         ns = self.m.code.new_scope()
         ns.arg = node.varname
         if node.f.slot.hadExplicitDefault:
-            ns.default_ = node.f.slot.defaultValue.as_pyobj()
+            ns.default_ = node.f.slot.defaultValue.as_literal()
             ns.w('{arg} ^= {default_}')
         #
         ns.ifmt = "ord(%r)" % node.f.slot.get_fmt()
@@ -180,6 +188,6 @@ class Structor(object):
         ns.arg = node.varname
         ns.byteoffset, ns.bitoffset = divmod(node.f.slot.offset, 8)
         if node.f.slot.hadExplicitDefault:
-            ns.default_ = node.f.slot.defaultValue.as_pyobj()
+            ns.default_ = node.f.slot.defaultValue.as_literal()
             ns.w('{arg} ^= {default_}')
         ns.w('builder.setbool({byteoffset}, {bitoffset}, {arg})')
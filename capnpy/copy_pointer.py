@@ -0,0 +1,108 @@
+"""
+Pure python version of copy_pointer.pyx: it is used when the extension
+modules are not compiled, e.g. on PyPy.
+"""
+
+import struct
+from capnpy import ptr
+
+
+def check_bound(pos, n, src_len):
+    if pos < 0 or pos + n > src_len:
+        msg = ("Invalid capnproto message: offset out of bound "
+               "at position %s (%s > %s)" % (pos, pos+n, src_len))
+        raise IndexError(msg)
+
+
+def read_int64(src, i):
+    return struct.unpack_from('q', src, i)[0]
+
+def copy_pointer(src, p, src_pos, dst, dst_pos):
+    """
+    Copy from: buffer src, pointer p living at the src_pos offset
+         to:   buffer dst at position dst_pos
+    """
+    _copy(src, len(src), p, src_pos, dst, dst_pos)
+
+
+def _copy(src, src_len, p, src_pos, dst, dst_pos):
+    kind = ptr.kind(p)
+    if kind == ptr.STRUCT:
+        return _copy_struct(src, src_len, p, src_pos, dst, dst_pos)
+    elif kind == ptr.LIST:
+        item_size = ptr.list_size_tag(p)
+        if item_size == ptr.LIST_SIZE_COMPOSITE:
+            return _copy_list_composite(src, src_len, p, src_pos, dst, dst_pos)
+        elif item_size == ptr.LIST_SIZE_PTR:
+            return _copy_list_ptr(src, src_len, p, src_pos, dst, dst_pos)
+        else:
+            return _copy_list_primitive(src, src_len, p, src_pos, dst, dst_pos)
+    assert False, 'unknown ptr kind: %s' % kind
+
+def _copy_many_ptrs(n, src, src_len, src_pos, dst, dst_pos):
+    check_bound(src_pos, n*8, src_len)
+    for i in range(n):
+        offset = i*8
+        p = read_int64(src, src_pos + offset)
+        if p != 0:
+            _copy(src, src_len, p, src_pos + offset, dst, dst_pos + offset)
+
+def _copy_struct(src, src_len, p, src_pos, dst, dst_pos):
+    src_pos = ptr.deref(p, src_pos)
+    data_size = ptr.struct_data_size(p)
+    ptrs_size = ptr.struct_ptrs_size(p)
+    ds = data_size*8
+    dst_pos = dst.alloc_struct(dst_pos, data_size, ptrs_size)
+    check_bound(src_pos, ds, src_len)
+    dst.write_bytes(dst_pos, src[src_pos:src_pos+ds]) # copy data section
+    _copy_many_ptrs(ptrs_size, src, src_len, src_pos+ds, dst, dst_pos+ds)
+
+
+def _copy_list_primitive(src, src_len, p, src_pos, dst, dst_pos):
+    src_pos = ptr.deref(p, src_pos)
+    count = ptr.list_item_count(p)
+    size_tag = ptr.list_size_tag(p)
+    if size_tag == ptr.LIST_SIZE_BIT:
+        body_length = (count + 8 - 1) / 8 # divide by 8 and round up
+    else:
+        body_length = count * ptr.list_item_length(size_tag)
+    #
+    dst_pos = dst.alloc_list(dst_pos, size_tag, count, body_length)
+    check_bound(src_pos, body_length, src_len)
+    dst.write_bytes(dst_pos, src[src_pos:src_pos+body_length])
+
+def _copy_list_ptr(src, src_len, p, src_pos, dst, dst_pos):
+    src_pos = ptr.deref(p, src_pos)
+    count = ptr.list_item_count(p)
+    body_length = count*8
+    dst_pos = dst.alloc_list(dst_pos, ptr.LIST_SIZE_PTR, count, body_length)
+    check_bound(src_pos, body_length, src_len)
+    _copy_many_ptrs(count, src, src_len, src_pos, dst, dst_pos)
+
+
+def _copy_list_composite(src, src_len, p, src_pos, dst, dst_pos):
+    src_pos = ptr.deref(p, src_pos)
+    total_words = ptr.list_item_count(p) # n of words NOT including the tag
+    body_length = (total_words+1)*8      # total length INCLUDING the tag
+    #
+    # check that there is enough data for both the tag AND the whole body;
+    # this way we do the bound checking only once
+    check_bound(src_pos, body_length, src_len)
+    tag = read_int64(src, src_pos)
+    count = ptr.offset(tag)
+    data_size = ptr.struct_data_size(tag)
+    ptrs_size = ptr.struct_ptrs_size(tag)
+    #
+    # allocate the list and copy the whole body at once
+    dst_pos = dst.alloc_list(dst_pos, ptr.LIST_SIZE_COMPOSITE, total_words,
+                             body_length)
+    dst.write_bytes(dst_pos, src[src_pos:src_pos+body_length])
+    #
+    # iterate over the elements, fix the pointers and copy the content
+    item_length = (data_size+ptrs_size) * 8
+    for i in range(count):
+        ptrs_section_offset = 8 + item_length*i + data_size*8
+        _copy_many_ptrs(ptrs_size, src, src_len,
+                        src_pos + ptrs_section_offset,
+                        dst,
+                        dst_pos + ptrs_section_offset)
@@ -23,7 +23,7 @@ cdef long raise_out_of_bound(long pos, long n, Py_ssize_t src_len) except -1:
 cdef int64_t read_int64(const char* src, long i):
     return (<int64_t*>(src+i))[0]
 
-cpdef copy_pointer(bytes src, long p, long src_pos, SegmentBuilder dst, long dst_pos):
+cpdef copy_pointer(object src, long p, long src_pos, SegmentBuilder dst, long dst_pos):
     """
     Copy from: buffer src, pointer p living at the src_pos offset
          to:   buffer dst at position dst_pos
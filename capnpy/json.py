@@ -0,0 +1,107 @@
+"""
+Encode capnpy objects as JSON.
+
+The encoding is driven by the schema: each struct has a generated
+_dump_json() method which reads the fields directly from the buffer and
+appends the corresponding JSON fragments to a list, without building any
+intermediate dict. The functions in this module are the helpers used by the
+generated code.
+
+The mapping is the same as Struct.to_dict(), with the following exceptions:
+
+  - enums are encoded by name (by number, if the value is unknown)
+
+  - Data is encoded as a list of bytes
+
+  - NaN and infinities are encoded as null, since JSON does not support them
+"""
+
+from __future__ import absolute_import
+import math
+from capnpy.type import Types
+from capnpy.list import (List, VoidItemType, BoolItemType, PrimitiveItemType,
+                         EnumItemType, TextItemType, StructItemType,
+                         ListItemType)
+from capnpy.util import float32_repr, float64_repr
+
+
+def dumps(obj):
+    """
+    Return the JSON representation of a capnpy struct or list
+    """
+    parts = []
+    if isinstance(obj, List):
+        dump_list(obj, parts)
+    else:
+        obj._dump_json(parts)
+    return ''.join(parts)
+
+def dump_float(value, float_repr=float64_repr):
+    if math.isnan(value) or math.isinf(value):
+        return 'null'
+    return float_repr(value)
+
+def dump_enum(value):
+    members = value.__members__
+    if 0 <= value < len(members):
+        return '"%s"' % members[value]
+    return str(int(value))
+
+def dump_text(s):
+    if s is None:
+        return 'null'
+    # imported here so that generated modules do not load the json package
+    from json.encoder import encode_basestring_ascii
+    return encode_basestring_ascii(s)
+
+def dump_data(s):
+    if s is None:
+        return 'null'
+    return '[%s]' % ','.join(map(str, bytearray(s)))
+
+def dump_struct(obj, parts):
+    if obj is None:
+        parts.append('null')
+    else:
+        obj._dump_json(parts)
+
+def dump_list(lst, parts):
+    if lst is None:
+        parts.append('null')
+        return
+    item_type = lst._item_type
+    if isinstance(item_type, (StructItemType, ListItemType)):
+        # these need to recurse, so we cannot simply join the items
+        parts.append('[')
+        for i, item in enumerate(lst.to_list()):
+            if i > 0:
+                parts.append(',')
+            if isinstance(item_type, StructItemType):
+                item._dump_json(parts)
+            else:
+                dump_list(item, parts)
+        parts.append(']')
+        return
+    #
+    items = lst.to_list()
+    if isinstance(item_type, TextItemType):
+        if item_type.additional_size == 0:
+            items = map(dump_data, items)
+        else:
+            items = map(dump_text, items)
+    elif isinstance(item_type, EnumItemType):
+        items = map(dump_enum, items)
+    elif isinstance(item_type, PrimitiveItemType):
+        if item_type.t is Types.float32:
+            items = [dump_float(x, float32_repr) for x in items]
+        elif item_type.t is Types.float64:
+            items = [dump_float(x, float64_repr) for x in items]
+        else:
+            items = map(str, items)
+    elif isinstance(item_type, BoolItemType):
+        items = ['true' if x else 'false' for x in items]
+    elif isinstance(item_type, VoidItemType):
+        items = ['null'] * len(items)
+    else:
+        raise TypeError('Unknown item type: %s' % item_type)
+    parts.append('[%s]' % ','.join(items))
@@ -0,0 +1,44 @@
+"""
+Layout tables: the compiler emits one for each struct, as the private
+attribute ``MyStruct._layout``. They are an implementation detail of the
+projectors (see capnpy/projector.py), and not a public API.
+
+The table maps the name of each field (as seen from Python) to a FieldLayout,
+in declaration order, and describes where the field is stored in the
+message. This way, the projectors can check the field names and read the
+fields without loading the schema objects at runtime:
+
+  - ``kind``: the type of the field, i.e. the name of the corresponding
+    capnpy.type.Types for primitives and strings, or one of ``'enum'``,
+    ``'struct'``, ``'list'``, ``'anyPointer'``, ``'group'``
+
+  - ``offset``: the offset in bytes inside the data section, for
+    primitives, bools and enums; None otherwise
+
+  - ``bitmask``: the bit to test in the byte at ``offset``, for bools; None
+    otherwise
+
+  - ``ptr_index``: the index inside the pointers section, for pointer
+    fields; None otherwise
+
+  - ``default``: the default value, which the data section stores XORed
+    with the actual value, for primitives, bools and enums; None otherwise
+
+  - ``discriminant``: the value of the union tag (stored at
+    ``__tag_offset__``) when the field is set, for fields which are part of
+    an anonymous union; None otherwise
+
+  - ``structcls``: a function which returns the class of the struct, for
+    struct fields and groups; None otherwise. The class is looked up only when
+    the function is called, because it might be defined after the outer
+    struct
+"""
+
+from collections import namedtuple, OrderedDict
+
+FieldLayout = namedtuple('FieldLayout', ['name', 'kind', 'offset', 'bitmask',
+                                         'ptr_index', 'default',
+                                         'discriminant', 'structcls'])
+
+def make_layout(*fields):
+    return OrderedDict([(f.name, f) for f in fields])
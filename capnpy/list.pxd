@@ -5,9 +5,10 @@ from capnpy.type cimport BuiltinType
 from capnpy cimport ptr
 from capnpy.visit cimport end_of
 from capnpy.builder cimport ListBuilder
-from capnpy.packing cimport pack_int64
+from capnpy.segment.segment cimport WritableSegment
 
 cdef class ItemType(object)
+cdef class StructCursor(object)
 
 cdef class List(Blob):
     cdef readonly long _offset
@@ -18,19 +19,53 @@ cdef class List(Blob):
     cdef readonly long _item_count
     cdef readonly long _item_length
     cdef readonly long _item_offset
+    cdef readonly long _view_start
+    cdef readonly long _view_step
+    cdef readonly bint _is_view
 
     cpdef _init_from_buffer(self, object buf, long offset, long size_tag,
                             long item_count, ItemType item_type)
     cpdef _set_list_tag(self, long size_tag, long item_count)
     cpdef _getitem_fast(self, long i)
+    cpdef StructCursor cursor(self)
+
+    @cython.locals(cursor=StructCursor, item=Struct, result=list, i=long)
+    cpdef list _project_data(self, tuple fields)
+
+    cpdef list to_list(self, bint decode=*)
+
+    @cython.locals(obj=List)
+    cpdef _slice(self, long start, long count, long step)
+
+cdef class StructCursor(object):
+    cdef readonly List _list
+    cdef readonly Struct item
+    cdef readonly long index
+
+    @cython.locals(lst=List, item=Struct, offset=long)
+    cpdef Struct move_to(self, long i)
 
 cdef class ItemType(object):
     cpdef get_type(self)
     cpdef read_item(self, List lst, long offset)
+    cpdef write_item(self, List lst, long i, object value)
+
+    @cython.locals(i=long)
+    cpdef list read_list(self, List lst, bint decode)
+    cpdef list convert_list(self, List lst, bint as_dict)
+
+    @cython.locals(i=long)
+    cpdef long find(self, List lst, object value) except -2
+
+    @cython.locals(lo=long, hi=long, mid=long)
+    cpdef long bisect(self, List lst, object value, bint right) except -1
     cpdef long offset_for_item(self, List lst, long i)
     cpdef bint can_compare(self)
     cpdef pack_item(self, ListBuilder listbuilder, long i, object item)
 
+    @cython.locals(i=long)
+    cpdef pack_list(self, ListBuilder listbuilder, object lst)
+
 cdef class VoidItemType(ItemType):
     pass
 
@@ -41,6 +76,11 @@ cdef class PrimitiveItemType(ItemType):
     cdef readonly BuiltinType t
     cdef readonly char ifmt
 
+    cdef bint _is_numeric(self, object value)
+
+    @cython.locals(itemsize=long)
+    cdef object _pack_buffer(self, object lst)
+
 cdef class EnumItemType(PrimitiveItemType):
     cdef readonly object enumcls
 
@@ -49,15 +89,24 @@ cdef class StructItemType(ItemType):
     cdef readonly long static_data_size
     cdef readonly long static_ptrs_size
 
+    @cython.locals(i=long)
+    cpdef list convert_list(self, List lst, bint as_dict)
+
     @cython.locals(body_offset=long, extra_offset=long, struct_item=Struct)
     cpdef pack_item(self, ListBuilder listbuilder, long i, object item)
 
 cdef class TextItemType(ItemType):
     cdef readonly int additional_size
 
+    @cython.locals(seg=WritableSegment, offset=long)
+    cpdef write_item(self, List lst, long i, object value)
+
 cdef class ListItemType(ItemType):
     cdef readonly ItemType inner_item_type
 
+    @cython.locals(i=long)
+    cpdef list convert_list(self, List lst, bint as_dict)
+
 cpdef ItemType void_list_item_type
 cpdef ItemType bool_list_item_type
 cpdef ItemType int8_list_item_type
@@ -1,11 +1,13 @@
+import sys
 import struct
+import array
 import capnpy
 from capnpy.type import Types
 from capnpy.blob import Blob, PYX
 from capnpy import ptr
 from capnpy.util import text_repr, float32_repr, float64_repr
 from capnpy.visit import end_of
-from capnpy.packing import pack_int64
+from capnpy.segment.segment import WritableSegment
 
 class List(Blob):
 
@@ -28,6 +30,9 @@ class List(Blob):
         self._offset = offset
         self._item_type = item_type
         self._set_list_tag(size_tag, item_count)
+        self._view_start = 0
+        self._view_step = 1
+        self._is_view = False
 
     def __reduce__(self):
         raise TypeError("Cannot pickle capnpy List directly. Either pickle "
@@ -56,21 +61,139 @@ class List(Blob):
 
     def __getitem__(self, i):
         if isinstance(i, slice):
-            idx = xrange(*i.indices(len(self)))
-            return [self._getitem_fast(j) for j in idx]
+            start, stop, step = i.indices(self._item_count)
+            return self._slice(start, len(xrange(start, stop, step)), step)
         if i < 0:
             i += self._item_count
         if 0 <= i < self._item_count:
             return self._getitem_fast(i)
         raise IndexError
 
+    def __setitem__(self, i, value):
+        """
+        Write the i-th item in place: this is possible only for lists of
+        primitives and enums in writable messages, and for lists of Text and
+        Data inside a MessageBuilder. The items of a list of structs are
+        modified by calling their set_*() methods.
+        """
+        if i < 0:
+            i += self._item_count
+        if not 0 <= i < self._item_count:
+            raise IndexError
+        self._item_type.write_item(self, self._view_start + i*self._view_step,
+                                   value)
+
     def _getitem_fast(self, i):
         """
         WARNING: no bound checks!
         """
-        return self._item_type.read_item(self, i)
+        return self._item_type.read_item(self, self._view_start + i*self._view_step)
+
+    def cursor(self):
+        """
+        Return a StructCursor over the items of a List(Struct)
+        """
+        return StructCursor(self)
+
+    def _project_data(self, fields):
+        """
+        Like Struct._project_data, for each item of a List(Struct): return a
+        list of tuples
+        """
+        cursor = StructCursor(self)
+        result = []
+        i = 0
+        while i < self._item_count:
+            item = cursor.move_to(i)
+            result.append(item._project_data(fields))
+            i += 1
+        return result
+
+    def to_list(self, decode=False):
+        """
+        Return a Python list containing all the items of self.
+
+        If decode is True, the items of a List(Text) are decoded from UTF-8
+        and returned as unicode strings.
+        """
+        return self._item_type.read_list(self, decode)
+
+    def __contains__(self, value):
+        return self._item_type.find(self, value) != -1
+
+    def index(self, value, assume_sorted=False):
+        """
+        Return the index of the first item equal to value, or raise ValueError
+        if there is no such item.
+
+        If assume_sorted is True, the items are assumed to be sorted in
+        ascending order and a binary search is used instead of a linear scan.
+        """
+        if assume_sorted:
+            i = self._item_type.bisect(self, value, False)
+            if i < self._item_count and self._getitem_fast(i) == value:
+                return i
+        else:
+            i = self._item_type.find(self, value)
+            if i != -1:
+                return i
+        raise ValueError('%r is not in list' % (value,))
+
+    def contains(self, value, assume_sorted=False):
+        """
+        Same as ``value in self``, but with the option of using a binary search
+        if the items are sorted in ascending order.
+        """
+        if assume_sorted:
+            i = self._item_type.bisect(self, value, False)
+            return i < self._item_count and self._getitem_fast(i) == value
+        return self._item_type.find(self, value) != -1
+
+    def bisect_left(self, value):
+        """
+        Same as bisect.bisect_left(self, value): the items must be sorted in
+        ascending order.
+        """
+        return self._item_type.bisect(self, value, False)
+
+    def bisect_right(self, value):
+        """
+        Same as bisect.bisect_right(self, value): the items must be sorted in
+        ascending order.
+        """
+        return self._item_type.bisect(self, value, True)
+
+    def bisect(self, value):
+        """
+        Alias for bisect_right, like bisect.bisect.
+        """
+        return self._item_type.bisect(self, value, True)
+
+    def _slice(self, start, count, step):
+        """
+        Return a new List which is a view over ``count`` items of self, starting
+        from ``start`` and taking one item every ``step``. The view shares the
+        same segment as self, and the items are read only when accessed.
+        """
+        obj = List.__new__(List)
+        obj._init_blob(self._seg)
+        obj._offset = self._offset
+        obj._item_type = self._item_type
+        obj._size_tag = self._size_tag
+        obj._tag = self._tag
+        obj._item_count = count
+        obj._item_length = self._item_length
+        obj._item_offset = self._item_offset
+        obj._view_start = self._view_start + start*self._view_step
+        obj._view_step = self._view_step * step
+        obj._is_view = True
+        return obj
 
     def _get_end(self):
+        if self._is_view:
+            # the items of a view are not contiguous in memory, and they
+            # might not reach the end of the list
+            raise ValueError("Cannot compute the end of a List view")
         p = ptr.new_list(0, self._size_tag, self._item_count)
         return end_of(self._seg, p, self._offset-8)
 
@@ -79,15 +202,20 @@ class List(Blob):
         # comparing the memory without doing a full copy
         start = self._offset
         end = self._get_end()
-        return self._seg.buf[start:end]
+        return self._seg.read_bytes(start, end)
 
     def _equals(self, other):
         if not self._item_type.can_compare():
             raise TypeError("Cannot compare lists of structs.")
         if isinstance(other, list):
-            return list(self) == other
+            return self.to_list() == other
         if self.__class__ is not other.__class__:
             return False
+        if self._is_view or other._is_view:
+            # the items of a view are not contiguous in memory, so we cannot
+            # compare the raw bytes
+            return (self._item_type.get_type() == other._item_type.get_type() and
+                    self.to_list() == other.to_list())
         return (self._item_count == other._item_count and
                 self._item_type.get_type() == other._item_type.get_type() and
                 self._get_slice() == other._get_slice())
@@ -97,6 +225,61 @@ class List(Blob):
         return '[%s]' % (', '.join(parts))
 
 
+class StructCursor(object):
+    """
+    A single struct object which can be moved over the items of a
+    List(Struct), so that they can be read without allocating a new object
+    for each of them::
+
+        cursor = lst.cursor()
+        for item in cursor:
+            total += item.x
+
+    move_to(i) and iteration always return the same object, whose content
+    changes when the cursor moves: if you need to keep an item around, use
+    lst[i] instead.
+    """
+
+    def __init__(self, lst):
+        item_type = lst._item_type
+        if not isinstance(item_type, StructItemType):
+            raise TypeError("Cursors are supported only for lists of structs")
+        structcls = item_type.structcls
+        item = structcls.__new__(structcls)
+        item._init_blob(lst._seg)
+        item._data_size = ptr.struct_data_size(lst._tag)
+        item._ptrs_size = ptr.struct_ptrs_size(lst._tag)
+        item._data_offset = -1
+        item._ptrs_offset = -1
+        self._list = lst
+        self.item = item
+        self.index = -1
+
+    def move_to(self, i):
+        """
+        Point the cursor to the i-th item of the list, and return it
+        """
+        lst = self._list
+        if i < 0:
+            i += lst._item_count
+        if not 0 <= i < lst._item_count:
+            raise IndexError
+        offset = lst._offset + lst._item_type.offset_for_item(
+            lst, lst._view_start + i*lst._view_step)
+        item = self.item
+        item._data_offset = offset
+        item._ptrs_offset = offset + item._data_size*8
+        item._reset_cache()
+        self.index = i
+        return item
+
+    def __iter__(self):
+        i = 0
+        while i < self._list._item_count:
+            yield self.move_to(i)
+            i += 1
+
+
 class ItemType(object):
 
     def get_type(self):
@@ -108,6 +291,58 @@ class ItemType(object):
     def read_item(self, lst, i):
         raise NotImplementedError
 
+    def read_list(self, lst, decode):
+        if decode:
+            raise TypeError("decode=True is supported only for lists of Text")
+        result = []
+        i = 0
+        while i < lst._item_count:
+            result.append(lst._getitem_fast(i))
+            i += 1
+        return result
+
+    def convert_list(self, lst, as_dict):
+        """
+        Like read_list, but structs are converted by calling to_dict() or
+        to_tuple() on them, recursively
+        """
+        return self.read_list(lst, False)
+
+    def find(self, lst, value):
+        i = 0
+        while i < lst._item_count:
+            if lst._getitem_fast(i) == value:
+                return i
+            i += 1
+        return -1
+
+    def bisect(self, lst, value, right):
+        lo = 0
+        hi = lst._item_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            item = lst._getitem_fast(mid)
+            # the same comparisons as the bisect module, which matter for
+            # unordered values such as NaN
+            if (not value < item) if right else (item < value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def write_item(self, lst, i, value):
+        raise TypeError("Cannot assign to the items of a list of %s" %
+                        (self.get_type(),))
+
+    def pack_list(self, listbuilder, lst):
+        """
+        Pack all the items of lst into listbuilder
+        """
+        i = 0
+        while i < listbuilder.item_count:
+            self.pack_item(listbuilder, i, lst[i])
+            i += 1
+
     def item_repr(self, item):
         raise NotImplementedError
 
@@ -139,7 +374,7 @@ class VoidItemType(ItemType):
         return 0, ptr.LIST_SIZE_VOID
 
     def pack_item(self, listbuilder, i, item):
-        return ''
+        pass
 
 
 class BoolItemType(ItemType):
@@ -179,6 +414,40 @@ class PrimitiveItemType(ItemType):
         offset = lst._offset + (i * lst._item_length)
         return lst._seg.read_primitive(offset, self.ifmt)
 
+    def write_item(self, lst, i, value):
+        offset = lst._offset + (i * lst._item_length)
+        lst._seg.write_primitive(offset, self.ifmt, value)
+
+    def _is_numeric(self, value):
+        # the fast paths of find() and bisect() compare the raw items in C:
+        # for any other kind of value, we fall back to the generic logic
+        if self.t is Types.float32 or self.t is Types.float64:
+            if isinstance(value, float):
+                return True
+            if not isinstance(value, (int, long)):
+                return False
+            # the C key is a double: the integers which it cannot represent
+            # exactly (or at all) must be compared by python
+            try:
+                return float(value) == value
+            except OverflowError:
+                return False
+        return isinstance(value, (int, long))
+
+    def find(self, lst, value):
+        if not self._is_numeric(value):
+            return ItemType.find(self, lst, value)
+        return lst._seg.find_primitive(lst._offset, lst._item_length, self.ifmt,
+                                       lst._view_start, lst._view_step,
+                                       lst._item_count, value)
+
+    def bisect(self, lst, value, right):
+        if not self._is_numeric(value):
+            return ItemType.bisect(self, lst, value, right)
+        return lst._seg.bisect_primitive(lst._offset, lst._item_length, self.ifmt,
+                                         lst._view_start, lst._view_step,
+                                         lst._item_count, value, right)
+
     def item_repr(self, item):
         if self.t is Types.float32:
             return float32_repr(item)
@@ -201,7 +470,62 @@ class PrimitiveItemType(ItemType):
             raise ValueError('Unsupported size: %d' % length)
 
     def pack_item(self, listbuilder, i, item):
-        return struct.pack('<'+self.t.fmt, item)
+        listbuilder.set(self.ifmt, i*listbuilder.item_length, item)
+
+    def pack_list(self, listbuilder, lst):
+        body = self._pack_buffer(lst)
+        if body is None:
+            if not isinstance(lst, (list, tuple)):
+                ItemType.pack_list(self, listbuilder, lst)
+                return
+            # pack all the items at once: the loop runs in C, inside
+            # struct.pack
+            fmt = '<%d%s' % (len(lst), self.t.fmt)
+            body = struct.pack(fmt, *lst)
+        listbuilder.write_body(body)
+
+    def _pack_buffer(self, lst):
+        """
+        If lst exposes its items as a buffer of the right type and size, such
+        as array.array or a NumPy array, return its content as a string,
+        ready to be used as the body of the list. Else, return None.
+        """
+        if isinstance(lst, array.array):
+            fmt = lst.typecode
+            itemsize = lst.itemsize
+            view = lst
+        else:
+            try:
+                view = memoryview(lst)
+            except TypeError:
+                return None
+            if view.ndim != 1:
+                return None
+            fmt = view.format
+            itemsize = view.itemsize
+            if fmt[0] in '<@=':
+                fmt = fmt[1:]
+            elif fmt[0] in '>!':
+                return None # big endian
+        if (sys.byteorder != 'little' or
+            itemsize != self.t.calcsize() or
+            _buffer_kind(fmt) != _buffer_kind(self.t.fmt)):
+            return None
+        if isinstance(view, array.array):
+            return view.tostring()
+        return view.tobytes()
+
+
+def _buffer_kind(fmt):
+    # the kind of the items described by a struct/buffer format, regardless
+    # of their size
+    if fmt in ('b', 'h', 'i', 'l', 'q'):
+        return 'int'
+    elif fmt in ('B', 'H', 'I', 'L', 'Q'):
+        return 'uint'
+    elif fmt in ('f', 'd'):
+        return 'float'
+    return None
 
 
 class EnumItemType(PrimitiveItemType):
@@ -217,6 +541,9 @@ class EnumItemType(PrimitiveItemType):
         value = PrimitiveItemType.read_item(self, lst, i)
         return self.enumcls(value)
 
+    def write_item(self, lst, i, value):
+        PrimitiveItemType.write_item(self, lst, i, int(value))
+
 
 class StructItemType(ItemType):
 
@@ -238,6 +565,18 @@ class StructItemType(ItemType):
                                           ptr.struct_data_size(lst._tag),
                                           ptr.struct_ptrs_size(lst._tag))
 
+    def convert_list(self, lst, as_dict):
+        result = []
+        i = 0
+        while i < lst._item_count:
+            item = lst._getitem_fast(i)
+            if as_dict:
+                result.append(item.to_dict())
+            else:
+                result.append(item.to_tuple())
+            i += 1
+        return result
+
     def item_repr(self, item):
         return item.shortrepr()
 
@@ -249,7 +588,14 @@ class StructItemType(ItemType):
 
     def pack_item(self, listbuilder, i, item):
         structcls = self.structcls
-        if not isinstance(item, structcls):
+        if isinstance(item, dict):
+            # write the fields directly into the body of the item, in the
+            # same way as _buf_from_dict does
+            listbuilder._base = i * listbuilder.item_length
+            structcls._write_dict(listbuilder, item)
+            listbuilder._base = 0
+            return
+        elif not isinstance(item, structcls):
             raise TypeError("Expected an object of type %s, got %s instead" %
                             (self.structcls.__name__, item.__class__.__name__))
         #
@@ -273,11 +619,17 @@ class StructItemType(ItemType):
         # Note that extra_offset is expressed in WORDS, while _total_length in
         # BYTES
         struct_item = item
+        if (struct_item._data_size != self.static_data_size or
+            struct_item._ptrs_size != self.static_ptrs_size):
+            raise ValueError("Cannot store an object of size (%d, %d) in a "
+                             "list of %s" % (struct_item._data_size,
+                                             struct_item._ptrs_size,
+                                             structcls.__name__))
         body_offset = (self.static_data_size+self.static_ptrs_size) * (i+1)
         extra_offset = listbuilder._total_length/8 - body_offset
         body, extra = struct_item._split(extra_offset)
+        listbuilder.write_item(i, body)
         listbuilder._alloc(extra)
-        return body
 
 
 class TextItemType(ItemType):
@@ -298,6 +650,26 @@ class TextItemType(ItemType):
             raise NotImplementedError('FAR pointers not supported here')
         return lst._seg.read_str(p, offset, None, self.additional_size)
 
+    def write_item(self, lst, i, value):
+        if not isinstance(lst._seg, WritableSegment):
+            raise TypeError("Cannot allocate objects inside this message: use "
+                            "a MessageBuilder to build messages in place")
+        seg = lst._seg
+        offset = lst._offset + (i*8)
+        if value is None:
+            seg.write_primitive(offset, Types.int64.ifmt, 0)
+        else:
+            seg.alloc_str(offset, value, self.additional_size)
+
+    def read_list(self, lst, decode):
+        # fast path: read all the strings in a single loop, without going
+        # through read_item for each of them
+        if decode and self.additional_size == 0:
+            raise TypeError("decode=True is supported only for lists of Text")
+        return lst._seg.read_str_list(lst._offset, lst._view_start,
+                                      lst._view_step, lst._item_count,
+                                      self.additional_size, decode)
+
     def item_repr(self, item):
         return text_repr(item)
 
@@ -307,11 +679,9 @@ class TextItemType(ItemType):
     def pack_item(self, listbuilder, i, item):
         offset = i * listbuilder.item_length
         if self.additional_size == 0:
-            ptr = listbuilder.alloc_data(offset, item)
+            listbuilder.alloc_data(offset, item)
         else:
-            ptr = listbuilder.alloc_text(offset, item)
-        packed = pack_int64(ptr)
-        return packed
+            listbuilder.alloc_text(offset, item)
 
 
 class ListItemType(ItemType):
@@ -335,6 +705,15 @@ class ListItemType(ItemType):
                               self.inner_item_type)
         return obj
 
+    def convert_list(self, lst, as_dict):
+        result = []
+        i = 0
+        while i < lst._item_count:
+            item = lst._getitem_fast(i)
+            result.append(self.inner_item_type.convert_list(item, as_dict))
+            i += 1
+        return result
+
     def item_repr(self, item):
         return item.shortrepr()
 
@@ -343,9 +722,7 @@ class ListItemType(ItemType):
 
     def pack_item(self, listbuilder, i, item):
         offset = i * listbuilder.item_length
-        ptr = listbuilder.alloc_list(offset, self.inner_item_type, item)
-        packed = pack_int64(ptr)
-        return packed
+        listbuilder.alloc_list(offset, self.inner_item_type, item)
 
 
 
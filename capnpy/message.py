@@ -6,10 +6,14 @@ from capnpy import ptr
 from capnpy.filelike import as_filelike
 from capnpy.buffered import StringBuffer
 
-def load(f, payload_type):
+def load(f, payload_type, mutable=False):
     """
     Load a message of type ``payload_type`` from f.
 
+    If mutable is True, the message is copied into a bytearray, so that its
+    primitive fields can be modified in place by the generated set_*()
+    methods.
+
     The message is encoded using the recommended capnp format for serializing
     messages over a stream:
 
@@ -23,15 +27,15 @@ def load(f, payload_type):
       - The content of each segment, in order.
     """
     f2 = as_filelike(f)
-    msg = _load_message(f2)
+    msg = _load_message(f2, mutable)
     return msg._read_struct(0, payload_type)
 
-def loads(buf, payload_type):
+def loads(buf, payload_type, mutable=False):
     """
     Same as load(), but load from a string instead of a file
     """
     f = StringBuffer(buf)
-    obj = load(f, payload_type)
+    obj = load(f, payload_type, mutable)
     if f.tell() != len(buf):
         remaining = len(buf)-f.tell()
         raise ValueError("Not all bytes were consumed: %d bytes left" % remaining)
@@ -47,16 +51,16 @@ def load_all(f, payload_type):
     except EOFError:
         pass
 
-def _load_message(f):
+def _load_message(f, mutable=False):
     # read the total number of segments
     buf = f.read(4)
     if len(buf) < 4:
         raise EOFError("No message to load")
     n = unpack_uint32(buf, 0) + 1
     if n == 1:
-        capnp_buf = _load_buffer_single_segment(f) # fast path
+        capnp_buf = _load_buffer_single_segment(f, mutable) # fast path
     else:
-        capnp_buf = _load_buffer_multiple_segments(f, n) # slow path
+        capnp_buf = _load_buffer_multiple_segments(f, n, mutable) # slow path
     #
     # from the capnproto docs:
     #
@@ -68,7 +72,7 @@ def _load_message(f):
     return struct_from_buffer(Struct, capnp_buf, 0, data_size=0, ptrs_size=1)
 
 
-def _load_buffer_single_segment(f):
+def _load_buffer_single_segment(f, mutable):
     # fast path for the single-segment case. In this scenario, we don't
     # even need to compute the padding as we know that we read exactly 4+4
     # bytes
@@ -84,9 +88,11 @@ def _load_buffer_single_segment(f):
     if len(buf) < message_lenght:
         raise ValueError("Unexpected EOF: expected %d bytes, got only %s. " 
                          "Segment size: %s" % (message_lenght, len(buf), message_size))
+    if mutable:
+        return Segment(bytearray(buf))
     return Segment(buf)
 
-def _load_buffer_multiple_segments(f, n):
+def _load_buffer_multiple_segments(f, n, mutable):
     # slow path for the multiple-segments case
     #
     # 1. read the size of each segment
@@ -119,6 +125,8 @@ def _load_buffer_multiple_segments(f, n):
         segment_offsets.append(offset)
     #
     # 5. we are finally done :)
+    if mutable:
+        return MultiSegment(bytearray(buf), tuple(segment_offsets))
     return MultiSegment(buf, tuple(segment_offsets))
 
 
@@ -129,11 +137,7 @@ def dumps(obj):
     The message is encoded using the recommended capnp format for serializing
     messages over a stream. It always uses a single segment.
     """
-    if not obj._is_compact():
-        obj = obj.compact()
-    a = obj._get_body_start()
-    b = obj._get_end()
-    buf = obj._seg.buf[a:b]
+    buf = obj._get_compact_buf()
     p = ptr.new_struct(0, obj._data_size, obj._ptrs_size)
     #
     segment_count = 1
@@ -0,0 +1,96 @@
+"""
+Build messages incrementally, in the same way as the C++ MessageBuilder.
+
+The generated constructors need all the values up front, and build nested
+structs and lists separately before copying them into the outer buffer. With
+a MessageBuilder, all the objects are allocated in place in a single growing
+segment, and their fields can be set in any order::
+
+    builder = MessageBuilder()
+    poly = builder.init_root(Polygon)
+    poly.set_name('square')
+    points = poly.init_points(4)
+    points[0].set_x(1)
+    ...
+    msg = builder.dumps()
+
+The objects returned by init_root(), init_*() and by indexing lists are
+instances of the usual generated classes, so they can also be read, dumped
+and passed to the constructors of other structs. Since they are not laid out
+in pre-order, they are copied by following their pointers (see
+Struct._get_compact_buf).
+"""
+
+from capnpy.segment.segment import WritableSegment
+from capnpy.struct_ import struct_from_buffer
+
+
+class MessageBuilder(object):
+    """
+    Build a single-segment message. If an Arena is given, the message is
+    built inside its buffer, which is reset first.
+
+    The segment starts with the 8 bytes of the message header, followed by
+    the pointer to the root: this way, the buffer returned by getbuffer() is
+    already a complete message.
+    """
+
+    def __init__(self, length=512, arena=None):
+        if arena is None:
+            self._seg = WritableSegment(bytearray(length))
+        else:
+            arena.reset()
+            self._seg = arena.segment
+        self._seg.allocate(8) # the message header
+        self._seg.allocate(8) # the pointer to the root
+        self._root = None
+
+    def init_root(self, structcls):
+        """
+        Allocate the root struct of the message, and return it
+        """
+        if self._root is not None:
+            raise ValueError("The root of the message has already been "
+                             "initialized")
+        data_size = structcls.__static_data_size__
+        ptrs_size = structcls.__static_ptrs_size__
+        start = self._seg.alloc_struct(8, data_size, ptrs_size)
+        self._root = struct_from_buffer(structcls, self._seg, start,
+                                        data_size, ptrs_size)
+        return self._root
+
+    def get_root(self):
+        return self._root
+
+    def _write_header(self):
+        if self._root is None:
+            raise ValueError("The root of the message has not been initialized")
+        seg = self._seg
+        seg.write_primitive(0, ord('I'), 0)  # segment count - 1
+        seg.write_primitive(4, ord('I'), (seg.end - 8) / 8)
+
+    def getbuffer(self):
+        """
+        Return a memoryview over the message, encoded in the same format as
+        capnpy.dumps(). It can be passed directly to e.g. socket.sendall(),
+        without copying it.
+
+        The memoryview must not be kept alive while allocating new objects in
+        the message, because the underlying buffer cannot grow while it is
+        exported.
+        """
+        self._write_header()
+        return memoryview(self._seg.buf)[:self._seg.end]
+
+    def dumps(self):
+        """
+        Return the message, encoded in the same format as capnpy.dumps().
+
+        The segment is written as is, without compacting it: the objects
+        appear in the order in which they were allocated.
+        """
+        self._write_header()
+        return self._seg.as_string()
+
+    def dump(self, f):
+        f.write(self.getbuffer())
@@ -1,5 +1,7 @@
+import sys
 import struct
-from pypytools import IS_PYPY
+
+IS_PYPY = hasattr(sys, 'pypy_translation_info')
 
 if IS_PYPY:
     # workaround for a limitation of the PyPy JIT: struct.unpack is optimized
@@ -0,0 +1,124 @@
+"""
+Projections: read only a subset of the fields of a struct, as a tuple.
+
+The function which reads the fields is generated and compiled at runtime, so
+that the field names are resolved only once and there is no per-field
+overhead other than reading the field itself.
+"""
+
+from pypytools.codegen import Code
+from capnpy.blob import PYX
+from capnpy.type import Types
+from capnpy.list import List
+
+
+def make_projector(structcls, fields):
+    """
+    Return a function which takes either an instance of ``structcls`` or a
+    List of them, and returns a tuple (or a list of tuples) containing the
+    specified fields. Fields inside nested structs and groups can be
+    specified by using dotted names, such as ``'a.b'``; if ``a`` is null, the
+    corresponding item is ``None``.
+    """
+    if isinstance(fields, str):
+        raise TypeError("fields must be a list of field names, not a string")
+    paths = [path.split('.') for path in fields]
+    for path in paths:
+        _check_path(structcls, path)
+    layout = structcls._layout
+    #
+    code = Code()
+    code['List'] = List
+    with code.def_('project', ['obj']):
+        if PYX and all(len(path) == 1 and _is_data_field(layout[path[0]])
+                       for path in paths):
+            # the whole projection is done by compiled code, also for lists
+            fields = tuple([_data_field_spec(layout[path[0]])
+                            for path in paths])
+            code.w('return obj._project_data({fields})', fields=fields)
+        else:
+            _emit_project(code, paths, layout)
+    code.compile()
+    project = code['project']
+    project.__name__ = 'project_%s' % structcls.__name__
+    return project
+
+def _emit_project(code, paths, layout):
+    with code.block('if isinstance(obj, List):'):
+        code.w('result = []')
+        # the cursor reads all the items with the same struct object
+        with code.block('for item in obj.cursor():'):
+            items = _emit_paths(code, 'item', paths, layout)
+            code.w('result.append(({items}))', items=items)
+        code.w('return result')
+    items = _emit_paths(code, 'obj', paths, layout)
+    code.w('return ({items})', items=items)
+
+def _check_path(structcls, path):
+    # check that all the fields exist when the projector is built, instead of
+    # failing when it is called
+    cls = structcls
+    for i, name in enumerate(path):
+        layout = cls._layout
+        if name not in layout:
+            raise ValueError("%s has no field %r" % (cls.__name__, name))
+        f = layout[name]
+        if i < len(path)-1:
+            if f.structcls is None:
+                raise ValueError("%s.%s is not a struct" % (cls.__name__, name))
+            cls = f.structcls()
+
+def _emit_paths(ns, obj, paths, layout):
+    # emit the code to read nested fields and data fields into local
+    # variables, and return the expression which builds the tuple
+    items = []
+    data_fields = []
+    for i, path in enumerate(paths):
+        if len(path) == 1:
+            f = layout[path[0]]
+            if not _is_data_field(f):
+                items.append('%s.%s' % (obj, f.name))
+            elif PYX:
+                items.append('_data[%d]' % len(data_fields))
+                data_fields.append(_data_field_spec(f))
+            else:
+                items.append(_data_field_expr(obj, f))
+            continue
+        var = '_%d' % i
+        ns.w('{var} = {obj}.{attr}', var=var, obj=obj, attr=path[0])
+        for attr in path[1:]:
+            with ns.block('if {var} is not None:', var=var):
+                ns.w('{var} = {var}.{attr}', var=var, attr=attr)
+        items.append(var)
+    if data_fields:
+        # with the compiled runtime, the readers of the segment are not
+        # visible to python: read all the data fields with a single call
+        ns.w('_data = {obj}._project_data({fields})', obj=obj,
+             fields=tuple(data_fields))
+    return ''.join(item + ', ' for item in items)
+
+def _is_data_field(f):
+    # the primitive fields which can be read directly from the data section,
+    # without the logic of the property
+    return (f.kind in ('bool', 'int8', 'uint8', 'int16', 'uint16', 'int32',
+                       'uint32', 'int64', 'uint64', 'float32', 'float64') and
+            not f.default and f.discriminant is None)
+
+def _data_field_spec(f):
+    # see Struct._project_data
+    if f.kind == 'bool':
+        return (f.offset, Types.uint8.ifmt, f.bitmask)
+    return (f.offset, getattr(Types, f.kind).ifmt, 0)
+
+def _data_field_expr(obj, f):
+    # with the pure-python runtime, read the field directly from the segment,
+    # at the offset given by the layout: this saves the call to the property
+    if f.kind == 'bool':
+        reader = 'read_uint8'
+    else:
+        reader = getattr(Types, f.kind).reader
+    expr = '(%s._seg.%s(%s._data_offset+%d) if %s._data_size > %d else 0)' % (
+        obj, reader, obj, f.offset, obj, f.offset // 8)
+    if f.kind == 'bool':
+        expr = 'bool(%s & %d)' % (expr, f.bitmask)
+    return expr
@@ -5,7 +5,6 @@
 
 import sys
 import struct
-from pypytools.cast import as_signed
 
 # The following constants above are declared as enums in ptr.pxd/ptr.h, so we
 # cannot assign directly to them, else Cython produces a bogus C
@@ -48,7 +47,11 @@ def kind(ptr):
     return ptr & 0x3
 
 def offset(ptr):
-    return as_signed(ptr>>2 & 0x3fffffff, 30)
+    # the offset is a signed 30 bits int
+    off = ptr>>2 & 0x3fffffff
+    if off >= 0x20000000:
+        off -= 0x40000000
+    return off
 
 def extra(ptr):
     return ptr>>32
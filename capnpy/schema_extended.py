@@ -109,6 +109,13 @@ class Field:
     def is_nullable(self, m):
         return m.has_annotation(self, annotate.nullable)
 
+    def is_cached(self, m, node):
+        if not (self.is_text() or self.is_data() or self.is_struct() or
+                self.is_list() or self.is_group()):
+            return False
+        return bool(m.has_annotation(self, annotate.cache) or
+                    m.has_annotation(node, annotate.cache))
+
     def is_part_of_union(self):
         return self.discriminantValue != Field.noDiscriminant
 
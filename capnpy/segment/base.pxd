@@ -4,10 +4,17 @@ from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
 
 
 cdef class BaseSegment(object):
-    cdef readonly bytes buf
+    cdef readonly object buf
     cdef const char* cbuf
+    cdef Py_ssize_t buflen
+    cdef Py_buffer view
+    cdef readonly bint unchecked
+    cdef readonly bint writable
 
     cdef inline check_bounds(self, Py_ssize_t size, Py_ssize_t offset)
+    cdef _grow(self, Py_ssize_t newlen)
+    cdef _clear(self, Py_ssize_t start, Py_ssize_t end)
+    cpdef bytes read_bytes(self, Py_ssize_t start, Py_ssize_t end)
     cdef object read_primitive(self, Py_ssize_t offset, char ifmt)
     cdef int64_t read_int64(self, Py_ssize_t offset) except? 0x7fffffffffffffff
     cdef uint64_t read_uint64(self, Py_ssize_t offset) except? 0xffffffffffffffff
@@ -20,4 +27,19 @@ cdef class BaseSegment(object):
     cdef uint8_t read_uint8(self, Py_ssize_t offset) except? 0xff
     cdef double read_double(self, Py_ssize_t offset) except? -1
     cdef float read_float(self, Py_ssize_t offset) except? -1
+    cdef list read_str_list(self, Py_ssize_t offset, Py_ssize_t start,
+                            Py_ssize_t step, Py_ssize_t count,
+                            int additional_size, bint decode)
+    cdef int64_t _read_signed(self, Py_ssize_t offset, char ifmt) except? 0x7fffffffffffffff
+    cdef int _primitive_key(self, char ifmt, object value, int64_t* ikey,
+                            uint64_t* ukey, double* dkey) except -2
+    cdef int _cmp_primitive(self, Py_ssize_t offset, char ifmt, int64_t ikey,
+                            uint64_t ukey, double dkey) except -2
+    cdef Py_ssize_t find_primitive(self, Py_ssize_t offset, Py_ssize_t item_length,
+                                   char ifmt, Py_ssize_t start, Py_ssize_t step,
+                                   Py_ssize_t count, object value) except -2
+    cdef Py_ssize_t bisect_primitive(self, Py_ssize_t offset, Py_ssize_t item_length,
+                                     char ifmt, Py_ssize_t start, Py_ssize_t step,
+                                     Py_ssize_t count, object value,
+                                     bint right) except -1
 
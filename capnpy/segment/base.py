@@ -1,5 +1,8 @@
+import sys
 import struct
-from pypytools import IS_PYPY
+from capnpy import ptr
+
+IS_PYPY = hasattr(sys, 'pypy_translation_info')
 
 if IS_PYPY:
     # workaround for a limitation of the PyPy JIT: struct.unpack is optimized
@@ -26,44 +29,132 @@ class BaseSegment(object):
     def __init__(self, buf):
         assert buf is not None
         self.buf = buf
+        self.unchecked = False
+        self.writable = isinstance(buf, bytearray)
 
     def read_primitive(self, offset, ifmt):
         fmt = '<' + mychr(ifmt)
-        if offset < 0 or offset + struct.calcsize(fmt) > len(self.buf):
+        if (not self.unchecked and
+            (offset < 0 or offset + struct.calcsize(fmt) > len(self.buf))):
             raise IndexError('Offset out of bounds: %d' % offset)
         return struct.unpack_from(fmt, self.buf, offset)[0]
 
+    def _grow(self, newlen):
+        """
+        Resize a writable segment to newlen bytes. The new bytes are zeroed.
+        """
+        assert self.writable
+        assert newlen >= len(self.buf)
+        self.buf.extend(b'\0' * (newlen - len(self.buf)))
+
+    def _clear(self, start, end):
+        """
+        Fill the given range of a writable segment with zeros
+        """
+        assert self.writable
+        assert 0 <= start <= end <= len(self.buf)
+        self.buf[start:end] = b'\0' * (end - start)
+
+    def read_bytes(self, start, end):
+        """
+        Same as self.buf[start:end], but always return a string, also if the
+        segment is backed by a bytearray
+        """
+        return str(self.buf[start:end])
+
+    # the typed readers don't go through read_primitive: the generated code
+    # calls them directly, and this way the JIT sees a constant format string
+    # and no dispatch on ifmt
+
+    def _check_bounds(self, size, offset):
+        if not self.unchecked and (offset < 0 or offset + size > len(self.buf)):
+            raise IndexError('Offset out of bounds: %d' % offset)
+
     def read_int64(self, offset):
-        return self.read_primitive(offset, ord('q'))
+        self._check_bounds(8, offset)
+        return struct.unpack_from('<q', self.buf, offset)[0]
 
     def read_uint64(self, offset):
-        return self.read_primitive(offset, ord('Q'))
+        self._check_bounds(8, offset)
+        return struct.unpack_from('<Q', self.buf, offset)[0]
 
     def read_uint64_magic(self, offset):
-        return self.read_primitive(offset, ord('Q'))
+        self._check_bounds(8, offset)
+        return struct.unpack_from('<Q', self.buf, offset)[0]
 
     def read_int32(self, offset):
-        return self.read_primitive(offset, ord('i'))
+        self._check_bounds(4, offset)
+        return struct.unpack_from('<i', self.buf, offset)[0]
 
     def read_uint32(self, offset):
-        return self.read_primitive(offset, ord('I'))
+        self._check_bounds(4, offset)
+        return struct.unpack_from('<I', self.buf, offset)[0]
 
     def read_int16(self, offset):
-        return self.read_primitive(offset, ord('h'))
+        self._check_bounds(2, offset)
+        return struct.unpack_from('<h', self.buf, offset)[0]
 
     def read_uint16(self, offset):
-        return self.read_primitive(offset, ord('H'))
+        self._check_bounds(2, offset)
+        return struct.unpack_from('<H', self.buf, offset)[0]
 
     def read_int8(self, offset):
-        return self.read_primitive(offset, ord('b'))
+        self._check_bounds(1, offset)
+        return struct.unpack_from('<b', self.buf, offset)[0]
 
     def read_uint8(self, offset):
-        return self.read_primitive(offset, ord('B'))
+        self._check_bounds(1, offset)
+        return struct.unpack_from('<B', self.buf, offset)[0]
 
     def read_double(self, offset):
-        return self.read_primitive(offset, ord('d'))
+        self._check_bounds(8, offset)
+        return struct.unpack_from('<d', self.buf, offset)[0]
 
     def read_float(self, offset):
-        return self.read_primitive(offset, ord('f'))
+        self._check_bounds(4, offset)
+        return struct.unpack_from('<f', self.buf, offset)[0]
+
+    def read_str_list(self, offset, start, step, count, additional_size, decode):
+        result = []
+        for i in range(count):
+            p_offset = offset + (start + i*step)*8
+            p = self.read_int64(p_offset)
+            if p == 0:
+                result.append(None)
+                continue
+            if ptr.kind(p) == ptr.FAR:
+                raise NotImplementedError('FAR pointers not supported here')
+            if ptr.kind(p) != ptr.LIST or ptr.list_size_tag(p) != ptr.LIST_SIZE_8:
+                raise ValueError('Expected a pointer to a list of bytes at '
+                                 'offset %d' % p_offset)
+            str_start = ptr.deref(p, p_offset)
+            length = max(ptr.list_item_count(p) + additional_size, 0)
+            if str_start < 0 or str_start + length > len(self.buf):
+                raise IndexError('Offset out of bounds: %d' % str_start)
+            item = self.read_bytes(str_start, str_start+length)
+            if decode:
+                item = item.decode('utf-8')
+            result.append(item)
+        return result
+
+    def find_primitive(self, offset, item_length, ifmt, start, step, count, value):
+        for i in range(count):
+            item = self.read_primitive(offset + (start + i*step)*item_length, ifmt)
+            if item == value:
+                return i
+        return -1
+
+    def bisect_primitive(self, offset, item_length, ifmt, start, step, count,
+                         value, right):
+        lo = 0
+        hi = count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            item = self.read_primitive(offset + (start + mid*step)*item_length, ifmt)
+            if (not value < item) if right else (item < value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
 
 BaseSegmentForTests = BaseSegment
@@ -1,29 +1,88 @@
 cimport cython
 from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
                           uint32_t, int32_t, int64_t, uint64_t, INT64_MAX)
-from cpython.string cimport PyString_AS_STRING, PyString_GET_SIZE
+from cpython.string cimport (PyString_AS_STRING, PyString_GET_SIZE,
+                             PyString_FromStringAndSize)
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_WRITABLE
+from libc.string cimport memset
+
+cdef extern from "Python.h":
+    int PyByteArray_Resize(object o, Py_ssize_t len) except -1
 from capnpy cimport ptr
 
 cdef class BaseSegment(object):
 
     # bah, we need to specify segment_offsets also here, even if it's used
     # only by MultiSegment
-    def __cinit__(self, bytes buf, object segment_offsets=None):
+    def __cinit__(self, object buf, object segment_offsets=None):
         assert buf is not None
+        cdef bytes s
+        if isinstance(buf, bytearray):
+            # the segment is writable. We keep a buffer export alive as long
+            # as the segment exists: this way, the bytearray cannot be
+            # resized and self.cbuf can never become a dangling pointer
+            PyObject_GetBuffer(buf, &self.view, PyBUF_WRITABLE)
+            self.cbuf = <const char*>self.view.buf
+            self.buflen = self.view.len
+            self.writable = True
+        else:
+            s = buf
+            self.cbuf = PyString_AS_STRING(s)
+            self.buflen = PyString_GET_SIZE(s)
         self.buf = buf
-        self.cbuf = PyString_AS_STRING(self.buf)
+
+    def __dealloc__(self):
+        if self.writable:
+            PyBuffer_Release(&self.view)
+
+    @cython.final
+    cdef _grow(self, Py_ssize_t newlen):
+        """
+        Resize a writable segment to newlen bytes. The new bytes are zeroed.
+        """
+        cdef Py_ssize_t oldlen = self.buflen
+        assert self.writable
+        assert newlen >= oldlen
+        PyBuffer_Release(&self.view)
+        try:
+            PyByteArray_Resize(self.buf, newlen)
+        finally:
+            PyObject_GetBuffer(self.buf, &self.view, PyBUF_WRITABLE)
+            self.cbuf = <const char*>self.view.buf
+            self.buflen = self.view.len
+        memset(<char*>self.cbuf + oldlen, 0, newlen - oldlen)
 
     @cython.final
     cdef inline check_bounds(self, Py_ssize_t size, Py_ssize_t offset):
         # the bound check seems to introduce a 5-10% overhead when calling
         # read_int64 from Python. However, I expect the overhead to be
-        # relatively much higher if you call it from C. In case it's needed,
-        # consider adding a read_int64_fast or similar method, which does
-        # *not* do the check.
-        cdef Py_ssize_t buflen = PyString_GET_SIZE(self.buf)
-        if offset < 0 or offset + size > buflen:
+        # relatively much higher if you call it from C. Segments whose
+        # content has been checked by Struct.validate() are marked as
+        # unchecked, and skip it.
+        if self.unchecked:
+            return
+        if offset < 0 or offset + size > self.buflen:
             raise IndexError('Offset out of bounds: %d' % offset)
 
+    @cython.final
+    cdef _clear(self, Py_ssize_t start, Py_ssize_t end):
+        """
+        Fill the given range of a writable segment with zeros
+        """
+        assert self.writable
+        assert 0 <= start <= end <= self.buflen
+        memset(<char*>self.cbuf + start, 0, end - start)
+
+    cpdef bytes read_bytes(self, Py_ssize_t start, Py_ssize_t end):
+        """
+        Same as self.buf[start:end], but always return a string, also if the
+        segment is backed by a bytearray
+        """
+        if self.writable:
+            return bytes(self.buf[start:end])
+        return (<bytes>self.buf)[start:end]
+
     @cython.final
     cdef object read_primitive(self, Py_ssize_t offset, char ifmt):
         if ifmt == 'q':
@@ -111,6 +170,162 @@ cdef class BaseSegment(object):
         self.check_bounds(4, offset)
         return (<float*>(self.cbuf+offset))[0]
 
+    @cython.final
+    cdef list read_str_list(self, Py_ssize_t offset, Py_ssize_t start,
+                            Py_ssize_t step, Py_ssize_t count,
+                            int additional_size, bint decode):
+        """
+        Read ``count`` Text or Data items from the list of pointers which starts
+        at ``offset``, beginning from item ``start`` and taking one item every
+        ``step``. Null pointers are returned as None.
+
+        additional_size has the same meaning as in Segment.read_str. If decode
+        is true, the items are decoded from UTF-8 and returned as unicode.
+        """
+        cdef list result = []
+        cdef Py_ssize_t i, p_offset, str_start, length
+        cdef int64_t p
+        for i in range(count):
+            p_offset = offset + (start + i*step)*8
+            self.check_bounds(8, p_offset)
+            p = (<int64_t*>(self.cbuf+p_offset))[0]
+            if p == 0:
+                result.append(None)
+                continue
+            if ptr.kind(p) == ptr.FAR:
+                raise NotImplementedError('FAR pointers not supported here')
+            if ptr.kind(p) != ptr.LIST or ptr.list_size_tag(p) != ptr.LIST_SIZE_8:
+                raise ValueError('Expected a pointer to a list of bytes at '
+                                 'offset %d' % p_offset)
+            str_start = ptr.deref(p, p_offset)
+            length = max(ptr.list_item_count(p) + additional_size, 0)
+            self.check_bounds(length, str_start)
+            if decode:
+                result.append(PyUnicode_DecodeUTF8(self.cbuf+str_start, length, NULL))
+            else:
+                result.append(PyString_FromStringAndSize(self.cbuf+str_start, length))
+        return result
+
+    @cython.final
+    cdef int64_t _read_signed(self, Py_ssize_t offset, char ifmt) except? 0x7fffffffffffffff:
+        # read any integer type except uint64, widened to int64
+        if ifmt == 'q':
+            return self.read_int64(offset)
+        elif ifmt == 'i':
+            return self.read_int32(offset)
+        elif ifmt == 'I':
+            return self.read_uint32(offset)
+        elif ifmt == 'h':
+            return self.read_int16(offset)
+        elif ifmt == 'H':
+            return self.read_uint16(offset)
+        elif ifmt == 'b':
+            return self.read_int8(offset)
+        elif ifmt == 'B':
+            return self.read_uint8(offset)
+        raise ValueError('unknown fmt %s' % chr(ifmt))
+
+    @cython.final
+    cdef int _primitive_key(self, char ifmt, object value, int64_t* ikey,
+                            uint64_t* ukey, double* dkey) except -2:
+        # convert value to the C type used to compare it against the items
+        # of format ifmt. Return 0 on success; if the value is out of range,
+        # return -1 or 1 to signal that it is smaller or greater than any
+        # possible item
+        if ifmt == 'd' or ifmt == 'f':
+            # PrimitiveItemType._is_numeric passes only the values which a
+            # double represents exactly
+            dkey[0] = value
+            return 0
+        try:
+            if ifmt == 'Q':
+                ukey[0] = value
+            else:
+                ikey[0] = value
+        except OverflowError:
+            if value < 0:
+                return -1
+            return 1
+        return 0
+
+    @cython.final
+    cdef int _cmp_primitive(self, Py_ssize_t offset, char ifmt, int64_t ikey,
+                            uint64_t ukey, double dkey) except -2:
+        # compare the item at offset with the key: return -1, 0 or 1, or 2 if
+        # they are unordered (i.e. one of them is a NaN), which like in python
+        # is neither smaller, equal nor greater
+        cdef int64_t ival
+        cdef uint64_t uval
+        cdef double dval
+        if ifmt == 'd' or ifmt == 'f':
+            if ifmt == 'd':
+                dval = self.read_double(offset)
+            else:
+                dval = self.read_float(offset)
+            if dval != dval or dkey != dkey:
+                return 2
+            return (dval > dkey) - (dval < dkey)
+        elif ifmt == 'Q':
+            uval = self.read_uint64(offset)
+            return (uval > ukey) - (uval < ukey)
+        else:
+            ival = self._read_signed(offset, ifmt)
+            return (ival > ikey) - (ival < ikey)
+
+    @cython.final
+    cdef Py_ssize_t find_primitive(self, Py_ssize_t offset, Py_ssize_t item_length,
+                                   char ifmt, Py_ssize_t start, Py_ssize_t step,
+                                   Py_ssize_t count, object value) except -2:
+        """
+        Scan the ``count`` primitive items of format ``ifmt`` which start at
+        ``offset``, beginning from item ``start`` and taking one item every
+        ``step``. Return the index of the first item equal to value, or -1.
+        """
+        cdef int64_t ikey = 0
+        cdef uint64_t ukey = 0
+        cdef double dkey = 0
+        cdef Py_ssize_t i
+        if self._primitive_key(ifmt, value, &ikey, &ukey, &dkey) != 0:
+            return -1
+        for i in range(count):
+            if self._cmp_primitive(offset + (start + i*step)*item_length, ifmt,
+                                   ikey, ukey, dkey) == 0:
+                return i
+        return -1
+
+    @cython.final
+    cdef Py_ssize_t bisect_primitive(self, Py_ssize_t offset, Py_ssize_t item_length,
+                                     char ifmt, Py_ssize_t start, Py_ssize_t step,
+                                     Py_ssize_t count, object value,
+                                     bint right) except -1:
+        """
+        Same as find_primitive, but assume that the items are sorted and
+        return the position where value should be inserted to keep them
+        sorted, like bisect.bisect_left (or bisect.bisect_right if right is
+        true).
+        """
+        cdef int64_t ikey = 0
+        cdef uint64_t ukey = 0
+        cdef double dkey = 0
+        cdef Py_ssize_t lo = 0, hi = count, mid
+        cdef int c
+        c = self._primitive_key(ifmt, value, &ikey, &ukey, &dkey)
+        if c < 0:
+            return 0
+        elif c > 0:
+            return count
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            c = self._cmp_primitive(offset + (start + mid*step)*item_length, ifmt,
+                                    ikey, ukey, dkey)
+            # like the bisect module: "not value < item" if right, else
+            # "item < value"
+            if (c != 1) if right else (c == -1):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
 
 cdef class BaseSegmentForTests(object):
     """
@@ -120,9 +335,16 @@ cdef class BaseSegmentForTests(object):
     """
     cdef BaseSegment s
 
-    def __cinit__(self, bytes buf):
+    def __cinit__(self, object buf):
         self.s = BaseSegment(buf)
 
+    property writable:
+        def __get__(self):
+            return self.s.writable
+
+    def read_bytes(self, Py_ssize_t start, Py_ssize_t end):
+        return self.s.read_bytes(start, end)
+
     def read_primitive(self, Py_ssize_t offset, char ifmt):
         return self.s.read_primitive(offset, ifmt)
 
@@ -158,3 +380,20 @@ cdef class BaseSegmentForTests(object):
 
     def read_float(self, Py_ssize_t offset):
         return self.s.read_float(offset)
+
+    def read_str_list(self, Py_ssize_t offset, Py_ssize_t start, Py_ssize_t step,
+                      Py_ssize_t count, int additional_size, bint decode):
+        return self.s.read_str_list(offset, start, step, count,
+                                    additional_size, decode)
+
+    def find_primitive(self, Py_ssize_t offset, Py_ssize_t item_length, char ifmt,
+                       Py_ssize_t start, Py_ssize_t step, Py_ssize_t count,
+                       object value):
+        return self.s.find_primitive(offset, item_length, ifmt, start, step,
+                                     count, value)
+
+    def bisect_primitive(self, Py_ssize_t offset, Py_ssize_t item_length, char ifmt,
+                         Py_ssize_t start, Py_ssize_t step, Py_ssize_t count,
+                         object value, bint right):
+        return self.s.bisect_primitive(offset, item_length, ifmt, start, step,
+                                       count, value, right)
@@ -1,3 +1,70 @@
+import struct
+from capnpy import ptr
+
+
+def round_to_word(pos):
+    return (pos + (8 - 1)) & -8  # Round up to 8-byte boundary
+
+
 class SegmentBuilder(object):
-    WIP = True
+    """
+    Pure python version of builder.pyx: it is used when the extension modules
+    are not compiled, e.g. on PyPy.
+    """
+
+    def __init__(self, length=512):
+        self.length = length
+        self.buf = bytearray(self.length)
+        self.end = 0
+
+    def _resize(self, minlen):
+        # see builder.pyx for the formula
+        newlen = self.length + (self.length >> 1) + 512
+        newlen = max(minlen, newlen)
+        newlen = round_to_word(newlen)
+        self.buf.extend('\x00' * (newlen - self.length))
+        self.length = newlen
+
+    def as_string(self):
+        return str(self.buf[:self.end])
+
+    def write_int64(self, i, value):
+        struct.pack_into('q', self.buf, i, value)
+
+    def write_bytes(self, i, s):
+        self.buf[i:i+len(s)] = s
+
+    def allocate(self, length):
+        """
+        Allocate ``length`` bytes of memory inside the buffer. Return the start
+        position of the newly allocated space.
+        """
+        result = self.end
+        self.end += length
+        if self.end > self.length:
+            self._resize(self.end)
+        return result
+
+    def alloc_struct(self, pos, data_size, ptrs_size):
+        """
+        Allocate a new struct of the given size, and write the resulting pointer
+        at position i. Return the newly allocated position.
+        """
+        length = (data_size+ptrs_size) * 8
+        result = self.allocate(length)
+        offet = result - (pos+8)
+        p = ptr.new_struct(offet/8, data_size, ptrs_size)
+        self.write_int64(pos, p)
+        return result
 
+    def alloc_list(self, pos, size_tag, item_count, body_length):
+        """
+        Allocate a new list of the given size, and write the resulting pointer
+        at position i. Return the newly allocated position.
+        """
+        body_length = round_to_word(body_length)
+        result = self.allocate(body_length)
+        offet = result - (pos+8)
+        p = ptr.new_list(offet/8, size_tag, item_count)
+        self.write_int64(pos, p)
+        return result
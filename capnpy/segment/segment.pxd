@@ -2,6 +2,7 @@ cimport cython
 from capnpy.segment.base cimport BaseSegment
 from capnpy cimport ptr
 from capnpy cimport _hash
+from capnpy.packing cimport pack_into
 
 
 cdef class Segment(BaseSegment):
@@ -14,6 +15,29 @@ cdef class Segment(BaseSegment):
     @cython.locals(p=long, start=long, size=long)
     cpdef long hash_str(self, long p, long offset, long default_, int additional_size) except -1
 
+    cpdef write_primitive(self, long offset, char ifmt, object value)
+
 
 cdef class MultiSegment(Segment):
     cdef readonly object segment_offsets
+
+
+cdef class WritableSegment(Segment):
+    cdef readonly long end
+
+    @cython.locals(result=long, newlen=long)
+    cpdef long allocate(self, long length) except -1
+
+    @cython.locals(result=long, p=long)
+    cpdef long alloc_struct(self, long pos, long data_size, long ptrs_size) except -1
+
+    @cython.locals(result=long, p=long)
+    cpdef long alloc_list(self, long pos, long size_tag, long item_count,
+                          long body_length) except -1
+
+    @cython.locals(n=long, result=long)
+    cpdef long alloc_str(self, long pos, bytes s, int additional_size) except -1
+
+    cpdef write_bytes(self, long pos, bytes s)
+    cpdef reset(self)
+    cpdef bytes as_string(self)
@@ -1,7 +1,7 @@
 from capnpy.segment.base import BaseSegment
 from capnpy import ptr
 from capnpy import _hash
-from capnpy.printer import print_buffer, BufferPrinter
+from capnpy.packing import pack_into
 
 
 class Segment(BaseSegment):
@@ -47,7 +47,7 @@ class Segment(BaseSegment):
         assert ptr.list_size_tag(p) == ptr.LIST_SIZE_8
         start = ptr.deref(p, offset)
         end = start + ptr.list_item_count(p) + additional_size
-        return self.buf[start:end]
+        return self.read_bytes(start, end)
 
     def hash_str(self, p, offset, default_, additional_size):
         if p == 0:
@@ -56,9 +56,22 @@ class Segment(BaseSegment):
         assert ptr.list_size_tag(p) == ptr.LIST_SIZE_8
         start = ptr.deref(p, offset)
         size = ptr.list_item_count(p) + additional_size
+        if self.writable:
+            return _hash.strhash(self.read_bytes(start, start+size), 0, size)
         return _hash.strhash(self.buf, start, size)
 
+    def write_primitive(self, offset, ifmt, value):
+        """
+        Write a primitive value at the given offset. This is possible only if
+        the segment is backed by a bytearray.
+        """
+        if not self.writable:
+            raise TypeError("Cannot modify a read-only message: load it from "
+                            "a bytearray to make it writable")
+        pack_into(ifmt, self.buf, offset, value)
+
     def _print(self, **kwds):
+        from capnpy.printer import BufferPrinter
         p = BufferPrinter(self.buf)
         p.printbuf(start=0, end=None, **kwds)
 
@@ -90,3 +103,78 @@ class MultiSegment(Segment):
         offset  = segment_start + ptr.far_offset(p)*8
         p = self.read_ptr(offset)
         return offset, p
+
+
+class WritableSegment(Segment):
+    """
+    A single segment backed by a bytearray which grows on demand, used by
+    MessageBuilder to build messages in place. New objects are allocated at
+    ``end``; the allocation methods have the same interface as the ones of
+    SegmentBuilder.
+    """
+
+    def __init__(self, buf):
+        assert isinstance(buf, bytearray)
+        super(WritableSegment, self).__init__(buf)
+        self.end = 0
+
+    def allocate(self, length):
+        """
+        Allocate ``length`` bytes of memory, rounded up to a multiple of 8.
+        Return the start position of the newly allocated space.
+        """
+        result = self.end
+        self.end += (length + 7) & -8
+        if self.end > len(self.buf):
+            # exponential growth, see SegmentBuilder._resize
+            newlen = len(self.buf) + (len(self.buf) >> 1) + 512
+            newlen = max(self.end, newlen)
+            self._grow((newlen + 7) & -8)
+        return result
+
+    def alloc_struct(self, pos, data_size, ptrs_size):
+        """
+        Allocate a new struct of the given size, and write the resulting pointer
+        at position pos. Return the newly allocated position.
+        """
+        result = self.allocate((data_size+ptrs_size) * 8)
+        p = ptr.new_struct((result - (pos+8)) / 8, data_size, ptrs_size)
+        self.write_primitive(pos, ord('q'), p)
+        return result
+
+    def alloc_list(self, pos, size_tag, item_count, body_length):
+        """
+        Allocate a new list of the given size, and write the resulting pointer
+        at position pos. Return the newly allocated position.
+        """
+        result = self.allocate(body_length)
+        p = ptr.new_list((result - (pos+8)) / 8, size_tag, item_count)
+        self.write_primitive(pos, ord('q'), p)
+        return result
+
+    def alloc_str(self, pos, s, additional_size):
+        """
+        Allocate a copy of s as Text or Data, and write the resulting pointer at
+        position pos. additional_size has the same meaning as in read_str:
+        pass -1 to add the trailing '\0' of Text.
+        """
+        n = len(s) - additional_size
+        result = self.alloc_list(pos, ptr.LIST_SIZE_8, n, n)
+        self.write_bytes(result, s)
+        return result
+
+    def write_bytes(self, pos, s):
+        """
+        Copy the string s at position pos, which must be already allocated
+        """
+        self.buf[pos:pos+len(s)] = s
+
+    def reset(self):
+        """
+        Discard all the allocated objects, so that the buffer can be reused
+        """
+        self._clear(0, self.end)
+        self.end = 0
+
+    def as_string(self):
+        return self.read_bytes(0, self.end)
@@ -1,9 +1,10 @@
 import cython
 from capnpy.blob cimport Blob
-from capnpy.visit cimport end_of, is_compact
+from capnpy.visit cimport end_of, is_compact, validate
 from capnpy cimport ptr
-from capnpy.list cimport List, ItemType
-from capnpy.packing cimport pack_int64
+from capnpy.list cimport List, ItemType, StructItemType
+from capnpy.packing cimport pack_int64, unpack_int64
+from capnpy.segment.segment cimport WritableSegment
 
 cpdef str check_tag(str curtag, str newtag)
 
@@ -22,14 +23,50 @@ cdef class Struct(Blob):
     cpdef _init_from_buffer(self, object buf, long offset,
                             long data_size, long ptrs_size)
     cpdef _init_from_pointer(self, object buf, long offset, long p)
+    cpdef _reset_cache(self)
     cpdef _read_data(self, long offset, char ifmt)
     cpdef long _read_data_int16(self, long offset)
+
+    @cython.locals(result=list, offset=long, ifmt=char, bitmask=long)
+    cpdef tuple _project_data(self, tuple fields)
+
+    cpdef _write_data(self, long offset, char ifmt, object value)
+
+    @cython.locals(val=long)
+    cpdef _write_bit(self, long offset, long bitmask, bint value)
+    cpdef _set_union_tag(self, long tag)
+
+    cdef long _writable_pos(self, long offset) except -1
+
+    @cython.locals(pos=long, seg=WritableSegment)
+    cpdef _set_str(self, long offset, object value, int additional_size)
+
+    @cython.locals(pos=long, seg=WritableSegment, data_size=long,
+                   ptrs_size=long, start=long, p=long)
+    cpdef _set_struct(self, long offset, type structcls, object value)
+
+    @cython.locals(pos=long, seg=WritableSegment, data_size=long,
+                   ptrs_size=long, start=long)
+    cpdef _init_struct(self, long offset, type structcls)
+
+    @cython.locals(pos=long, seg=WritableSegment, item_length=long,
+                   size_tag=long, struct_item_type=StructItemType,
+                   data_size=long, ptrs_size=long, start=long, tag=long)
+    cpdef _init_list(self, long offset, ItemType item_type, long item_count)
     cpdef long _read_fast_ptr(self, long offset)
     cpdef _read_far_ptr(self, long offset)
 
     @cython.locals(p=long, obj=Struct)
     cpdef _read_struct(self, long offset, type structcls)
 
+    @cython.locals(obj=Struct)
+    cpdef _read_group(self, type groupcls)
+
+    cpdef _convert_struct(self, long offset, type structcls, bint as_dict)
+
+    @cython.locals(lst=List)
+    cpdef _convert_list(self, long offset, ItemType item_type, bint as_dict)
+
     @cython.locals(p=long, offset=long)
     cpdef _read_str_text(self, long offset, str default_=*)
 
@@ -51,14 +88,19 @@ cdef class Struct(Blob):
     cpdef long _get_body_start(self)
     cpdef long _get_body_end(self)
 
-    @cython.locals(i=long)
-    cpdef long _get_extra_start(self)
     cpdef long _get_end(self)
     cpdef long _is_compact(self)
+    cpdef validate(self)
+
+    @cython.locals(offset=long, p=long)
+    cpdef bint _is_root(self) except -1
 
-    @cython.locals(body_start=long, body_end=long, extra_start=long, extra_end=long,
-                   j=long, data_size=long, old_extra_offset=long, additional_offset=long)
+    @cython.locals(buf=bytes, data_length=long, body_length=long, j=long, p=long)
     cpdef object _split(self, long extra_offset)
 
     cpdef object compact(self)
+
+    @cython.locals(start=long, end=long, length=long, dst_pos=long, p=long,
+                   writable=bint)
+    cpdef bytes _get_compact_buf(self)
     
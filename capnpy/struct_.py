@@ -2,9 +2,12 @@ import capnpy
 from capnpy import ptr
 from capnpy.type import Types
 from capnpy.blob import Blob
-from capnpy.visit import end_of, is_compact
+from capnpy.visit import end_of, is_compact, validate
 from capnpy.list import List
-from capnpy.packing import pack_int64
+from capnpy.packing import pack_int64, unpack_int64
+from capnpy.segment.segment import WritableSegment
+from capnpy.copy_pointer import copy_pointer
+from capnpy.segment.builder import SegmentBuilder
 
 class Undefined(object):
     def __repr__(self):
@@ -61,6 +64,10 @@ class Struct(Blob):
         ptrs_size = ptr.struct_ptrs_size(p)
         self._init_from_buffer(buf, struct_offset, data_size, ptrs_size)
 
+    def _reset_cache(self):
+        # overridden by the structs which have $Py.cache fields
+        pass
+
     def __reduce__(self):
         # pickle support
         args = (self.__class__, self._seg, self._data_offset,
@@ -72,12 +79,21 @@ class Struct(Blob):
         return struct_from_buffer(cls, buf, offset, data_size, ptrs_size)
 
     @classmethod
-    def load(cls, f):
-        return capnpy.message.load(f, cls)
+    def projector(cls, fields):
+        """
+        Return a function which reads only the given fields of a struct, or of
+        each item of a List, as tuples. See capnpy.projector.make_projector.
+        """
+        from capnpy.projector import make_projector
+        return make_projector(cls, fields)
 
     @classmethod
-    def loads(cls, s):
-        return capnpy.message.loads(s, cls)
+    def load(cls, f, mutable=False):
+        return capnpy.message.load(f, cls, mutable)
+
+    @classmethod
+    def loads(cls, s, mutable=False):
+        return capnpy.message.loads(s, cls, mutable)
 
     @classmethod
     def load_all(cls, f):
@@ -134,6 +150,119 @@ class Struct(Blob):
         val = self._read_data(offset, Types.uint8.ifmt)
         return bool(val & bitmask)
 
+    def _project_data(self, fields):
+        """
+        Read the given primitive fields with a single call, and return them as
+        a tuple: this is used by capnpy.projector. ``fields`` is a tuple of
+        (offset, ifmt, bitmask) triples, where bitmask is 0 for the fields
+        which are not bools. Fields which are beyond the data section read as
+        0, like in _read_data.
+        """
+        result = []
+        for offset, ifmt, bitmask in fields:
+            if offset >= self._data_size*8:
+                value = 0
+            else:
+                value = self._seg.read_primitive(self._data_offset+offset, ifmt)
+            if bitmask:
+                value = bool(value & bitmask)
+            result.append(value)
+        return tuple(result)
+
+    def _write_data(self, offset, ifmt, value):
+        # used by the generated setters: the segment must be writable
+        if offset >= self._data_size*8:
+            raise ValueError("Cannot write at offset %d: the field is not "
+                             "present in the message, which was probably "
+                             "written using an older schema" % offset)
+        self._seg.write_primitive(self._data_offset+offset, ifmt, value)
+
+    def _write_bit(self, offset, bitmask, value):
+        val = self._read_data(offset, Types.uint8.ifmt)
+        if value:
+            val |= bitmask
+        else:
+            val &= ~bitmask
+        self._write_data(offset, Types.uint8.ifmt, val)
+
+    def _set_union_tag(self, tag):
+        self._write_data(self.__tag_offset__, Types.int16.ifmt, tag)
+
+    # ------------------------------------------------------
+    # Incremental building
+    # ------------------------------------------------------
+    #
+    # the following methods are used by the generated set_*() and init_*()
+    # methods of pointer fields: they allocate the new objects at the end of
+    # the segment, which must be a WritableSegment (see MessageBuilder)
+
+    def _writable_pos(self, offset):
+        if not isinstance(self._seg, WritableSegment):
+            raise TypeError("Cannot allocate objects inside this message: use "
+                            "a MessageBuilder to build messages in place")
+        if offset >= self._ptrs_size*8:
+            raise ValueError("Cannot write at offset %d: the field is not "
+                             "present in the message, which was probably "
+                             "written using an older schema" % offset)
+        self._reset_cache()
+        return self._ptrs_offset + offset
+
+    def _set_str(self, offset, value, additional_size):
+        pos = self._writable_pos(offset)
+        seg = self._seg
+        if value is None:
+            seg.write_primitive(pos, Types.int64.ifmt, 0)
+        else:
+            seg.alloc_str(pos, value, additional_size)
+
+    def _set_struct(self, offset, structcls, value):
+        pos = self._writable_pos(offset)
+        seg = self._seg
+        if value is None:
+            seg.write_primitive(pos, Types.int64.ifmt, 0)
+            return
+        if isinstance(value, dict):
+            buf = structcls._buf_from_dict(value)
+            data_size = structcls.__static_data_size__
+            ptrs_size = structcls.__static_ptrs_size__
+        elif isinstance(value, structcls):
+            buf = value._get_compact_buf()
+            data_size = value._data_size
+            ptrs_size = value._ptrs_size
+        else:
+            raise TypeError("Expected %s instance, got %s" %
+                            (structcls.__name__, value))
+        start = seg.allocate(len(buf))
+        seg.write_bytes(start, buf)
+        p = ptr.new_struct((start - (pos+8)) / 8, data_size, ptrs_size)
+        seg.write_primitive(pos, Types.int64.ifmt, p)
+
+    def _init_struct(self, offset, structcls):
+        pos = self._writable_pos(offset)
+        seg = self._seg
+        data_size = structcls.__static_data_size__
+        ptrs_size = structcls.__static_ptrs_size__
+        start = seg.alloc_struct(pos, data_size, ptrs_size)
+        return struct_from_buffer(structcls, seg, start, data_size, ptrs_size)
+
+    def _init_list(self, offset, item_type, item_count):
+        pos = self._writable_pos(offset)
+        seg = self._seg
+        item_length, size_tag = item_type.get_item_length()
+        if size_tag == ptr.LIST_SIZE_COMPOSITE:
+            # the list is preceded by a tag which contains the item count
+            struct_item_type = item_type
+            data_size = struct_item_type.static_data_size
+            ptrs_size = struct_item_type.static_ptrs_size
+            start = seg.alloc_list(pos, size_tag,
+                                   (data_size+ptrs_size) * item_count,
+                                   8 + item_length*item_count)
+            tag = ptr.new_struct(item_count, data_size, ptrs_size)
+            seg.write_primitive(start, Types.int64.ifmt, tag)
+        else:
+            seg.alloc_list(pos, size_tag, item_count, item_length*item_count)
+        return self._read_list(offset, item_type)
+
     def _read_enum(self, offset, enumtype):
         val = self._read_data(offset, Types.int16.ifmt)
         return enumtype(val)
@@ -155,6 +284,16 @@ class Struct(Blob):
         obj._init_from_pointer(self._seg, offset, p)
         return obj
 
+    def _read_group(self, groupcls):
+        """
+        Return an instance of ``groupcls`` which shares the data and pointers
+        sections of ``self``.
+        """
+        obj = groupcls.__new__(groupcls)
+        obj._init_from_buffer(self._seg, self._data_offset,
+                              self._data_size, self._ptrs_size)
+        return obj
+
     def _read_list(self, offset, item_type, default_=None):
         p = self._read_fast_ptr(offset)
         if ptr.kind(p) == ptr.FAR:
@@ -175,6 +314,20 @@ class Struct(Blob):
                               item_type)
         return obj
 
+    def _convert_struct(self, offset, structcls, as_dict):
+        obj = self._read_struct(offset, structcls)
+        if obj is None:
+            return None
+        if as_dict:
+            return obj.to_dict()
+        return obj.to_tuple()
+
+    def _convert_list(self, offset, item_type, as_dict):
+        lst = self._read_list(offset, item_type)
+        if lst is None:
+            return None
+        return item_type.convert_list(lst, as_dict)
+
     def _read_str_text(self, offset, default_=None):
         return self._read_str_data(offset, default_, additional_size=-1)
 
@@ -210,20 +363,6 @@ class Struct(Blob):
     def _get_body_end(self):
         return self._data_offset + (self._data_size + self._ptrs_size) * 8
 
-    def _get_extra_start(self):
-        if self._ptrs_size == 0:
-            return self._get_body_end()
-        i = 0
-        while i < self._ptrs_size:
-            p = self._read_fast_ptr(i*8)
-            assert ptr.kind(p) != ptr.FAR
-            if p != 0:
-                return self._ptrs_offset + ptr.deref(p, i*8)
-            i += 1
-        #
-        # if we are here, it means that all ptrs are null
-        return self._get_body_end()
-
     def _get_end(self):
         p = ptr.new_struct(0, self._data_size, self._ptrs_size)
         return end_of(self._seg, p, self._data_offset-8)
@@ -232,78 +371,118 @@ class Struct(Blob):
         p = ptr.new_struct(0, self._data_size, self._ptrs_size)
         return is_compact(self._seg, p, self._data_offset-8)
 
+    def validate(self):
+        """
+        Check that this struct and all the objects reachable from it lie inside
+        the bounds of the buffer, then switch the segment into unchecked mode:
+        from now on, reading fields no longer does any bounds check.
+
+        Since the mode is per-segment, it must be called on the root object
+        of the message: else, the objects which are not reachable from self
+        would be read without any check. Raise ValueError if it is not the
+        case.
+        """
+        if not self._is_root():
+            raise ValueError("validate() must be called on the root object "
+                             "of the message")
+        # the buffer might have changed since the last validation: the
+        # visitor must not read it in unchecked mode
+        self._seg.unchecked = False
+        p = ptr.new_struct(0, self._data_size, self._ptrs_size)
+        validate(self._seg, p, self._data_offset-8)
+        self._seg.unchecked = True
+
+    def _is_root(self):
+        """
+        Return True if self is the root of the message, i.e. if it is pointed
+        by the first word of the first segment, or if its body starts there
+        (e.g., if it has been built by the constructor)
+        """
+        if self._data_offset == 0:
+            return True
+        seg = self._seg
+        offset = 0
+        p = seg.read_ptr(offset)
+        if ptr.kind(p) == ptr.FAR:
+            offset, p = seg.read_far_ptr(offset)
+        return (ptr.kind(p) == ptr.STRUCT and
+                ptr.deref(p, offset) == self._data_offset)
+
     def _split(self, extra_offset):
         """
         Split the body and the extra part.  The extra part must be placed at the
         specified offset, in words. The ptrs in the body will be adjusted
         accordingly.
         """
-        body_start = self._get_body_start()
-        body_end = self._get_body_end()
-        if self._ptrs_size == 0:
-            # easy case, just copy the body
-            return self._seg.buf[body_start:body_end], ''
-        #
-        # hard case. The layout of self._seg is like this:
-        # +----------+------+------+----------+-------------+
-        # | garbage0 | data | ptrs | garbage1 |    extra    |
-        # +----------+------+------+----------+-------------+
-        #                    |   |             ^     ^
-        #                    +-----------------+     |
-        #                        |                   |
-        #                        +-------------------+
-        #
-        # We recompute the pointers assumining len(garbage1) == extra_offset
+        # The compact buffer contains the body immediately followed by the
+        # extra part, and it is built by following the pointers: so, the
+        # children can be anywhere in the original segment (e.g., if the
+        # object was built by a MessageBuilder)
+        buf = self._get_compact_buf()
+        data_length = self._data_size*8
+        body_length = data_length + self._ptrs_size*8
+        if self._ptrs_size == 0 or extra_offset == 0:
+            # the pointers are already correct, copy everything verbatim
+            return buf[:body_length], buf[body_length:]
         #
-        # 1) the data section is copied verbatim
-        # 2) the offset of pointers in ptrs are adjusted
-        # 3) extra is copied verbatim
-        #
-        extra_start = self._get_extra_start()
-        extra_end = self._get_end()
-        #
-        # 1) data section
-        data_size = self._data_size
-        data_buf = self._seg.buf[body_start:body_start+data_size*8]
-        #
-        # 2) ptrs section
-        #    for each ptr:
-        #        ptr.offset += (extra_offset - old_extra_offset)/8
-        #
-        # NOTE: ptr.offset is in words, extra_start and body_end in bytes
-        old_extra_offset = (extra_start - body_end)/8
-        additional_offset = extra_offset - old_extra_offset
-        #
-        # iterate over and fix the pointers
-        parts = [data_buf]
-        j = 0
-        while j < self._ptrs_size:
-            # read pointer, update its offset, and pack it
-            p = self._read_fast_ptr(j*8)
+        # the offset of the pointers in the body must be adjusted:
+        #     ptr.offset += extra_offset
+        parts = [buf[:data_length]]
+        j = data_length
+        while j < body_length:
+            p = unpack_int64(buf, j)
             if p != 0:
-                assert ptr.kind(p) != ptr.FAR
                 p = ptr.new_generic(ptr.kind(p),
-                                    ptr.offset(p)+additional_offset,
+                                    ptr.offset(p)+extra_offset,
                                     ptr.extra(p))
-            s = pack_int64(p)
-            parts.append(s)
-            j += 1
-        #
-        body_buf = ''.join(parts)
-        # 3) extra part
-        extra_buf = self._seg.buf[extra_start:extra_end]
+            parts.append(pack_int64(p))
+            j += 8
         #
-        return body_buf, extra_buf
+        return ''.join(parts), buf[body_length:]
 
     def compact(self):
         """
         Return a compact version of the object, removing the garbage around the
         body and the extra parts.
         """
-        body, extra = self._split(0)
-        buf = body+extra
+        buf = self._get_compact_buf()
         return self.__class__.from_buffer(buf, 0, self._data_size, self._ptrs_size)
 
+    def _get_compact_buf(self):
+        """
+        Return a string containing the body and the extra parts of the
+        object, without garbage: since it contains only relative pointers, it
+        can be copied as is into another message.
+
+        If the object is already compact, we just take a slice of its buffer,
+        or the buffer itself if the object spans all of it (e.g., if it has
+        just been built by the constructor). Else, we copy the object into a
+        new segment by following its pointers.
+        """
+        seg = self._seg
+        buf = seg.buf
+        start = self._get_body_start()
+        # the objects allocated by a MessageBuilder can be in any order, so
+        # _is_compact() and _get_end() are not reliable there
+        writable = isinstance(seg, WritableSegment)
+        if not writable and self._is_compact():
+            end = self._get_end()
+            if start == 0 and end == len(buf) and type(buf) is bytes:
+                return buf
+            return seg.read_bytes(start, end)
+        #
+        # copy the object into a new segment, right after the pointer which
+        # points to it
+        if writable:
+            length = seg.end - start + 8
+        else:
+            length = self._get_end() - start + 8
+        dst = SegmentBuilder(length)
+        dst_pos = dst.allocate(8)
+        p = ptr.new_struct(0, self._data_size, self._ptrs_size)
+        copy_pointer(buf, p, self._data_offset-8, dst, dst_pos)
+        return dst.as_string()[8:]
+
 
     # ----------------------
     # hashing and equality
@@ -0,0 +1,115 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestCache(CompilerTest):
+
+    def test_cache_on_field(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            p @0 :Point $Py.cache;
+            q @1 :Point;
+            items @2 :List(Int64) $Py.cache;
+            name @3 :Text $Py.cache;
+            data @4 :Data $Py.cache;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(p=mod.Point(1, 2), q=mod.Point(3, 4), items=[1, 2, 3],
+                      name='foo', data='bar')
+        assert foo.p is foo.p
+        assert foo.p.x == 1
+        assert foo.q is not foo.q
+        assert foo.items is foo.items
+        assert foo.items == [1, 2, 3]
+        assert foo.name is foo.name
+        assert foo.name == 'foo'
+        assert foo.data is foo.data
+        assert foo.data == 'bar'
+        #
+        # each instance has its own cache
+        foo2 = mod.Foo.loads(foo.dumps())
+        assert foo2.p is not foo.p
+        assert foo2.p.x == 1
+
+    def test_cache_on_struct(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo $Py.cache {
+            p @0 :Point;
+            items @1 :List(Point);
+            inner :group {
+                name @2 :Text;
+                q @3 :Point;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(p=mod.Point(1, 2), items=[mod.Point(3, 4)],
+                      inner=('foo', mod.Point(5, 6)))
+        assert foo.p is foo.p
+        assert foo.items is foo.items
+        assert foo.inner is foo.inner
+        assert foo.inner.name is foo.inner.name
+        assert foo.inner.q is foo.inner.q
+        assert foo.inner.q.y == 6
+
+    def test_null_is_not_cached(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Foo $Py.cache {
+            name @0 :Text;
+            items @1 :List(Int64);
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(name=None, items=None)
+        assert foo.name is None
+        assert foo.items is None
+        assert foo.get_name() == ''
+        assert foo.get_items() == []
+
+    def test_cache_union(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Shape $Py.cache {
+          union {
+            circle @0 :Text;
+            square @1 :List(Int64);
+          }
+        }
+        """
+        mod = self.compile(schema)
+        s = mod.Shape(circle='round')
+        assert s.circle is s.circle
+        py.test.raises(ValueError, "s.square")
+        py.test.raises(ValueError, "s.square")
+
+    def test_cache_and_cursor(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Foo {
+            x @0 :Int64;
+            name @1 :Text $Py.cache;
+        }
+        struct Bar {
+            foos @0 :List(Foo);
+        }
+        """
+        mod = self.compile(schema)
+        bar = mod.Bar([mod.Foo(1, 'a'), mod.Foo(2, 'b')])
+        names = [foo.name for foo in bar.foos.cursor()]
+        assert names == ['a', 'b']
@@ -22,7 +22,7 @@ class TestDistutilsCompiler(CompilerTest):
 
     def compile(self, filename):
         filename = self.tmpdir.join(filename)
-        compiler = DistutilsCompiler([])
+        compiler = DistutilsCompiler([self.tmpdir])
         return compiler.compile(filename, pyx=self.pyx)
 
     def test_simple(self):
@@ -61,6 +61,50 @@ class TestDistutilsCompiler(CompilerTest):
         assert outfile == outfile3
         assert outfile3.mtime() > mtime
 
+    def test_recompile_if_import_is_newer(self):
+        self.write("p.capnp", """
+        @0xbf5147cbbecf40c2;
+        struct Point {
+            x @0: Int64;
+            y @1: Int64;
+        }
+        """)
+        self.write("example.capnp", """
+        @0xbf5147cbbecf40c1;
+        using P = import "/p.capnp";
+        struct Rectangle {
+            a @0: P.Point;
+            b @1: P.Point;
+        }
+        """)
+        outfile = self.compile("example.capnp")
+        mtime = outfile.mtime()
+        outfile2 = self.compile("example.capnp")
+        assert outfile2.mtime() == mtime
+        #
+        self.tmpdir.join("p.capnp").setmtime(mtime+1)
+        outfile3 = self.compile("example.capnp")
+        assert outfile3.mtime() > mtime
+
+    def test_capnpify_parallel(self, monkeypatch):
+        from capnpy.compiler import distutils
+        monkeypatch.setattr(distutils, 'cythonize', lambda exts, nthreads: exts)
+        for i in range(4):
+            self.write("example%d.capnp" % i, """
+            @0xbf5147cbbecf40c{i};
+            struct Point {{
+                x @0: Int64;
+                y @1: Int64;
+            }}
+            """, i=i)
+        files = [str(self.tmpdir.join("example%d.capnp" % i)) for i in range(4)]
+        exts = distutils.capnpify(files, pyx=self.pyx, nthreads=2)
+        ext = 'pyx' if self.pyx else 'py'
+        for i in range(4):
+            assert self.tmpdir.join("example%d.%s" % (i, ext)).check(file=True)
+        if self.pyx:
+            assert len(exts) == 4
+
 
 class TestSetup(CompilerTest):
 
@@ -1,4 +1,6 @@
 import py
+import math
+from capnpy.blob import PYX
 from capnpy.testing.compiler.support import CompilerTest
 
 class TestField(CompilerTest):
@@ -25,6 +27,49 @@ class TestField(CompilerTest):
         assert p.x == 1
         assert p.y == 2
 
+    def test_primitive_types(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color { red @0; green @1; blue @2; }
+        struct Foo {
+            i8 @0 :Int8;
+            u8 @1 :UInt8;
+            i16 @2 :Int16;
+            u16 @3 :UInt16;
+            i32 @4 :Int32;
+            u32 @5 :UInt32;
+            i64 @6 :Int64;
+            u64 @7 :UInt64;
+            f32 @8 :Float32;
+            f64 @9 :Float64;
+            color @10 :Color;
+            flag @11 :Bool;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(i8=-1, u8=255, i16=-2, u16=65535, i32=-3,
+                      u32=2**32-1, i64=-4, u64=2**64-1, f32=1.5, f64=2.5,
+                      color=mod.Color.blue, flag=True)
+        foo = mod.Foo.loads(foo.dumps())
+        assert (foo.i8, foo.u8, foo.i16, foo.u16, foo.i32, foo.u32,
+                foo.i64, foo.u64, foo.f32, foo.f64) == (
+                    -1, 255, -2, 65535, -3, 2**32-1, -4, 2**64-1, 1.5, 2.5)
+        assert foo.color == mod.Color.blue
+        assert foo.flag is True
+        if self.pyx or not PYX:
+            # the generated getters call the typed readers of the segment
+            src = self.getm(schema).code.build()
+            assert 'self._seg.read_int32(self._data_offset+8)' in src
+        #
+        # the fields beyond the data section read as 0
+        buf = '\xff\xff\xfe\xff\xff\xff\x02\x00' # i8, u8, i16, u16, color
+        foo = mod.Foo.from_buffer(buf, 0, 1, 0)
+        assert (foo.i8, foo.u8, foo.i16, foo.u16) == (-1, 255, -2, 65535)
+        assert foo.color == mod.Color.blue
+        assert (foo.i32, foo.u32, foo.i64, foo.u64, foo.f32, foo.f64) == (
+            0, 0, 0, 0, 0, 0)
+        assert foo.flag is False
+
     def test_primitive_default(self):
         schema = """
         @0xbf5147cbbecf40c1;
@@ -382,6 +427,66 @@ class TestField(CompilerTest):
         f = mod.Foo.from_buffer('', 0, data_size=0, ptrs_size=0)
         assert f.x is None
 
+    def test_layout(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color { red @0; green @1; }
+        struct Foo {
+            a @0 :Bool;
+            b @1 :Bool = true;
+            c @2 :Int16 = 42;
+            d @3 :Text;
+            color @4 :Color;
+            union {
+                x @5 :Int64;
+                y @6 :List(Int8);
+            }
+            g :group {
+                z @7 :Float64;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        layout = mod.Foo._layout
+        assert list(layout) == ['a', 'b', 'c', 'd', 'color', 'x', 'y', 'g']
+        a = layout['a']
+        assert (a.kind, a.offset, a.bitmask, a.default) == ('bool', 0, 1, False)
+        b = layout['b']
+        assert (b.kind, b.offset, b.bitmask, b.default) == ('bool', 0, 2, True)
+        c = layout['c']
+        assert (c.kind, c.offset, c.bitmask, c.default) == ('int16', 2, None, 42)
+        d = layout['d']
+        assert (d.kind, d.offset, d.ptr_index) == ('text', None, 0)
+        color = layout['color']
+        assert (color.kind, color.offset) == ('enum', 4)
+        x = layout['x']
+        assert (x.kind, x.offset, x.discriminant) == ('int64', 8, 0)
+        y = layout['y']
+        assert (y.kind, y.ptr_index, y.discriminant) == ('list', 1, 1)
+        assert layout['g'].kind == 'group'
+        assert list(layout['g'].structcls()._layout) == ['z']
+        assert a.discriminant is None
+        assert a.structcls is None
+
+    def test_layout_float_defaults(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        const limit :Float64 = -inf;
+        struct Foo {
+            a @0 :Float64 = nan;
+            b @1 :Float32 = inf;
+            c @2 :Float64 = -inf;
+            d @3 :Float64 = 1.5;
+        }
+        """
+        mod = self.compile(schema)
+        layout = mod.Foo._layout
+        assert math.isnan(layout['a'].default)
+        assert layout['b'].default == float('inf')
+        assert layout['c'].default == float('-inf')
+        assert layout['d'].default == 1.5
+        assert mod.limit == float('-inf')
+
 
 class TestList(CompilerTest):
 
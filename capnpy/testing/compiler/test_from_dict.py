@@ -0,0 +1,139 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestFromDict(CompilerTest):
+
+    def test_simple(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64 = 42;
+            name @2 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        p = mod.Point.from_dict({'x': 1, 'y': 2, 'name': 'foo'})
+        assert isinstance(p, mod.Point)
+        assert p.x == 1
+        assert p.y == 2
+        assert p.name == 'foo'
+        #
+        p = mod.Point.from_dict({})
+        assert p.to_dict() == {'x': 0, 'y': 42, 'name': None}
+        #
+        exc = py.test.raises(TypeError,
+                             "mod.Point.from_dict({'x': 1, 'z': 2, 'a': 3})")
+        assert str(exc.value) == 'Unknown field(s) for Point: a, z'
+
+    def test_nested(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Polygon {
+            name @0 :Text;
+            center @1 :Point;
+            points @2 :List(Point);
+            matrix @3 :List(List(Point));
+        }
+        """
+        mod = self.compile(schema)
+        d = {'name': 'square',
+             'center': {'x': 1, 'y': 1},
+             'points': [{'x': 0, 'y': 0}, mod.Point(2, 2)],
+             'matrix': [[{'x': 3, 'y': 4}], []]}
+        poly = mod.Polygon.from_dict(d)
+        assert poly.center.x == 1
+        assert poly.points[1].y == 2
+        d['points'][1] = {'x': 2, 'y': 2}
+        assert poly.to_dict() == d
+        #
+        # the constructor accepts dicts for struct fields too
+        poly = mod.Polygon(name='x', center={'x': 5, 'y': 6}, points=None,
+                           matrix=None)
+        assert poly.center.y == 6
+        py.test.raises(TypeError, "mod.Polygon.from_dict({'center': {'z': 1}})")
+
+    def test_nested_layout(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            flag @1 :Bool;
+            name @2 :Text;
+        }
+        struct Line {
+            a @0 :Point;
+            b @1 :Point;
+            tags @2 :List(Text);
+        }
+        struct Drawing {
+            lines @0 :List(Line);
+            main @1 :Line;
+        }
+        """
+        mod = self.compile(schema)
+        # the nested dicts are written directly into the buffer of the outer
+        # object: the result must be the same as building all the objects
+        # separately
+        d = {'lines': [{'a': {'x': 1, 'flag': True, 'name': 'a0'},
+                        'b': None,
+                        'tags': ['t0', 't1']},
+                       {'a': {'x': 2, 'flag': False, 'name': None},
+                        'b': {'x': 3, 'flag': True, 'name': 'b1'},
+                        'tags': None}],
+             'main': {'a': None,
+                      'b': {'x': 4, 'flag': True, 'name': 'main'},
+                      'tags': []}}
+        drawing = mod.Drawing.from_dict(d)
+        assert drawing.to_dict() == d
+        #
+        P, L = mod.Point, mod.Line
+        expected = mod.Drawing(
+            lines=[L(a=P(1, True, 'a0'), b=None, tags=['t0', 't1']),
+                   L(a=P(2, False, None), b=P(3, True, 'b1'), tags=None)],
+            main=L(a=None, b=P(4, True, 'main'), tags=[]))
+        assert drawing._seg.buf == expected._seg.buf
+
+    def test_union_and_groups(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square :group {
+                width @2 :Int64;
+                height @3 :Int64;
+            }
+          }
+          position :group {
+              x @4 :Int64;
+              y @5 :Int64;
+          }
+          perimeter :group $Py.nullable {
+              isNull @6 :Int8;
+              value  @7 :Int64;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        s = mod.Shape.from_dict({'area': 10, 'circle': 3})
+        assert s.which() == mod.Shape.__tag__.circle
+        assert s.to_dict() == {'area': 10, 'circle': 3,
+                               'position': {'x': 0, 'y': 0},
+                               'perimeter': None}
+        d = {'area': 10, 'square': {'width': 1, 'height': 2},
+             'position': {'x': 3, 'y': 4}, 'perimeter': 6}
+        s = mod.Shape.from_dict(d)
+        assert s.which() == mod.Shape.__tag__.square
+        assert s.to_dict() == d
+        #
+        py.test.raises(TypeError, "mod.Shape.from_dict({'circle': 1, 'square': {}})")
+        exc = py.test.raises(TypeError,
+                             "mod.Shape.from_dict({'position': {'z': 1}})")
+        assert str(exc.value) == 'Unknown field(s) for Shape.position: z'
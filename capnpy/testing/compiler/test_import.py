@@ -1,8 +1,10 @@
 import py
+import sys
 import textwrap
+import subprocess
 import capnpy
 from capnpy.testing.compiler.support import CompilerTest
-from capnpy.compiler.compiler import DynamicCompiler
+from capnpy.compiler.compiler import DynamicCompiler, StandaloneCompiler
 
 class TestImport(CompilerTest):
 
@@ -110,3 +112,206 @@ class TestImport(CompilerTest):
         """
         mod = self.compile(schema)
         assert not hasattr(mod, '_annotate_capnp')
+
+    def test_cache_dir(self, monkeypatch):
+        cache_dir = self.tmpdir.join('cache')
+        self.tmpdir.join("p.capnp").write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """)
+        self.tmpdir.join("tmp.capnp").write("""
+        @0xbf5147cbbecf40c2;
+        using P = import "/p.capnp";
+        struct Rectangle {
+            a @0 :P.Point;
+            b @1 :P.Point;
+        }
+        """)
+        comp = DynamicCompiler([self.tmpdir], cache_dir=cache_dir)
+        mod = comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)
+        assert mod.Rectangle(a={'x': 1, 'y': 2}, b=None).a.y == 2
+        assert len(cache_dir.listdir()) == 2 # tmp.capnp and p.capnp
+        #
+        # a new compiler finds the modules in the cache, without compiling
+        def generate_py_source(*args):
+            raise AssertionError('should not be called')
+        comp = DynamicCompiler([self.tmpdir], cache_dir=cache_dir)
+        monkeypatch.setattr(comp, 'generate_py_source', generate_py_source)
+        mod = comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)
+        self.check_pyx(mod)
+        assert mod.Rectangle(a={'x': 1, 'y': 2}, b=None).a.y == 2
+        #
+        # modifying an imported file invalidates the cache
+        self.tmpdir.join("p.capnp").write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+            z @2 :Int64;
+        }
+        """)
+        monkeypatch.undo()
+        comp = DynamicCompiler([self.tmpdir], cache_dir=cache_dir)
+        mod = comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)
+        assert mod.Rectangle(a={'z': 3}, b=None).a.z == 3
+        assert len(cache_dir.listdir()) == 4
+
+    def test_cache_dir_parser(self):
+        # the builtin parser and capnp might produce different requests for
+        # the same schema, so they use separate cache entries
+        cache_dir = self.tmpdir.join('cache')
+        self.tmpdir.join("p.capnp").write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """)
+        for parser in ('builtin', 'capnp'):
+            comp = DynamicCompiler([self.tmpdir], cache_dir=cache_dir,
+                                   parser=parser)
+            mod = comp.load_schema(importname="/p.capnp", pyx=self.pyx)
+            assert mod.Point(1, 2).y == 2
+        assert len(cache_dir.listdir()) == 2
+
+    def test_cache_dir_unexpected_files(self):
+        cache_dir = self.tmpdir.join('cache')
+        self.tmpdir.join("tmp.capnp").write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """)
+        comp = DynamicCompiler([self.tmpdir], cache_dir=cache_dir)
+        comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)
+        entry, = cache_dir.listdir()
+        #
+        # a stray file does not prevent to find the module
+        entry.join('.DS_Store').write('')
+        comp = DynamicCompiler([self.tmpdir], cache_dir=cache_dir)
+        mod = comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)
+        assert mod.Point(1, 2).y == 2
+        #
+        # if the module is missing, the schema is compiled again
+        for f in entry.listdir():
+            if f.basename != '.DS_Store':
+                f.remove()
+        comp = DynamicCompiler([self.tmpdir], cache_dir=cache_dir)
+        mod = comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)
+        assert mod.Point(1, 2).y == 2
+
+    def test_bundle(self, monkeypatch):
+        self.tmpdir.join("p.capnp").write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """)
+        tmp_capnp = self.tmpdir.join("tmp.capnp")
+        tmp_capnp.write("""
+        @0xbf5147cbbecf40c2;
+        using P = import "/p.capnp";
+        struct Rectangle {
+            a @0 :P.Point;
+            b @1 :P.Point;
+        }
+        """)
+        comp = DynamicCompiler([self.tmpdir])
+        bundle = comp.write_bundle(tmp_capnp)
+        assert bundle == self.tmpdir.join('tmp.capnp.bundle')
+        #
+        # the bundle contains the requests for both tmp.capnp and p.capnp,
+        # so capnp is not needed to load them
+        def capnp_compile(filename):
+            raise AssertionError('should not be called')
+        comp = DynamicCompiler([self.tmpdir])
+        monkeypatch.setattr(comp, '_capnp_compile', capnp_compile)
+        mod = comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)
+        assert mod.Rectangle(a={'x': 1, 'y': 2}, b=None).a.y == 2
+        #
+        # if an imported file changes, the bundle is ignored
+        self.tmpdir.join("p.capnp").write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+            z @2 :Int64;
+        }
+        """)
+        comp = DynamicCompiler([self.tmpdir])
+        monkeypatch.setattr(comp, '_capnp_compile', capnp_compile)
+        py.test.raises(AssertionError,
+                       'comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)')
+        monkeypatch.undo()
+        comp = DynamicCompiler([self.tmpdir])
+        mod = comp.load_schema(importname="/tmp.capnp", pyx=self.pyx)
+        assert mod.Rectangle(a={'z': 3}, b=None).a.z == 3
+
+    def test_generated_module_imports_only_the_runtime(self):
+        if self.pyx:
+            py.test.skip('the py module is enough to check the imports')
+        infile = self.tmpdir.join("example.capnp")
+        infile.write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            name @1 :Text;
+        }
+        """)
+        StandaloneCompiler(sys.path).compile(infile, pyx=False)
+        src = textwrap.dedent("""
+            import sys
+            sys.path.insert(0, %r)
+            import example
+            p = example.Point(x=1, name='foo')
+            assert (p.x, p.name) == (1, 'foo')
+            repr(p)
+            for modname in ('capnpy.compiler.compiler', 'py', 'pypytools',
+                            'json'):
+                print modname, modname in sys.modules
+        """) % str(self.tmpdir)
+        root = py.path.local(capnpy.__file__).dirpath('..')
+        out = subprocess.check_output([sys.executable, '-c', src],
+                                      cwd=str(root))
+        assert out.splitlines() == ['capnpy.compiler.compiler False',
+                                    'py False',
+                                    'pypytools False',
+                                    'json False']
+
+    def test_standalone_py_on_another_runtime(self, monkeypatch):
+        # a py module generated on top of one runtime (e.g. the pure-python
+        # one on PyPy) must work also on top of the other
+        if self.pyx:
+            py.test.skip('pyx modules are specific to the runtime')
+        import capnpy.compiler.module
+        root = py.path.local(capnpy.__file__).dirpath('..')
+        for modname, pyx_runtime in [('pure', False), ('compiled', True)]:
+            monkeypatch.setattr(capnpy.compiler.module, 'PYX', pyx_runtime)
+            infile = self.tmpdir.join("%s.capnp" % modname)
+            infile.write("""
+            @0xbf5147cbbecf40c1;
+            struct Point {
+                x @0 :Int64;
+                flag @1 :Bool;
+                union {
+                    a @2 :Int16;
+                    b @3 :Int16;
+                }
+            }
+            """)
+            StandaloneCompiler(sys.path).compile(infile, pyx=False)
+            src = textwrap.dedent("""
+                import sys
+                sys.path.insert(0, %r)
+                from %s import Point
+                p = Point(x=1, flag=True, b=3)
+                print p.x, p.flag, p.b, p.which()
+            """) % (str(self.tmpdir), modname)
+            out = subprocess.check_output([sys.executable, '-c', src],
+                                          cwd=str(root))
+            assert out.strip() == '1 True 3 b'
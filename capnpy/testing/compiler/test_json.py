@@ -0,0 +1,113 @@
+import py
+import json
+from capnpy import json as capnpy_json
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestJson(CompilerTest):
+
+    def dumps(self, obj):
+        s = capnpy_json.dumps(obj)
+        return json.loads(s)
+
+    def test_primitive(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Foo {
+            x @0 :Int64;
+            y @1 :Float64;
+            f @2 :Float32;
+            flag @3 :Bool;
+            color @4 :Color;
+            name @5 :Text;
+            data @6 :Data;
+            nothing @7 :Void;
+            big @8 :UInt64;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=-1, y=2.5, f=0.1, flag=True, color=mod.Color.green,
+                      name=u'\u20ac "quoted"\n'.encode('utf-8'), data='\x00\xff',
+                      big=2**64-1)
+        d = self.dumps(foo)
+        assert abs(d.pop('f') - 0.1) < 1e-6
+        assert d == {
+            'x': -1, 'y': 2.5, 'flag': True, 'color': 'green',
+            'name': u'\u20ac "quoted"\n', 'data': [0, 255], 'nothing': None,
+            'big': 2**64-1}
+        #
+        foo = mod.Foo(x=0, y=float('nan'), f=0, flag=False, color=mod.Color(5),
+                      name=None, data=None, big=0)
+        assert self.dumps(foo) == {
+            'x': 0, 'y': None, 'f': 0, 'flag': False, 'color': 5,
+            'name': None, 'data': None, 'nothing': None, 'big': 0}
+
+    def test_nested(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Polygon {
+            center @0 :Point;
+            points @1 :List(Point);
+            tags @2 :List(Text);
+            matrix @3 :List(List(Float64));
+            colors @4 :List(Color);
+            empty @5 :Point;
+        }
+        """
+        mod = self.compile(schema)
+        poly = mod.Polygon(center=mod.Point(1, 1),
+                           points=[mod.Point(0, 0), mod.Point(2, 2)],
+                           tags=['a', 'b\\c'],
+                           matrix=[[1.5, 2], []],
+                           colors=[mod.Color.red, mod.Color.green],
+                           empty=None)
+        assert self.dumps(poly) == {
+            'center': {'x': 1, 'y': 1},
+            'points': [{'x': 0, 'y': 0}, {'x': 2, 'y': 2}],
+            'tags': ['a', 'b\\c'],
+            'matrix': [[1.5, 2], []],
+            'colors': ['red', 'green'],
+            'empty': None}
+        assert self.dumps(poly.points) == [{'x': 0, 'y': 0}, {'x': 2, 'y': 2}]
+
+    def test_union_and_groups(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square :group {
+                width @2 :Int64;
+                height @3 :Int64;
+            }
+          }
+          perimeter :group $Py.nullable {
+              isNull @4 :Int8;
+              value  @5 :Int64;
+          }
+        }
+        struct Empty {
+        }
+        """
+        mod = self.compile(schema)
+        s = mod.Shape(area=10, circle=3, perimeter=None)
+        assert self.dumps(s) == {'area': 10, 'circle': 3, 'perimeter': None}
+        s = mod.Shape(area=10, square=(1, 2), perimeter=6)
+        assert self.dumps(s) == {'area': 10,
+                                 'square': {'width': 1, 'height': 2},
+                                 'perimeter': 6}
+        empty = mod.Empty.from_buffer('', 0, data_size=0, ptrs_size=0)
+        assert capnpy_json.dumps(empty) == '{}'
@@ -0,0 +1,150 @@
+import py
+import capnpy
+from capnpy.testing.compiler.support import CompilerTest
+from capnpy.compiler.compiler import DynamicCompiler, LazyModule
+
+
+class TestLazy(CompilerTest):
+
+    SKIP = ('pyx',)
+
+    def compile(self, s):
+        root = py.path.local(capnpy.__file__).dirpath('..')
+        comp = DynamicCompiler([root, self.tmpdir], lazy=True)
+        self.write('tmp.capnp', s)
+        return comp.load_schema(importname='/tmp.capnp', pyx=self.pyx)
+
+    def test_lazy(self):
+        mod = self.compile("""
+        @0xbf5147cbbecf40c1;
+        enum Color { red @0; green @1; }
+        const answer :Int64 = 42;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Polygon {
+            points @0 :List(Point);
+            color @1 :Color;
+        }
+        struct Unused {
+            x @0 :Int64;
+        }
+        """)
+        assert isinstance(mod, LazyModule)
+        assert mod.Color.green == 1
+        assert mod.answer == 42
+        assert 'Point' not in mod.__dict__
+        assert 'Polygon' not in mod.__dict__
+        #
+        # Polygon references Point, so both are emitted
+        points = [mod.Point(1, 2), mod.Point(3, 4)]
+        poly = mod.Polygon(points=points, color=mod.Color.green)
+        assert 'Point' in mod.__dict__
+        assert 'Unused' not in mod.__dict__
+        assert poly.points[1].y == 4
+        assert isinstance(poly.points[0], mod.Point)
+        assert poly.color == mod.Color.green
+        assert 'Unused' in dir(mod)
+        py.test.raises(AttributeError, "mod.Nonexistent")
+        #
+        # once all the structs have been emitted, the generator is dropped
+        assert mod.Unused(x=1).x == 1
+        assert '__lazy__' not in mod.__dict__
+        py.test.raises(AttributeError, "mod.Nonexistent")
+
+    def test_nested(self):
+        mod = self.compile("""
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            bar @0 :Outer.Inner;
+        }
+        struct Outer {
+            struct Inner {
+                enum Color { red @0; green @1; }
+                color @0 :Color;
+            }
+            x @0 :Int64;
+            g :group {
+                a @1 :Int64;
+                b @2 :Int64;
+            }
+        }
+        """)
+        foo = mod.Foo(bar=mod.Outer.Inner(color=mod.Outer.Inner.Color.green))
+        assert foo.bar.color == mod.Outer.Inner.Color.green
+        outer = mod.Outer(x=1, g=(2, 3))
+        assert outer.g.b == 3
+        #
+        mod = self.compile("""
+        @0xbf5147cbbecf40c1;
+        struct Outer {
+            struct Inner {
+                x @0 :Int64;
+            }
+        }
+        """)
+        # the nested classes can be accessed also through their global names
+        assert mod.Outer_Inner is mod.Outer.Inner
+
+    def test_import(self):
+        self.write('p.capnp', """
+        @0xbf5147cbbecf40c2;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Unused {
+            x @0 :Int64;
+        }
+        """)
+        mod = self.compile("""
+        @0xbf5147cbbecf40c1;
+        using P = import "/p.capnp";
+        struct Rectangle {
+            a @0 :P.Point;
+            b @1 :P.Point;
+        }
+        """)
+        rect = mod.Rectangle(a={'x': 1, 'y': 2}, b={'x': 3, 'y': 4})
+        assert rect.b.y == 4
+        pmod = mod._p_capnp
+        assert isinstance(pmod, LazyModule)
+        assert 'Point' in pmod.__dict__
+        assert 'Unused' not in pmod.__dict__
+
+    def test_extended(self):
+        self.write("tmp_extended.py", """
+        @Point.__extend__
+        class Point:
+            def x2(self):
+                return self.x * 2
+        """)
+        mod = self.compile("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """)
+        assert '__lazy__' not in mod.__dict__
+        assert mod.Point(x=2, y=3).x2() == 4
+
+    def test_errors_are_delayed(self):
+        mod = self.compile("""
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Foo {
+            x :group $Py.nullable {
+                wrongName @0 :Int8;
+                value  @1 :Int64;
+            }
+        }
+        struct Bar {
+            x @0 :Int64;
+        }
+        """)
+        assert mod.Bar(x=1).x == 1
+        py.test.raises(ValueError, "mod.Foo")
+        # the error is raised again at the next access
+        py.test.raises(ValueError, "mod.Foo")
@@ -0,0 +1,65 @@
+import py
+import capnpy
+from capnpy.testing.compiler.support import CompilerTest
+from capnpy.compiler.compiler import DynamicCompiler
+from capnpy.compiler.loadprofile import LoadProfile
+
+
+def test_report():
+    profile = LoadProfile()
+    profile.record('a.capnp', 'capnp', 1.0)
+    profile.record('b.capnp', 'capnp', 2.0)
+    profile.record('b.capnp', 'generate', 0.5)
+    profile.record('b.capnp', 'generate', 0.25)
+    assert profile.report().splitlines() == [
+        'schema      capnp  generate     total',
+        'b.capnp     2.000     0.750     2.750',
+        'a.capnp     1.000         -     1.000',
+    ]
+
+
+class TestLoadProfile(CompilerTest):
+
+    def test_phases(self):
+        self.write('p.capnp', """
+        @0xbf5147cbbecf40c2;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """)
+        self.write('tmp.capnp', """
+        @0xbf5147cbbecf40c1;
+        using P = import "/p.capnp";
+        struct Rectangle {
+            a @0 :P.Point;
+            b @1 :P.Point;
+        }
+        """)
+        self.write('tmp_extended.py', """
+        answer = 42
+        """)
+        root = py.path.local(capnpy.__file__).dirpath('..')
+        profile = LoadProfile()
+        comp = DynamicCompiler([root, self.tmpdir], profile=profile)
+        mod = comp.load_schema(importname='/tmp.capnp', pyx=self.pyx)
+        assert mod.answer == 42
+        #
+        tmp = str(self.tmpdir.join('tmp.capnp'))
+        p = str(self.tmpdir.join('p.capnp'))
+        assert set(profile.timings) == set([tmp, p])
+        if self.pyx:
+            expected = ['capnp', 'loads', 'generate', 'cython', 'cc', 'dlopen']
+        else:
+            expected = ['capnp', 'loads', 'generate', 'exec']
+        assert sorted(profile.timings[p]) == sorted(expected + ['extend'])
+        assert sorted(profile.timings[tmp]) == sorted(expected + ['extend'])
+        #
+        # the time spent loading p.capnp is not counted in the execution of
+        # tmp.capnp, which imports it
+        phase = 'dlopen' if self.pyx else 'exec'
+        assert profile.timings[tmp][phase] < profile.total(p)
+        #
+        lines = profile.report().splitlines()
+        assert lines[0].split() == ['schema'] + expected + ['extend', 'total']
+        assert len(lines) == 3
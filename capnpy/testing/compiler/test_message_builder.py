@@ -0,0 +1,218 @@
+import py
+import capnpy
+from capnpy.message_builder import MessageBuilder
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestMessageBuilder(CompilerTest):
+
+    @py.test.fixture
+    def mod(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Polygon {
+            name @0 :Text;
+            center @1 :Point;
+            points @2 :List(Point);
+            tags @3 :List(Text);
+            values @4 :List(Float64);
+            colors @5 :List(Color);
+            data @6 :Data;
+            union {
+                empty @7 :Void;
+                origin @8 :Point;
+            }
+        }
+        struct Drawing {
+            main @0 :Polygon;
+            polygons @1 :List(Polygon);
+            points @2 :List(Point);
+        }
+        """
+        return self.compile(schema)
+
+    def test_build(self, mod):
+        builder = MessageBuilder()
+        poly = builder.init_root(mod.Polygon)
+        assert builder.get_root() is poly
+        points = poly.init_points(2)
+        points[1].set_x(3)
+        points[1].set_y(4)
+        points[0].set_x(1)
+        center = poly.init_center()
+        center.set_y(6)
+        center.set_x(5)
+        poly.set_name('square')
+        tags = poly.init_tags(3)
+        tags[2] = 'c'
+        tags[0] = 'a'
+        values = poly.init_values(2)
+        values[0] = 1.5
+        values[-1] = 2.5
+        poly.init_colors(1)[0] = mod.Color.green
+        poly.set_data('\x00\xff')
+        #
+        # the objects can be read while building
+        assert poly.name == 'square'
+        assert poly.center.x == 5
+        expected = {
+            'name': 'square',
+            'center': {'x': 5, 'y': 6},
+            'points': [{'x': 1, 'y': 0}, {'x': 3, 'y': 4}],
+            'tags': ['a', None, 'c'],
+            'values': [1.5, 2.5],
+            'colors': [mod.Color.green],
+            'data': '\x00\xff',
+            'empty': None}
+        assert poly.to_dict() == expected
+        #
+        msg = builder.dumps()
+        poly2 = mod.Polygon.loads(msg)
+        assert poly2.to_dict() == expected
+        assert poly2.dumps() == poly.dumps()
+
+    def test_set_struct_and_union(self, mod):
+        builder = MessageBuilder()
+        poly = builder.init_root(mod.Polygon)
+        poly.set_center(mod.Point(1, 2))
+        poly.set_origin({'x': 3, 'y': 4})
+        assert poly.which() == mod.Polygon.__tag__.origin
+        poly2 = mod.Polygon.loads(builder.dumps())
+        assert poly2.center.to_dict() == {'x': 1, 'y': 2}
+        assert poly2.origin.to_dict() == {'x': 3, 'y': 4}
+        #
+        poly.set_name('foo')
+        poly.set_name(None)
+        poly.set_center(None)
+        assert poly.name is None
+        assert poly.center is None
+
+    def test_copy_out_of_order(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Line {
+            a @0 :Point;
+            b @1 :Point;
+        }
+        struct Shape {
+            name @0 :Text;
+            line @1 :Line;
+        }
+        struct Outer {
+            shape @0 :Shape;
+            shapes @1 :List(Shape);
+        }
+        """
+        mod = self.compile(schema)
+        builder = MessageBuilder()
+        shape = builder.init_root(mod.Shape)
+        # the first child is right after the body, but the grandchildren are
+        # allocated in the reverse order
+        shape.set_name('foo')
+        line = shape.init_line()
+        line.init_b().set_x(3)
+        line.init_a().set_x(1)
+        expected = {'name': 'foo',
+                    'line': {'a': {'x': 1, 'y': 0}, 'b': {'x': 3, 'y': 0}}}
+        #
+        shape2 = mod.Shape.loads(shape.dumps())
+        assert shape2.to_dict() == expected
+        assert shape.compact().to_dict() == expected
+        #
+        outer = mod.Outer(shape=shape, shapes=[shape, shape2])
+        outer = mod.Outer.loads(outer.dumps())
+        assert outer.shape.to_dict() == expected
+        assert [s.to_dict() for s in outer.shapes] == [expected, expected]
+
+    def test_copy_built_objects(self, mod):
+        # the objects created by _init_list, _init_struct and _set_struct are
+        # allocated at the end of the segment, after the ones created before
+        builder = MessageBuilder()
+        poly = builder.init_root(mod.Polygon)
+        center = poly.init_center()
+        center.set_x(1)
+        points = poly.init_points(2)
+        points[0].set_x(2)
+        points[1].set_y(3)
+        poly.set_name('poly')
+        poly.set_origin(center)
+        poly.init_tags(1)[0] = 'a'
+        expected = poly.to_dict()
+        #
+        d = mod.Drawing(main=poly, polygons=[poly, poly],
+                        points=[points[1], center])
+        d = mod.Drawing.loads(d.dumps())
+        assert d.main.to_dict() == expected
+        assert [p.to_dict() for p in d.polygons] == [expected, expected]
+        assert [p.to_dict() for p in d.points] == [{'x': 0, 'y': 3},
+                                                   {'x': 1, 'y': 0}]
+        #
+        # a struct allocated by the same MessageBuilder
+        builder = MessageBuilder()
+        d = builder.init_root(mod.Drawing)
+        d.set_main(poly)
+        d.main.set_origin(d.main.center)
+        d2 = mod.Drawing.loads(d.dumps())
+        assert d2.main.origin.to_dict() == {'x': 1, 'y': 0}
+        assert d2.main.points[1].to_dict() == {'x': 0, 'y': 3}
+
+    def test_errors(self, mod):
+        builder = MessageBuilder()
+        py.test.raises(ValueError, "builder.dumps()")
+        builder.init_root(mod.Point)
+        py.test.raises(ValueError, "builder.init_root(mod.Point)")
+        #
+        p = mod.Polygon.loads(mod.Polygon(name='x', center=None, points=None,
+                                          tags=None, values=None, colors=None,
+                                          data=None, empty=None).dumps(),
+                              mutable=True)
+        py.test.raises(TypeError, "p.set_name('y')")
+        py.test.raises(TypeError, "p.init_center()")
+
+    def test_grow(self, mod):
+        builder = MessageBuilder(length=16)
+        poly = builder.init_root(mod.Polygon)
+        points = poly.init_points(1000)
+        for i, p in enumerate(points):
+            p.set_x(i)
+        poly2 = mod.Polygon.loads(builder.dumps())
+        assert [p.x for p in poly2.points] == range(1000)
+
+    def test_toplevel(self):
+        assert capnpy.MessageBuilder is MessageBuilder
+
+    def test_arena(self, mod, tmpdir):
+        from capnpy.builder import Arena
+        arena = Arena(length=64)
+        buf = arena.segment.buf
+        for i in range(3):
+            builder = MessageBuilder(arena=arena)
+            poly = builder.init_root(mod.Polygon)
+            poly.set_name('poly%d' % i)
+            if i == 0:
+                poly.init_points(10)
+            msg = builder.getbuffer().tobytes()
+            assert msg == builder.dumps()
+            poly2 = mod.Polygon.loads(msg)
+            assert poly2.name == 'poly%d' % i
+            # the unused parts of the buffer are reset to zero
+            assert poly2.points is None or i == 0
+        #
+        # the buffer is reused
+        assert arena.segment.buf is buf
+        #
+        f = tmpdir.join('msg').open('wb')
+        builder.dump(f)
+        f.close()
+        assert tmpdir.join('msg').read('rb') == msg
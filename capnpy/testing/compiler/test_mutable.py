@@ -0,0 +1,104 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestMutable(CompilerTest):
+
+    def test_set_primitive(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+            blue @2;
+        }
+        struct Foo {
+            x @0 :Int64;
+            y @1 :Int8 = 42;
+            f @2 :Float64;
+            flag @3 :Bool;
+            other @4 :Bool = true;
+            color @5 :Color;
+            name @6 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=1, y=2, f=1.5, flag=False, other=False,
+                      color=mod.Color.red, name='foo')
+        foo = mod.Foo.loads(foo.dumps(), mutable=True)
+        foo.set_x(100)
+        foo.set_y(42)
+        foo.set_f(3.25)
+        foo.set_flag(True)
+        foo.set_other(True)
+        foo.set_color(mod.Color.blue)
+        assert foo.x == 100
+        assert foo.y == 42
+        assert foo.f == 3.25
+        assert foo.flag is True
+        assert foo.other is True
+        assert foo.color == mod.Color.blue
+        assert foo.name == 'foo'
+        #
+        foo2 = mod.Foo.loads(foo.dumps())
+        assert foo2.to_dict() == foo.to_dict()
+        #
+        # the default values are stored XORed
+        foo.set_y(0)
+        foo.set_other(False)
+        assert foo.y == 0
+        assert foo.other is False
+
+    def test_read_only(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=1)
+        py.test.raises(TypeError, "foo.set_x(2)")
+        foo = mod.Foo.loads(foo.dumps())
+        py.test.raises(TypeError, "foo.set_x(2)")
+        #
+        foo = mod.Foo.from_buffer(bytearray(foo.dumps()), 16, 1, 0)
+        foo.set_x(3)
+        assert foo.x == 3
+
+    def test_union(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square @2 :Int64;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        s = mod.Shape(area=10, circle=3)
+        s = mod.Shape.loads(s.dumps(), mutable=True)
+        s.set_square(5)
+        assert s.which() == mod.Shape.__tag__.square
+        assert s.square == 5
+        s.set_area(20)
+        assert s.to_dict() == {'area': 20, 'square': 5}
+
+    def test_older_schema(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Old {
+            x @0 :Int64;
+        }
+        struct New {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        old = mod.Old(x=1)
+        new = mod.New.loads(old.dumps(), mutable=True)
+        new.set_x(2)
+        assert new.x == 2
+        py.test.raises(ValueError, "new.set_y(3)")
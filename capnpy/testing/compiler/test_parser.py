@@ -0,0 +1,279 @@
+import py
+import capnpy
+from capnpy import schema
+from capnpy.message import loads
+from capnpy.testing.compiler.support import CompilerTest
+from capnpy.compiler.compiler import BaseCompiler, DynamicCompiler, CompilerError
+from capnpy.compiler.parser import parse_schema, child_id, group_id
+
+
+def test_ids():
+    # the ids computed by capnp for the schemas below
+    file_id = 0xbf5147cbbecf40c1
+    person = child_id(file_id, 'Person')
+    assert person == 10131591994439729177
+    assert group_id(person, 2) == 12969251383590363020
+
+
+class TestParser(CompilerTest):
+
+    SKIP = ('pyx',)
+
+    def parse(self, src):
+        root = py.path.local(capnpy.__file__).dirpath('..')
+        filename = self.write('tmp.capnp', src)
+        data = parse_schema(filename, [root, self.tmpdir])
+        return loads(data, schema.CodeGeneratorRequest)
+
+    def check(self, src):
+        """
+        Check that the builtin parser produces exactly the same request as capnp
+        """
+        if py.path.local.sysfind('capnp') is None:
+            py.test.skip('capnp not found')
+        root = py.path.local(capnpy.__file__).dirpath('..')
+        filename = self.write('tmp.capnp', src)
+        comp = BaseCompiler([root, self.tmpdir])
+        expected = loads(comp._capnp_compile(filename),
+                         schema.CodeGeneratorRequest)
+        got = self.parse(src)
+        def reprs(request):
+            # brand is not supported by the builtin parser, and it is ignored
+            # by capnpy anyway
+            result = [node.shortrepr().replace(', brand = ()', '')
+                      for node in request.nodes]
+            result.append(request.requestedFiles[0].shortrepr())
+            return result
+        assert reprs(got) == reprs(expected)
+        return got
+
+    def test_primitive(self):
+        self.check("""
+        @0xbf5147cbbecf40c1;
+        const answer :Int16 = -0x2a;
+        struct Foo {
+            v @0 :Void;
+            b @1 :Bool = true;
+            i8 @2 :Int8 = -128;
+            i16 @3 :Int16 = .answer;
+            i32 @4 :Int32 = 017;
+            u8 @5 :UInt8 = 255;
+            u64 @6 :UInt64 = 0xffffffffffffffff;
+            f32 @7 :Float32 = inf;
+            f64 @8 :Float64 = 1e10;
+            t @9 :Text;
+            d @10 :Data;
+            l @11 :List(List(Int8));
+            lb @12 :List(Bool);
+            any @13 :AnyPointer;
+            struct @14 :Int8;
+        }
+        """)
+
+    def test_layout(self):
+        self.check("""
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            a @0 :Bool;
+            b @1 :Int64;
+            c @2 :Int8;
+            d @3 :Text;
+            e @4 :Int16;
+            f @5 :Bool;
+            g @6 :Float32;
+            h @7 :Int32;
+        }
+        """)
+
+    def test_unions_and_groups(self):
+        self.check("""
+        @0xbf5147cbbecf40c1;
+        struct Person {
+          name @0 :Text;
+          union {
+              male @1 :Void;
+              female @4 :Void;
+          }
+          location :union {
+              home @2 :Void;
+              work @7 :Void;
+          }
+          job :union {
+              unemployed @3 :Void;
+              retired @5 :Void;
+              employed :group {
+                  companyName @6 :Text;
+                  union {
+                      finance @8 :Void;
+                      it @9 :UInt32;
+                      other @10 :Text;
+                  }
+                  position :union {
+                      manager @11 :Void;
+                      worker @12 :Bool;
+                  }
+              }
+          }
+        }
+        """)
+
+    def test_nested_unions_layout(self):
+        # the fields of a union can be allocated by expanding a data location
+        # which is already used by other members; the discriminants and the
+        # group nodes are in ordinal order
+        self.check("""
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            a @0 :Int32;
+            b @2 :Text;
+            union {
+                c @1 :Int8;
+                d @5 :Int16;
+                e :union {
+                    e1 @7 :Bool;
+                    e2 @6 :Int32;
+                }
+            }
+            f @3 :Float32;
+            g :union {
+                g1 @9 :UInt8;
+                g2 :group {
+                    g3 @4 :Int64;
+                    g4 @8 :UInt16;
+                }
+            }
+        }
+        """)
+
+    def test_nested_and_enums(self):
+        req = self.check("""
+        @0xbf5147cbbecf40c1;
+        struct Outer {
+            struct Inner {
+                enum Color { red @0; green @1; blue @2; }
+                color @0 :Color = blue;
+            }
+            inner @0 :Inner;
+            colors @1 :List(Inner.Color);
+        }
+        enum Empty {}
+        """)
+        names = [node.displayName[node.displayNamePrefixLength:]
+                 for node in req.nodes if not node.is_file()]
+        assert names == ['Outer', 'Inner', 'Color', 'Empty']
+
+    def test_annotations_and_imports(self):
+        self.write('other.capnp', """
+        @0xbf5147cbbecf40c2;
+        annotation tag(struct, field, enum, enumerant) :Text;
+        struct Point { x @0 :Int64; y @1 :Int64; }
+        enum Unused { a @0; }
+        """)
+        req = self.check("""
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        using Other = import "other.capnp";
+        using import "/other.capnp".Point;
+        annotation flag(*) :Void;
+        struct Foo $Py.key("x") $Other.tag("foo") {
+            x @0 :Int64 $flag;
+            p @1 :Point;
+            g :group $Py.nullable { isNull @2 :Int8; value @3 :Int64; }
+        }
+        enum Color $Other.tag("color") { red @0 $Other.tag("r"); }
+        """)
+        filenames = [node.displayName for node in req.nodes
+                     if node.is_file()]
+        assert filenames[0] == 'capnpy/annotate.capnp'
+        assert filenames[1] == 'other.capnp'
+
+    def test_unsupported(self):
+        exc = py.test.raises(CompilerError, """self.parse('''
+        @0xbf5147cbbecf40c1;
+        interface Foo {
+            foo @0 () -> ();
+        }
+        ''')""")
+        assert 'interfaces are not supported' in str(exc.value)
+        exc = py.test.raises(CompilerError, """self.parse('''
+        @0xbf5147cbbecf40c1;
+        struct Foo(T) {
+            x @0 :T;
+        }
+        ''')""")
+        assert 'generic structs are not supported' in str(exc.value)
+        exc = py.test.raises(CompilerError, """self.parse('''
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            d @0 :Data = 0x"0a ff";
+        }
+        ''')""")
+        assert 'data literals are not supported' in str(exc.value)
+
+    def test_errors(self):
+        exc = py.test.raises(CompilerError, """self.parse('''
+        struct Foo {}
+        ''')""")
+        assert 'file does not declare an ID' in str(exc.value)
+        exc = py.test.raises(CompilerError, """self.parse('''
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int8 = 300;
+        }
+        ''')""")
+        assert str(exc.value).endswith(':4: integer value out of range: 300')
+        exc = py.test.raises(CompilerError, """self.parse('''
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @1 :Int8;
+        }
+        ''')""")
+        assert 'skipped ordinal: @0' in str(exc.value)
+        exc = py.test.raises(CompilerError, """self.parse('''
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Bar;
+        }
+        ''')""")
+        assert 'unknown name: Bar' in str(exc.value)
+
+
+class TestParserOption(CompilerTest):
+
+    def test_builtin(self, monkeypatch):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """
+        def capnp_compile(filename):
+            assert False, 'the capnp executable should not be used'
+        self.write('tmp.capnp', schema)
+        comp = DynamicCompiler([self.tmpdir], parser='builtin')
+        monkeypatch.setattr(comp, '_capnp_compile', capnp_compile)
+        mod = comp.load_schema(importname='/tmp.capnp', pyx=self.pyx)
+        p = mod.Point(1, 2)
+        assert p.y == 2
+
+    def test_auto_fallback(self):
+        if py.path.local.sysfind('capnp') is None:
+            py.test.skip('capnp not found')
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        annotation origin(struct) :Point;
+        struct Foo $origin((x = 1, y = 2)) {
+            x @0 :Int64;
+        }
+        """
+        self.write('tmp.capnp', schema)
+        comp = DynamicCompiler([self.tmpdir], parser='builtin')
+        py.test.raises(CompilerError, "comp.load_schema(importname='/tmp.capnp', pyx=self.pyx)")
+        comp = DynamicCompiler([self.tmpdir], parser='auto')
+        mod = comp.load_schema(importname='/tmp.capnp', pyx=self.pyx)
+        assert mod.Foo(x=3).x == 3
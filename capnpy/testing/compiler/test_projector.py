@@ -0,0 +1,112 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestProjector(CompilerTest):
+
+    @py.test.fixture
+    def mod(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            a @0 :Int64;
+            b @1 :Point;
+            items @2 :List(Int64);
+            name @3 :Text;
+            pos :group {
+                x @4 :Int64;
+                y @5 :Int64;
+            }
+        }
+        struct Bag {
+            foos @0 :List(Foo);
+        }
+        """
+        return self.compile(schema)
+
+    def test_struct(self, mod):
+        foo = mod.Foo(a=1, b=mod.Point(2, 3), items=[4, 5], name='foo',
+                      pos=(6, 7))
+        project = mod.Foo.projector(['a', 'b.y', 'items', 'pos.x'])
+        assert project(foo) == (1, 3, [4, 5], 6)
+        #
+        project = mod.Foo.projector(['name'])
+        assert project(foo) == ('foo',)
+
+    def test_null(self, mod):
+        foo = mod.Foo(a=1, b=None, items=None, name=None, pos=(0, 0))
+        project = mod.Foo.projector(['a', 'b.y', 'items'])
+        assert project(foo) == (1, None, None)
+
+    def test_list(self, mod):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Polygon {
+            points @0 :List(Point);
+        }
+        """
+        mod = self.compile(schema)
+        poly = mod.Polygon([mod.Point(1, 2), mod.Point(3, 4)])
+        project = mod.Point.projector(['y', 'x'])
+        assert project(poly.points) == [(2, 1), (4, 3)]
+        assert project(poly.points[1:]) == [(4, 3)]
+        assert project(poly.points[::-1]) == [(4, 3), (2, 1)]
+
+    def test_list_mixed(self, mod):
+        foos = [mod.Foo(a=1, b=mod.Point(2, 3), items=[4], name='foo',
+                        pos=(6, 7)),
+                mod.Foo(a=8, b=None, items=None, name=None, pos=(9, 10))]
+        bag = mod.Bag.loads(mod.Bag(foos).dumps())
+        project = mod.Foo.projector(['name', 'pos.y', 'a', 'b.x', 'pos.x'])
+        expected = [('foo', 7, 1, 2, 6), (None, 10, 8, None, 9)]
+        assert project(bag.foos) == expected
+        assert [project(foo) for foo in bag.foos] == expected
+
+    def test_project_data(self, mod):
+        foo = mod.Foo(a=1, b=mod.Point(2, 3), items=None, name=None,
+                      pos=(6, 7))
+        q = ord('q')
+        assert foo._project_data(((16, q, 0), (0, q, 0))) == (7, 1)
+        assert foo.b._project_data(((8, q, 0), (64, q, 0))) == (3, 0)
+
+    def test_primitives(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            a @0 :Int8;
+            b @1 :Bool;
+            c @2 :Float64;
+            d @3 :UInt64 = 42;
+            e @4 :Bool;
+            union {
+                f @5 :Int32;
+                g @6 :Void;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(a=-1, b=False, c=1.5, d=7, e=True, f=3)
+        project = mod.Foo.projector(['a', 'b', 'c', 'd', 'e', 'f'])
+        assert project(foo) == (-1, False, 1.5, 7, True, 3)
+        #
+        # a message written with an older schema, without the data section
+        foo = mod.Foo.from_buffer('', 0, 0, 0)
+        assert project(foo) == (0, False, 0.0, 42, False, 0)
+
+    def test_errors(self, mod):
+        py.test.raises(ValueError, "mod.Foo.projector(['a', 'zzz'])")
+        py.test.raises(TypeError, "mod.Foo.projector('a')")
+        # the nested paths are checked when the projector is built
+        exc = py.test.raises(ValueError, "mod.Foo.projector(['b.z'])")
+        assert str(exc.value) == "Point has no field 'z'"
+        py.test.raises(ValueError, "mod.Foo.projector(['pos.z'])")
+        exc = py.test.raises(ValueError, "mod.Foo.projector(['a.x'])")
+        assert str(exc.value) == "Foo.a is not a struct"
+        py.test.raises(ValueError, "mod.Foo.projector(['b.x.y'])")
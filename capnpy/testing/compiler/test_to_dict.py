@@ -0,0 +1,113 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestToDict(CompilerTest):
+
+    def test_primitive(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Foo {
+            x @0 :Int64;
+            y @1 :Float64;
+            flag @2 :Bool;
+            color @3 :Color;
+            name @4 :Text;
+            data @5 :Data;
+            nothing @6 :Void;
+            z @7 :Int32 = 42;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=1, y=2.5, flag=True, color=mod.Color.green,
+                      name='foo', data='bar', z=3)
+        d = foo.to_dict()
+        assert d == {'x': 1, 'y': 2.5, 'flag': True, 'color': mod.Color.green,
+                     'name': 'foo', 'data': 'bar', 'nothing': None, 'z': 3}
+        assert type(d['color']) is mod.Color
+        assert foo.to_tuple() == (1, 2.5, True, mod.Color.green, 'foo', 'bar',
+                                  None, 3)
+        #
+        foo = mod.Foo(x=1, y=2.5, flag=False, color=mod.Color.red,
+                      name=None, data=None)
+        assert foo.to_tuple() == (1, 2.5, False, mod.Color.red, None, None,
+                                  None, 42)
+
+    def test_nested(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Polygon {
+            name @0 :Text;
+            center @1 :Point;
+            points @2 :List(Point);
+            tags @3 :List(Text);
+            matrix @4 :List(List(Int64));
+        }
+        """
+        mod = self.compile(schema)
+        poly = mod.Polygon(name='square',
+                           center=mod.Point(1, 1),
+                           points=[mod.Point(0, 0), mod.Point(2, 2)],
+                           tags=['a', 'b'],
+                           matrix=[[1, 2], [3]])
+        assert poly.to_dict() == {
+            'name': 'square',
+            'center': {'x': 1, 'y': 1},
+            'points': [{'x': 0, 'y': 0}, {'x': 2, 'y': 2}],
+            'tags': ['a', 'b'],
+            'matrix': [[1, 2], [3]]}
+        assert poly.to_tuple() == ('square', (1, 1), [(0, 0), (2, 2)],
+                                   ['a', 'b'], [[1, 2], [3]])
+        #
+        poly = mod.Polygon(name=None, center=None, points=None, tags=None,
+                           matrix=None)
+        assert poly.to_tuple() == (None, None, None, None, None)
+
+    def test_union(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square @2 :Text;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        s = mod.Shape(area=10, square='big')
+        assert s.to_dict() == {'area': 10, 'square': 'big'}
+        assert s.to_tuple() == (10, None, 'big')
+        s = mod.Shape(area=20, circle=0)
+        assert s.to_dict() == {'area': 20, 'circle': 0}
+        assert s.to_tuple() == (20, 0, None)
+
+    def test_group(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Rectangle {
+            a :group {
+                x @0 :Int64;
+                y @1 :Int64;
+            }
+            b :group $Py.nullable {
+                isNull @2 :Int8;
+                value  @3 :Int64;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        r = mod.Rectangle(a=(1, 2), b=3)
+        assert r.to_dict() == {'a': {'x': 1, 'y': 2}, 'b': 3}
+        assert r.to_tuple() == ((1, 2), 3)
+        r = mod.Rectangle(a=(1, 2), b=None)
+        assert r.to_dict() == {'a': {'x': 1, 'y': 2}, 'b': None}
+        assert r.to_tuple() == ((1, 2), None)
@@ -49,3 +49,48 @@ def test_hash_str_exception():
     p = ptr.new_struct(0, 1, 1) # this is the wrong type of pointer
     b = Segment(buf)
     py.test.raises(AssertionError, "b.hash_str(p, 0, 0, 0)")
+
+def test_bytearray():
+    buf = bytearray('garbage0'
+                    'hello capnproto\0') # string
+    p = ptr.new_list(0, ptr.LIST_SIZE_8, 16)
+    b = Segment(buf)
+    assert b.writable
+    assert not Segment(str(buf)).writable
+    s = b.read_str(p, 0, "", additional_size=-1)
+    assert type(s) is str
+    assert s == "hello capnproto"
+    assert b.hash_str(p, 0, 0, -1) == hash("hello capnproto")
+    #
+    b.write_primitive(8, ord('q'), 0x4141414141414141)
+    assert b.read_str(p, 0, "", additional_size=-1) == "AAAAAAAApnproto"
+    assert buf[8:16] == "AAAAAAAA"
+    py.test.raises(IndexError, "b.write_primitive(20, ord('q'), 42)")
+    #
+    b = Segment(str(buf))
+    py.test.raises(TypeError, "b.write_primitive(8, ord('q'), 42)")
+
+def test_WritableSegment():
+    from capnpy.segment.segment import WritableSegment
+    seg = WritableSegment(bytearray(16))
+    assert seg.allocate(8) == 0
+    a = seg.alloc_struct(0, data_size=1, ptrs_size=1)
+    assert a == 8
+    seg.write_primitive(a, ord('q'), 42)
+    b = seg.alloc_str(a+8, 'hello', -1)
+    assert b == 24
+    assert seg.end == 32
+    assert len(seg.buf) >= 32
+    assert seg.read_ptr(a) == 42
+    assert seg.read_str(seg.read_ptr(a+8), a+8, None, -1) == 'hello'
+    assert seg.as_string() == (
+        '\x00\x00\x00\x00\x01\x00\x01\x00'   # ptr to struct
+        '\x2a\x00\x00\x00\x00\x00\x00\x00'   # 42
+        '\x01\x00\x00\x00\x32\x00\x00\x00'   # ptr to text
+        'hello\x00\x00\x00')
+    #
+    # the buffer grows as needed, and the new space is zeroed
+    c = seg.allocate(1000)
+    assert c == 32
+    assert seg.end == 1032
+    assert seg.read_bytes(c, c+1000) == '\x00' * 1000
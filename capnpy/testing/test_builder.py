@@ -123,6 +123,50 @@ def test_alloc_list_float64():
                    '\xd9\xce\xf7\x53\xe3\xa5\x0b\x40'   # 3.456
                    '\xf8\x53\xe3\xa5\x9b\x44\x12\x40')  # 4.567
 
+def test_alloc_list_from_array():
+    import array
+    expected = ('\x01\x00\x00\x00\x25\x00\x00\x00'   # ptrlist
+                '\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+                '\x02\x00\x00\x00\x00\x00\x00\x00'   # 2
+                '\x03\x00\x00\x00\x00\x00\x00\x00'   # 3
+                '\x04\x00\x00\x00\x00\x00\x00\x00')  # 4
+    for lst in (array.array('l', [1, 2, 3, 4]), # copied directly
+                array.array('i', [1, 2, 3, 4]), # wrong size, packed one by one
+                (1, 2, 3, 4)):
+        builder = Builder(0, 1)
+        builder.alloc_list(0, PrimitiveItemType(Types.int64), lst)
+        assert builder.build() == expected
+    #
+    builder = Builder(0, 1)
+    builder.alloc_list(0, PrimitiveItemType(Types.float64),
+                       array.array('d', [1.234, 2.345]))
+    buf = builder.build()
+    assert buf == ('\x01\x00\x00\x00\x15\x00\x00\x00'   # ptrlist
+                   '\x58\x39\xb4\xc8\x76\xbe\xf3\x3f'   # 1.234
+                   '\xc3\xf5\x28\x5c\x8f\xc2\x02\x40')  # 2.345
+
+def test_alloc_list_from_buffer():
+    builder = Builder(0, 1)
+    builder.alloc_list(0, PrimitiveItemType(Types.uint8),
+                       memoryview(bytearray('\x01\x02\x03\x04')))
+    buf = builder.build()
+    assert buf == ('\x01\x00\x00\x00\x22\x00\x00\x00'   # ptrlist
+                   '\x01\x02\x03\x04\x00\x00\x00\x00')  # 1,2,3,4 + padding
+
+def test_alloc_list_from_numpy():
+    np = py.test.importorskip('numpy')
+    builder = Builder(0, 1)
+    builder.alloc_list(0, PrimitiveItemType(Types.int16),
+                       np.array([1, 2, 3], dtype='<i2'))
+    buf = builder.build()
+    assert buf == ('\x01\x00\x00\x00\x1b\x00\x00\x00'   # ptrlist
+                   '\x01\x00\x02\x00\x03\x00\x00\x00')  # 1,2,3 + padding
+
+def test_alloc_list_wrong_item():
+    import struct
+    builder = Builder(0, 1)
+    py.test.raises(struct.error, "builder.alloc_list(0, PrimitiveItemType(Types.int64), [1, 'x'])")
+
 def test_alloc_list_of_structs():
     class Point(Struct):
         __static_data_size__ = 2
@@ -1,3 +1,4 @@
+import struct
 import py
 from capnpy.type import Types
 from capnpy.segment.segment import MultiSegment
@@ -79,6 +80,18 @@ def test_list_of_structs():
     assert read_point(3) == (40, 400)
     #
     py.test.raises(TypeError, "lst == lst")
+    #
+    cursor = lst.cursor()
+    p = cursor.move_to(1)
+    assert p._read_data(0, Types.int64.ifmt) == 20
+    assert cursor.move_to(-1) is p
+    assert p._read_data(8, Types.int64.ifmt) == 400
+    assert cursor.index == 3
+    py.test.raises(IndexError, "cursor.move_to(4)")
+    xs = [item._read_data(0, Types.int64.ifmt) for item in cursor]
+    assert xs == [10, 20, 30, 40]
+    xs = [item._read_data(0, Types.int64.ifmt) for item in lst[::-2].cursor()]
+    assert xs == [40, 20]
 
 
 def test_string():
@@ -137,6 +150,7 @@ def test_list_of_strings():
     blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
     lst = blob._read_list(0, TextItemType(Types.text))
     assert list(lst) == ['A', 'BC', 'DEF', 'GHIJ']
+    py.test.raises(TypeError, "lst.cursor()")
 
 def test_list_comparisons():
     buf1 = ('\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
@@ -216,3 +230,198 @@ class TestPythonicInterface(object):
         assert mylist[3:] == [3, 4]
         assert mylist[:] == [0, 1, 2, 3, 4]
 
+
+    def test_slice_is_a_view(self, mylist):
+        lst = mylist[1:4]
+        assert isinstance(lst, List)
+        assert lst._seg is mylist._seg
+        assert len(lst) == 3
+        assert lst[0] == 1
+        assert lst[-1] == 3
+        py.test.raises(IndexError, "lst[3]")
+
+    def test_slice_step(self, mylist):
+        assert mylist[::2] == [0, 2, 4]
+        assert mylist[1::2] == [1, 3]
+        assert mylist[::-1] == [4, 3, 2, 1, 0]
+        assert mylist[3:0:-2] == [3, 1]
+        assert mylist[10:] == []
+
+    def test_slice_of_slice(self, mylist):
+        lst = mylist[1:]
+        assert lst[1:3] == [2, 3]
+        assert lst[::-2] == [4, 2]
+        assert mylist[::-1][::2] == [4, 2, 0]
+
+    def test_slice_equality(self, mylist):
+        assert mylist[:] == mylist
+        assert mylist[1:3] == mylist[::-1][3:1:-1]
+        assert mylist[1:3] != mylist[2:4]
+        #
+        # the raw bytes of a view cannot be read
+        py.test.raises(ValueError, "mylist[1:3]._get_slice()")
+
+    def test_to_list(self, mylist):
+        lst = mylist.to_list()
+        assert type(lst) is list
+        assert lst == [0, 1, 2, 3, 4]
+        assert mylist[::2].to_list() == [0, 2, 4]
+        py.test.raises(TypeError, "mylist.to_list(decode=True)")
+
+
+class TestTextToList(object):
+
+    @py.test.fixture
+    def textlist(self):
+        buf = ('\x01\x00\x00\x00\x26\x00\x00\x00'   # ptrlist
+               '\x0d\x00\x00\x00\x12\x00\x00\x00'   # ptr item 1
+               '\x0d\x00\x00\x00\x1a\x00\x00\x00'   # ptr item 2
+               '\x00\x00\x00\x00\x00\x00\x00\x00'   # NULL
+               '\x09\x00\x00\x00\x22\x00\x00\x00'   # ptr item 4
+               'A' '\x00\x00\x00\x00\x00\x00\x00'   # A
+               'B' 'C' '\x00\x00\x00\x00\x00\x00'   # BC
+               '\xc3\xa0' 'x' '\x00\x00\x00\x00\x00')   # \xe0x
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        return blob._read_list(0, TextItemType(Types.text))
+
+    def test_to_list(self, textlist):
+        assert textlist.to_list() == ['A', 'BC', None, '\xc3\xa0x']
+        assert textlist.to_list() == list(textlist)
+        assert textlist[1::2].to_list() == ['BC', '\xc3\xa0x']
+
+    def test_to_list_decode(self, textlist):
+        lst = textlist.to_list(decode=True)
+        assert lst == [u'A', u'BC', None, u'\xe0x']
+        assert type(lst[0]) is unicode
+
+    def test_to_list_data(self):
+        buf = ('\x01\x00\x00\x00\x0e\x00\x00\x00'   # ptrlist
+               '\x01\x00\x00\x00\x1a\x00\x00\x00'   # ptr item 1
+               'A' 'B' 'C' '\x00\x00\x00\x00\x00')  # ABC
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        lst = blob._read_list(0, TextItemType(Types.data))
+        assert lst.to_list() == ['ABC']
+        py.test.raises(TypeError, "lst.to_list(decode=True)")
+
+    def test_to_list_out_of_bounds(self):
+        buf = ('\x01\x00\x00\x00\x0e\x00\x00\x00'   # ptrlist
+               '\x01\x00\x00\x00\x82\x00\x00\x00')  # ptr to 16 bytes
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        lst = blob._read_list(0, TextItemType(Types.text))
+        py.test.raises(IndexError, "lst.to_list()")
+
+
+class TestSearch(object):
+
+    def make_list(self, t, items):
+        fmt = '<' + t.fmt * len(items)
+        buf = struct.pack(fmt, *items)
+        length, size_tag = PrimitiveItemType(t).get_item_length()
+        return List.from_buffer(buf, 0, size_tag, len(items), PrimitiveItemType(t))
+
+    def test_contains(self):
+        lst = self.make_list(Types.int64, [1, 5, 10, 20])
+        assert 5 in lst
+        assert 20 in lst
+        assert 6 not in lst
+        assert 'foo' not in lst
+        assert 1 << 70 not in lst
+        assert -(1 << 70) not in lst
+
+    def test_index(self):
+        lst = self.make_list(Types.int16, [3, 1, 3, -2])
+        assert lst.index(3) == 0
+        assert lst.index(-2) == 3
+        py.test.raises(ValueError, "lst.index(42)")
+        assert lst[1:].index(3) == 1
+
+    def test_bisect(self):
+        import bisect
+        items = [1, 5, 5, 10, 20]
+        lst = self.make_list(Types.uint64, items)
+        for value in (-1, 0, 1, 4, 5, 6, 20, 21, 1 << 64, 1 << 70):
+            assert lst.bisect_left(value) == bisect.bisect_left(items, value)
+            assert lst.bisect_right(value) == bisect.bisect_right(items, value)
+            assert lst.bisect(value) == bisect.bisect(items, value)
+
+    def test_assume_sorted(self):
+        items = range(0, 1000, 3)
+        lst = self.make_list(Types.uint32, items)
+        assert lst.index(300, assume_sorted=True) == 100
+        assert lst.contains(300, assume_sorted=True)
+        assert not lst.contains(301, assume_sorted=True)
+        assert not lst.contains(5000, assume_sorted=True)
+        py.test.raises(ValueError, "lst.index(301, assume_sorted=True)")
+
+    def test_float(self):
+        lst = self.make_list(Types.float64, [1.5, 2.5, 3.5])
+        assert 2.5 in lst
+        assert 2 not in lst
+        assert lst.bisect_left(3) == 2
+        lst = self.make_list(Types.float32, [1.5, 2.5, 3.5])
+        assert lst.index(3.5) == 2
+
+    def test_float_nan(self):
+        import bisect
+        nan = float('nan')
+        items = [1.0, nan, 3.0]
+        lst = self.make_list(Types.float64, items)
+        assert 2.0 not in lst
+        assert lst.index(3.0) == 2
+        assert nan not in lst
+        lst = self.make_list(Types.float32, [1.0, 2.0, 3.0])
+        assert nan not in lst
+        py.test.raises(ValueError, "lst.index(nan)")
+        # a NaN is neither smaller nor greater than anything: bisect behaves
+        # like python does
+        items = [1.0, 2.0, 3.0]
+        lst = self.make_list(Types.float64, items)
+        for value in (nan, 2.0):
+            assert lst.bisect_left(value) == bisect.bisect_left(items, value)
+            assert lst.bisect_right(value) == bisect.bisect_right(items, value)
+        items = [1.0, nan, 3.0]
+        lst = self.make_list(Types.float64, items)
+        for value in (nan, 1.0, 2.0, 3.0):
+            assert lst.bisect_left(value) == bisect.bisect_left(items, value)
+            assert lst.bisect_right(value) == bisect.bisect_right(items, value)
+
+    def test_float_big_int(self):
+        import bisect
+        # integers which don't fit in a double, or which it cannot represent
+        # exactly, are compared exactly like python does
+        items = [float('-inf'), -1.5, 2.0**53, 1e300, float('inf')]
+        lst = self.make_list(Types.float64, items)
+        for value in (1 << 2000, -(1 << 2000), 2**53, 2**53 + 1, 3):
+            assert (value in lst) == (value in items)
+            assert lst.bisect_left(value) == bisect.bisect_left(items, value)
+            assert lst.bisect_right(value) == bisect.bisect_right(items, value)
+        assert lst.index(2**53) == 2
+        py.test.raises(ValueError, "lst.index(2**53 + 1)")
+        py.test.raises(ValueError, "lst.index(1 << 2000)")
+
+    def test_view(self):
+        lst = self.make_list(Types.int8, [0, 1, 2, 3, 4, 5])
+        view = lst[::-2]
+        assert view == [5, 3, 1]
+        assert 3 in view
+        assert 2 not in view
+        assert view.index(1) == 2
+        assert lst[1::2].bisect_left(3) == 1
+
+    def test_text(self):
+        buf = ('\x01\x00\x00\x00\x26\x00\x00\x00'   # ptrlist
+               '\x0d\x00\x00\x00\x12\x00\x00\x00'   # ptr item 1
+               '\x0d\x00\x00\x00\x1a\x00\x00\x00'   # ptr item 2
+               '\x0d\x00\x00\x00\x22\x00\x00\x00'   # ptr item 3
+               '\x0d\x00\x00\x00\x2a\x00\x00\x00'   # ptr item 4
+               'A' '\x00\x00\x00\x00\x00\x00\x00'   # A
+               'B' 'C' '\x00\x00\x00\x00\x00\x00'   # BC
+               'D' 'E' 'F' '\x00\x00\x00\x00\x00'   # DEF
+               'G' 'H' 'I' 'J' '\x00\x00\x00\x00')  # GHIJ
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        lst = blob._read_list(0, TextItemType(Types.text))
+        assert 'DEF' in lst
+        assert 'XXX' not in lst
+        assert lst.index('BC') == 1
+        assert lst.index('GHIJ', assume_sorted=True) == 3
+        assert lst.bisect_left('C') == 2
@@ -119,6 +119,46 @@ def test_far_pointer():
     assert p._read_data(0, Types.int64.ifmt) == 1
     assert p._read_data(8, Types.int64.ifmt) == 2
 
+def test_validate():
+    buf = ('\x01\x00\x00\x00\x2a\x00\x00\x00'   # ptr to list<8>
+           'hello\x00\x00\x00')
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    assert not blob._seg.unchecked
+    blob.validate()
+    assert blob._seg.unchecked
+    #
+    buf = ('\x01\x00\x00\x00\x4a\x00\x00\x00'   # 9 items, too many
+           'hello\x00\x00\x00')
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    py.test.raises(IndexError, "blob.validate()")
+    assert not blob._seg.unchecked
+    #
+    # the segment is switched to unchecked mode: thus, only the root object
+    # of the message can be validated
+    buf = ('\x00\x00\x00\x00\x00\x00\x01\x00'   # root ptr to struct (0, 1)
+           '\x01\x00\x00\x00\x2a\x00\x00\x00'   # ptr to list<8>
+           'hello\x00\x00\x00')
+    other = Struct.from_buffer(buf, 16, data_size=1, ptrs_size=0)
+    py.test.raises(ValueError, "other.validate()")
+    assert not other._seg.unchecked
+    root = Struct.from_buffer(buf, 8, data_size=0, ptrs_size=1)
+    root.validate()
+    assert root._seg.unchecked
+
+def test_validate_again():
+    buf = bytearray('\x01\x00\x00\x00\x0f\x00\x00\x00'   # ptr to list composite, 1 word
+                    '\x04\x00\x00\x00\x01\x00\x00\x00'   # list tag, 1 item of 1 word
+                    '\x2a\x00\x00\x00\x00\x00\x00\x00')  # 42
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    blob.validate()
+    assert blob._seg.unchecked
+    #
+    # the list tag is now out of bounds: validating again checks it, even if
+    # the segment is in unchecked mode
+    buf[0] = '\x11'   # offset == 4
+    py.test.raises(IndexError, "blob.validate()")
+    assert not blob._seg.unchecked
+
 def test_union():
     ## struct Shape {
     ##   area @0 :Int64;
@@ -172,6 +212,25 @@ def test_split_ptrs():
     assert extra == ('\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
                      '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
 
+def test_split_out_of_order():
+    # the children are not in pre-order, as it happens with MessageBuilder
+    buf = ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+           '\x0c\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+           '\x00\x00\x00\x00\x02\x00\x00\x00'    # ptr to b
+           '\x03\x00\x00\x00\x00\x00\x00\x00'    # b.x == 3
+           '\x04\x00\x00\x00\x00\x00\x00\x00'    # b.y == 4
+           '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+    rect = Struct.from_buffer(buf, 0, data_size=1, ptrs_size=2)
+    body, extra = rect._split(2)
+    assert body == ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+                    '\x0c\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+                    '\x10\x00\x00\x00\x02\x00\x00\x00')   # ptr to b
+    assert extra == ('\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+                     '\x02\x00\x00\x00\x00\x00\x00\x00'    # a.y == 2
+                     '\x03\x00\x00\x00\x00\x00\x00\x00'    # b.x == 3
+                     '\x04\x00\x00\x00\x00\x00\x00\x00')   # b.y == 4
+
 
 def test_compact():
     class Rect(Struct):
@@ -194,6 +253,44 @@ def test_compact():
                             '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
                             '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
 
+def test_get_compact_buf():
+    class Rect(Struct):
+        pass
+
+    body = ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+            '\x04\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+            '\x00\x00\x00\x00\x00\x00\x00\x00'    # ptr to b, NULL
+            '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+            '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+    #
+    # the object spans the whole buffer: no copy
+    rect = Rect.from_buffer(body, 0, data_size=1, ptrs_size=2)
+    assert rect._get_compact_buf() is body
+    assert rect.compact()._seg.buf is body
+    #
+    # compact, but with garbage around
+    buf = 'garbage0' + body + 'garbage1'
+    rect = Rect.from_buffer(buf, 8, data_size=1, ptrs_size=2)
+    assert rect._get_compact_buf() == body
+    #
+    # not compact
+    buf = ('garbage0'
+           '\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+           '\x0c\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+           '\x00\x00\x00\x00\x00\x00\x00\x00'    # ptr to b, NULL
+           'garbage1'
+           'garbage2'
+           '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+    rect = Rect.from_buffer(buf, 8, data_size=1, ptrs_size=2)
+    assert rect._get_compact_buf() == body
+    #
+    # the buffer of a mutable message is never shared
+    rect = Rect.from_buffer(bytearray(body), 0, data_size=1, ptrs_size=2)
+    buf = rect._get_compact_buf()
+    assert type(buf) is bytes
+    assert buf == body
+
 def test_comparisons_fail():
     s = Struct.from_buffer('', 0, data_size=0, ptrs_size=0)
     py.test.raises(TypeError, "hash(s)")
@@ -1,7 +1,10 @@
 import py
+import sys
 import textwrap
 import inspect
-from capnpy.util import extend, extend_module_maybe
+import subprocess
+import capnpy
+from capnpy.util import extend, extend_module_maybe, find_extension_module
 
 def test_extend():
     class Foo(object):
@@ -82,6 +85,16 @@ class TestExtendModuleMaybe(object):
         extend_module_maybe(myglobals, modname='mypackage.foo')
         assert myglobals['answer'] == 42
 
+    def test_modname_cache(self, monkeypatch):
+        monkeypatch.syspath_prepend(self.tmpdir)
+        self.w("foo_extended.py", """
+            answer = 42
+        """)
+        extmod = find_extension_module(modname='foo')
+        assert extmod == str(self.tmpdir.join('foo_extended.py'))
+        self.tmpdir.join('foo_extended.py').remove()
+        assert find_extension_module(modname='foo') == extmod
+
     def test_getsource(self):
         self.w("foo_extended.py", """
             def foo(): return 42
@@ -93,3 +106,10 @@ class TestExtendModuleMaybe(object):
         assert foo() == 42
         src = inspect.getsource(foo)
         assert src.strip() == 'def foo(): return 42'
+
+
+def test_import_does_not_load_the_compiler():
+    root = py.path.local(capnpy.__file__).dirpath('..')
+    src = 'import sys, capnpy; print "capnpy.compiler.compiler" in sys.modules'
+    out = subprocess.check_output([sys.executable, '-c', src], cwd=str(root))
+    assert out.strip() == 'False'
@@ -1,7 +1,8 @@
+import py
 from capnpy import ptr
 from capnpy.printer import print_buffer
-from capnpy.visit import end_of, is_compact
-from capnpy.segment.segment import Segment
+from capnpy.visit import end_of, is_compact, validate
+from capnpy.segment.segment import Segment, MultiSegment
 
 class TestEndOf(object):
 
@@ -415,3 +416,67 @@ class TestIsCompact(object):
                                      size_tag=ptr.LIST_SIZE_PTR,
                                      item_count=3)
         assert is_compact
+
+
+class TestValidate(object):
+
+    def validate(self, buf, offset, data_size, ptrs_size):
+        if not isinstance(buf, MultiSegment):
+            buf = Segment(buf)
+        p = ptr.new_struct(0, data_size, ptrs_size)
+        return validate(buf, p, offset-8)
+
+    def test_struct(self):
+        buf = ('garbage0'
+               '\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+               '\x0c\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+               '\x00\x00\x00\x00\x00\x00\x00\x00'    # ptr to b, NULL
+               'garbage1'
+               'garbage2'
+               '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+               '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+        self.validate(buf, 8, data_size=1, ptrs_size=2)
+        py.test.raises(IndexError, "self.validate(buf, 8, data_size=1, ptrs_size=20)")
+        py.test.raises(IndexError, "self.validate(buf[:-8], 8, data_size=1, ptrs_size=2)")
+
+    def test_list(self):
+        buf = ('\x01\x00\x00\x00\x2a\x00\x00\x00'   # ptr to list<8>
+               'hello\x00\x00\x00')
+        self.validate(buf, 0, data_size=0, ptrs_size=1)
+        buf = ('\x01\x00\x00\x00\x4a\x00\x00\x00'   # 9 items, too many
+               'hello\x00\x00\x00')
+        py.test.raises(IndexError, "self.validate(buf, 0, data_size=0, ptrs_size=1)")
+
+    def test_list_composite(self):
+        buf = ('\x01\x00\x00\x00\x17\x00\x00\x00'   # ptr to list composite, 2 words
+               '\x08\x00\x00\x00\x00\x00\x01\x00'   # list tag, 2 items of 1 ptr
+               '\x05\x00\x00\x00\x12\x00\x00\x00'   # ptr to "a"
+               '\x05\x00\x00\x00\x12\x00\x00\x00'   # ptr to "b"
+               'a\x00\x00\x00\x00\x00\x00\x00'
+               'b\x00\x00\x00\x00\x00\x00\x00')
+        self.validate(buf, 0, data_size=0, ptrs_size=1)
+        # "b" is out of bounds
+        py.test.raises(IndexError, "self.validate(buf[:-8], 0, data_size=0, ptrs_size=1)")
+        # the items overrun the word count declared by the pointer
+        buf2 = '\x01\x00\x00\x00\x0f\x00\x00\x00' + buf[8:]   # 1 word
+        exc = py.test.raises(IndexError,
+                             "self.validate(buf2, 0, data_size=0, ptrs_size=1)")
+        assert 'overrun' in str(exc.value)
+
+    def test_cycle(self):
+        buf = ('\xfc\xff\xff\xff\x00\x00\x01\x00')   # ptr to itself
+        exc = py.test.raises(ValueError,
+                             "self.validate(buf, 0, data_size=0, ptrs_size=1)")
+        assert str(exc.value) == 'Traversal limit exceeded'
+
+    def test_far_pointer(self):
+        seg0 = ('\x00\x00\x00\x00\x00\x00\x00\x00'    # some garbage
+                '\x0a\x00\x00\x00\x01\x00\x00\x00')   # far pointer: segment=1, offset=1
+        seg1 = ('\x00\x00\x00\x00\x00\x00\x00\x00'    # random data
+                '\x00\x00\x00\x00\x02\x00\x00\x00'    # ptr to {x, y}
+                '\x01\x00\x00\x00\x00\x00\x00\x00'    # x == 1
+                '\x02\x00\x00\x00\x00\x00\x00\x00')   # y == 2
+        buf = MultiSegment(seg0+seg1, segment_offsets=(0, 16))
+        self.validate(buf, 8, data_size=0, ptrs_size=1)
+        buf = MultiSegment(seg0+seg1[:-8], segment_offsets=(0, 16))
+        py.test.raises(IndexError, "self.validate(buf, 8, data_size=0, ptrs_size=1)")
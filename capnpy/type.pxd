@@ -2,3 +2,4 @@ cdef class BuiltinType:
     cdef readonly bytes name
     cdef readonly bytes fmt
     cdef readonly char ifmt
+    cdef readonly object reader
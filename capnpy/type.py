@@ -1,13 +1,16 @@
 import struct
 
 class BuiltinType(object):
-    def __init__(self, name, fmt=None):
+    def __init__(self, name, fmt=None, reader=None):
         self.name = name
         self.fmt = fmt
         if fmt is not None:
             self.ifmt = ord(fmt)
+            # the name of the typed method of BaseSegment which reads it
+            self.reader = reader or 'read_%s' % name
         else:
             self.ifmt = -1
+            self.reader = None
 
     def __repr__(self):
         return '<capnp type %s>' % self.name
@@ -24,8 +27,8 @@ class Types(object):
     __all__ = []
 
     @classmethod
-    def _make(cls, name, fmt=None):
-        t = BuiltinType(name, fmt)
+    def _make(cls, name, fmt=None, reader=None):
+        t = BuiltinType(name, fmt, reader)
         setattr(cls, name, t)
         cls.__all__.append(t)
 
@@ -39,9 +42,9 @@ Types._make('uint16',  'H')
 Types._make('int32',   'i')
 Types._make('uint32',  'I')
 Types._make('int64',   'q')
-Types._make('uint64',  'Q')
-Types._make('float32', 'f')
-Types._make('float64', 'd')
+Types._make('uint64',  'Q', 'read_uint64_magic')
+Types._make('float32', 'f', 'read_float')
+Types._make('float64', 'd', 'read_double')
 Types._make('text')
 Types._make('data')
 
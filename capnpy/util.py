@@ -1,6 +1,5 @@
+import os
 import sys
-import py
-import imp
 try:
     from capnpy._util import setattr_builtin
 except ImportError:
@@ -34,31 +33,46 @@ def find_module(path, modname, extension='.py'):
     Scan ``path`` to search for the file corresponding for the given ``modname``.
     For example, if ``modname`` is foo.bar.baz, it searches for foo/bar/baz.py.
     """
-    relpath = modname.replace('.', '/') + extension
+    relpath = os.path.join(*modname.split('.')) + extension
     for dirpath in path:
-        dirpath = py.path.local(dirpath)
-        f = dirpath.join(relpath)
-        if f.check(file=True):
+        f = os.path.join(os.path.abspath(str(dirpath)), relpath)
+        if os.path.isfile(f):
             return f
     return None
 
-def extend_module_maybe(globals, filename=None, modname=None):
+# modname, sys.path --> extension module. Every generated module looks for
+# its extension when it is imported: the cache avoids rescanning sys.path
+_extension_modules = {}
+
+def find_extension_module(filename=None, modname=None):
+    """
+    Return the path of the file containing the extension module of the given
+    schema, or None if there is none
+    """
     if filename is not None:
         # /path/to/foo.py --> /path/to/foo_extended.py
-        filename = py.path.local(filename)
-        extname = filename.purebasename + '_extended'
-        extmod = filename.new(purebasename=extname, ext='.py')
-        if extmod.check(file=False):
-            return
+        base, ext = os.path.splitext(str(filename))
+        extmod = base + '_extended.py'
+        if not os.path.isfile(extmod):
+            return None
+        return extmod
     elif modname is not None:
-        extname = modname + '_extended'
-        extmod = find_module(sys.path, extname)
-        if extmod is None:
-            return
+        key = modname, tuple(sys.path)
+        try:
+            return _extension_modules[key]
+        except KeyError:
+            extmod = find_module(sys.path, modname + '_extended')
+            _extension_modules[key] = extmod
+            return extmod
     else:
         raise ValueError('You must pass either filename or modname')
-    #
-    src = extmod.read()
+
+def extend_module_maybe(globals, filename=None, modname=None):
+    extmod = find_extension_module(filename, modname)
+    if extmod is None:
+        return
+    with open(extmod) as f:
+        src = f.read()
     code = compile(src, str(extmod), 'exec')
     exec code in globals
 
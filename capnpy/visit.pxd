@@ -4,6 +4,7 @@ from capnpy.segment.segment cimport Segment
 
 cpdef long end_of(Segment buf, long p, long offset) except -2
 cpdef long is_compact(Segment buf, long p, long offset) except -2
+cpdef long validate(Segment buf, long p, long offset) except -2
 
 cdef class Visitor(object):
 
@@ -57,6 +58,19 @@ cdef class IsCompact(Visitor):
 
 
 
+cdef class Validate(Visitor):
+    cdef long nesting_limit
+    cdef long traversal_limit
+
+    cdef check(self, Segment buf, long offset, long length)
+
+    @cython.locals(i=long, p2_offset=long, p2=long)
+    cdef long visit_ptrs(self, Segment buf, long offset, long ptrs_size) except -2
+
+    @cython.locals(item_size=long, words=long, item_offset=long, i=long)
+    cdef long visit_list_composite(self, Segment buf, long p, long offset,
+                                   long count, long data_size, long ptrs_size) except -2
+
 
 cpdef EndOf _end_of
 cpdef IsCompact _is_compact
@@ -158,11 +158,93 @@ class IsCompact(Visitor):
         return start_of_children == -1 or start_of_children == end_of_items
 
 
+class Validate(Visitor):
+    """
+    Check that the object pointed by p and all the objects reachable from it
+    lie inside the bounds of the buffer, following far pointers. Raise
+    IndexError if it is not the case.
+
+    To protect against malicious messages, the nesting depth is limited to
+    nesting_limit and the total number of bytes visited can not exceed the
+    length of the buffer: a well-formed message never points twice to the same
+    object, so this is enough to reject pointer cycles and amplification
+    attacks.
+    """
+
+    def __init__(self, buf, nesting_limit=64):
+        self.nesting_limit = nesting_limit
+        self.traversal_limit = len(buf.buf)
+
+    def check(self, buf, offset, length):
+        if offset < 0 or offset + length > len(buf.buf):
+            raise IndexError('Offset out of bounds: %d' % offset)
+        # charge at least one word, to be sure to make progress also in case
+        # of zero-sized objects
+        self.traversal_limit -= max(length, 8)
+        if self.traversal_limit < 0:
+            raise ValueError('Traversal limit exceeded')
+
+    def visit_ptrs(self, buf, offset, ptrs_size):
+        if ptrs_size == 0:
+            return 0
+        self.nesting_limit -= 1
+        if self.nesting_limit < 0:
+            raise ValueError('Nesting limit exceeded')
+        i = 0
+        while i < ptrs_size:
+            p2_offset = offset + i*8
+            p2 = buf.read_ptr(p2_offset)
+            if ptr.kind(p2) == ptr.FAR:
+                p2_offset, p2 = buf.read_far_ptr(p2_offset)
+            if p2:
+                self.visit(buf, p2, p2_offset)
+            i += 1
+        self.nesting_limit += 1
+        return 0
+
+    def visit_struct(self, buf, p, offset, data_size, ptrs_size):
+        self.check(buf, offset, (data_size+ptrs_size)*8)
+        return self.visit_ptrs(buf, offset + data_size*8, ptrs_size)
+
+    def visit_list_composite(self, buf, p, offset, count, data_size, ptrs_size):
+        # the pointer declares the total number of words of the items: check
+        # it against the tag too, else the items could overrun the list
+        item_size = (data_size+ptrs_size)*8
+        words = ptr.list_item_count(p)
+        self.check(buf, offset, 8 + words*8)
+        if item_size*count > words*8:
+            raise IndexError('List items overrun the word count: %d' % offset)
+        offset += 8
+        if ptrs_size:
+            i = 0
+            while i < count:
+                item_offset = offset + (item_size)*i + (data_size*8)
+                self.visit_ptrs(buf, item_offset, ptrs_size)
+                i += 1
+        return 0
+
+    def visit_list_ptr(self, buf, p, offset, count):
+        self.check(buf, offset, 8*count)
+        return self.visit_ptrs(buf, offset, count)
+
+    def visit_list_primitive(self, buf, p, offset, item_size, count):
+        item_size = ptr.list_item_length(item_size)
+        self.check(buf, offset, item_size*count)
+        return 0
+
+    def visit_list_bit(self, buf, p, offset, count):
+        self.check(buf, offset, (count+7)/8)
+        return 0
+
+
 def end_of(buf, p, offset):
     return _end_of.visit(buf, p, offset)
 
 def is_compact(buf, p, offset):
     return _is_compact.visit(buf, p, offset)
 
+def validate(buf, p, offset):
+    return Validate(buf).visit(buf, p, offset)
+
 _end_of = EndOf()
 _is_compact = IsCompact()